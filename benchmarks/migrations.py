@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures scanning, planning, squash, status and migrate on synthetic packages with thousands
+of migrations. Packages are generated in temporary directory. By default migrations are applied
+to in-memory SQLite database, so no database server is needed.
+Usage:
+    python benchmarks/migrations.py
+    python benchmarks/migrations.py --migrations 1000 9999 --output results.jsonl
+    python benchmarks/migrations.py --baseline results.jsonl
+    python benchmarks/migrations.py --config rsm.yaml
+Every result is written as JSON line with commit it was measured on. When baseline file from
+previous run is given, results also contain baseline median and ratio to it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from shutil import rmtree
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+from raw_sql_migrate import Config
+from raw_sql_migrate.api import Api
+from raw_sql_migrate.engines import database_api
+from raw_sql_migrate.exceptions import NoMigrationsFoundToApply
+from raw_sql_migrate.helpers import FileSystemHelper, MigrationHelper, MigrationCatalog
+
+MIGRATION_BODY = "    database_api.execute('SELECT %d')"
+
+
+def get_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIRECTORY, stderr=devnull
+            ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_package(directory, package, migrations_count):
+    migrations_directory = os.path.join(directory, package, 'migrations')
+    os.makedirs(migrations_directory)
+    for package_directory in (os.path.join(directory, package), migrations_directory):
+        with open(os.path.join(package_directory, '__init__.py'), 'w') as file_descriptor:
+            file_descriptor.write(MigrationHelper.INIT_FILE_TEMPLATE)
+    for number in range(1, migrations_count + 1):
+        file_name = MigrationHelper.generate_migration_name('migration', number)
+        with open(os.path.join(migrations_directory, file_name), 'w') as file_descriptor:
+            file_descriptor.write(
+                MigrationHelper.MIGRATION_TEMPLATE % (MIGRATION_BODY % number, MIGRATION_BODY % -number)
+            )
+
+
+def measure(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started_at = time.time()
+        function()
+        timings.append(time.time() - started_at)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def migrate_up_to_date(api, package):
+    try:
+        api.migrate(package)
+    except NoMigrationsFoundToApply:
+        pass
+
+
+def run(api, directory, migrations_count, repeat):
+    """
+    Returns list of (operation, median seconds) tuples for package of given size.
+    """
+    package = 'rsm_benchmark_%d' % migrations_count
+    squash_package = 'rsm_benchmark_squash_%d' % migrations_count
+    create_package(directory, package, migrations_count)
+    create_package(directory, squash_package, migrations_count)
+    numbers = list(range(1, migrations_count + 1))
+    forward = MigrationHelper.MigrationDirection.FORWARD
+
+    results = [
+        ('get_migrations_list (scan)', measure(
+            lambda: FileSystemHelper.get_migrations_list(package), repeat,
+            setup=lambda: MigrationCatalog.get(package).invalidate(),
+        )),
+        ('get_migrations_list (cached)', measure(lambda: FileSystemHelper.get_migrations_list(package), repeat)),
+        ('get_migrations_numbers_to_apply', measure(
+            lambda: MigrationHelper.get_migrations_numbers_to_apply(numbers, migrations_count // 2, None, forward),
+            repeat,
+        )),
+        ('migrate', measure(lambda: api.migrate(package), 1)),
+        ('migrate (up to date)', measure(lambda: migrate_up_to_date(api, package), repeat)),
+        ('status', measure(lambda: api.status(package), repeat)),
+        ('migrate backward', measure(lambda: api.migrate(package, 0), 1)),
+        ('squash', measure(lambda: api.squash(squash_package, 1), 1)),
+    ]
+    return results
+
+
+def load_baseline(file_path):
+    baseline = {}
+    with open(file_path) as file_descriptor:
+        for line in file_descriptor:
+            result = json.loads(line)
+            baseline[(result['operation'], result['migrations'])] = result['median']
+    return baseline
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='rsm migrations benchmark')
+    parser.add_argument(
+        '--migrations', type=int, nargs='+', default=[1000, 5000, 9999],
+        help='Sizes of generated packages, at most 9999 because of four digit migration numbers'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of cheap operations')
+    parser.add_argument('-c', '--config', help='Config of database to benchmark against, in-memory SQLite by default')
+    parser.add_argument('-o', '--output', help='Path to file to write results to, stdout by default')
+    parser.add_argument('--baseline', help='Results of previous run to compare with')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = Config()
+    if args.config:
+        config.init_from_file(args.config)
+    else:
+        config = Config({'engine': 'raw_sql_migrate.engines.sqlite3', 'name': ':memory:'})
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    commit = get_commit()
+
+    directory = tempfile.mkdtemp(prefix='rsm_benchmark_')
+    sys.path.insert(0, directory)
+    # migrate prints every applied migration, so stdout descriptor is pointed to devnull
+    # while benchmark runs and results are written to its duplicate
+    sys.stdout.flush()
+    stdout_descriptor = os.dup(1)
+    devnull_descriptor = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull_descriptor, 1)
+    output = open(args.output, 'w') if args.output else os.fdopen(os.dup(stdout_descriptor), 'w')
+    try:
+        api = Api(config)
+        for migrations_count in args.migrations:
+            for operation, median in run(api, directory, migrations_count, args.repeat):
+                result = {
+                    'benchmark': 'migrations', 'operation': operation, 'migrations': migrations_count,
+                    'median': round(median, 6), 'engine': config.engine, 'commit': commit,
+                    'python': platform.python_version(),
+                }
+                baseline_median = baseline.get((operation, migrations_count))
+                if baseline_median:
+                    result['baseline'] = baseline_median
+                    result['ratio'] = round(median / baseline_median, 3)
+                output.write(json.dumps(result) + '\n')
+        database_api.close()
+    finally:
+        output.close()
+        sys.stdout.flush()
+        os.dup2(stdout_descriptor, 1)
+        os.close(stdout_descriptor)
+        os.close(devnull_descriptor)
+        rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
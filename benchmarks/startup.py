@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures cold start time of rsm commands and checks it against budget.
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --config rsm.yaml --status-budget 0.5
+Exits with code 1 if median time of some command is over its budget.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RSM_SCRIPT = os.path.join(ROOT_DIRECTORY, 'bin', 'rsm')
+
+
+def measure(command, repeat):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, (ROOT_DIRECTORY, environment.get('PYTHONPATH'))))
+    timings = []
+    for _ in range(repeat):
+        started_at = time.time()
+        with open(os.devnull, 'w') as devnull:
+            return_code = subprocess.call(command, stdout=devnull, stderr=devnull, env=environment)
+        timings.append(time.time() - started_at)
+        if return_code:
+            raise RuntimeError('Command %s failed with code %s' % (' '.join(command), return_code))
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='rsm startup time benchmark')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of runs of every command')
+    parser.add_argument('--help-budget', type=float, default=0.25, help='Budget of "rsm status --help" in seconds')
+    parser.add_argument('--status-budget', type=float, default=0.5, help='Budget of "rsm status" in seconds')
+    parser.add_argument('-c', '--config', help='Config for "rsm status" run, it is skipped if not given')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    commands = [('status --help', [sys.executable, RSM_SCRIPT, 'status', '--help'], args.help_budget)]
+    if args.config:
+        commands.append(('status', [sys.executable, RSM_SCRIPT, 'status', '-c', args.config], args.status_budget))
+
+    over_budget = False
+    for name, command, budget in commands:
+        median = measure(command, args.repeat)
+        sys.stdout.write(json.dumps({
+            'benchmark': 'startup', 'command': name, 'median': round(median, 4), 'budget': budget,
+        }) + '\n')
+        over_budget = over_budget or median > budget
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,7 @@ import os
 import sys
 
 from importlib import import_module
+from threading import local
 
 
 class ConfigNotFoundException(Exception):
@@ -18,12 +19,36 @@ class Config(object):
     name = None
     user = None
     password = None
+    pool_min_size = 1
+    pool_max_size = None
+    pool_timeout = None
+    statement_cache_size = None
+    prepare_statements = False
     additional_connection_params = {}
     packages = []
     history_table_name = 'migration_history'
-    general_connection_params = set(('engine', 'host', 'port', 'name', 'user', 'password', ))
+    slow_statement_threshold = None
+    statement_log = None
+    prometheus_textfile = None
+    databases = {}
+    default_database_name = None
+    continue_on_failure = False
+    general_connection_params = set((
+        'engine', 'host', 'port', 'name', 'user', 'password', 'pool_min_size', 'pool_max_size', 'pool_timeout',
+        'statement_cache_size', 'prepare_statements',
+    ))
+
+    def __init__(self, database=None, history_table_name=None, packages=None, instrumentation=None, databases=None,
+                 continue_on_failure=None):
+        if databases and type(databases) == dict:
+            self.databases = databases
+            if not database:
+                self.default_database_name = sorted(databases)[0]
+                database = databases[self.default_database_name]
+
+        if continue_on_failure is not None:
+            self.continue_on_failure = bool(continue_on_failure)
 
-    def __init__(self, database=None, history_table_name=None, packages=None):
         if database and type(database) == dict:
             self.engine = database.get('engine')
             self.host = database.get('host')
@@ -31,6 +56,11 @@ class Config(object):
             self.name = database.get('name')
             self.user = database.get('user')
             self.password = database.get('password')
+            self.pool_min_size = database.get('pool_min_size', self.pool_min_size)
+            self.pool_max_size = database.get('pool_max_size', self.pool_max_size)
+            self.pool_timeout = database.get('pool_timeout', self.pool_timeout)
+            self.statement_cache_size = database.get('statement_cache_size', self.statement_cache_size)
+            self.prepare_statements = bool(database.get('prepare_statements', self.prepare_statements))
             additional_connection_params = dict(
                 [(key, database[key]) for key in (set(database.keys()) - set(self.general_connection_params))]
             )
@@ -43,14 +73,25 @@ class Config(object):
         if history_table_name:
             self.history_table_name = history_table_name
 
+        if instrumentation and type(instrumentation) == dict:
+            self.slow_statement_threshold = instrumentation.get('slow_statement_threshold')
+            self.statement_log = instrumentation.get('statement_log')
+            self.prometheus_textfile = instrumentation.get('prometheus_textfile')
+
         self.config_type_handlers = {
             '.py': self._import_from_python_file,
             '.yaml': self._import_from_yaml_file,
         }
 
     def _import_from_python_file(self, path_to_config=None):
-        path_to_config = path_to_config or 'rsm'
-        sys.path.append(os.getcwd())
+        if not path_to_config:
+            if not os.path.exists('rsm.py'):
+                return None
+            path_to_config = 'rsm'
+
+        current_directory = os.getcwd()
+        if current_directory not in sys.path:
+            sys.path.append(current_directory)
 
         try:
             module = import_module(path_to_config)
@@ -103,17 +144,49 @@ class Config(object):
         database_settings = config_data.get('database')
         history_table_name = config_data.get('history_table_name')
         packages = config_data.get('packages')
-        self.__init__(database_settings, history_table_name, packages)
+        instrumentation = config_data.get('instrumentation')
+        databases = config_data.get('databases')
+        continue_on_failure = config_data.get('continue_on_failure')
+        self.__init__(database_settings, history_table_name, packages, instrumentation, databases, continue_on_failure)
+
+    def get_database_names(self):
+        return sorted(self.databases)
+
+    def get_database_config(self, name):
+        """
+        Returns config of database from databases section with the same history table,
+        packages and instrumentation settings.
+        """
+        config = Config(self.databases[name], self.history_table_name, self.packages)
+        config.slow_statement_threshold = self.slow_statement_threshold
+        config.statement_log = self.statement_log
+        config.prometheus_textfile = self.prometheus_textfile
+        config.continue_on_failure = self.continue_on_failure
+        return config
 
 
 class ConfigStorage(object):
 
     _config = None
 
+    def __init__(self):
+        self._local = local()
+
     def set_config_instance(self, config_instance):
         self._config = config_instance
 
+    def bind(self, config_instance):
+        """
+        Binds config instance to current thread only. Pass None to
+        return to instance given to set_config_instance.
+        """
+        self._local.config = config_instance
+
+    def get_config_instance(self):
+        return getattr(self._local, 'config', None) or self._config
+
     def __getattr__(self, item):
-        return self._config and getattr(self._config, item)
+        config_instance = self.get_config_instance()
+        return config_instance and getattr(config_instance, item)
 
 rsm_config = ConfigStorage()
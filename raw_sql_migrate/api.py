@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from os import rename, path
-from sys import stdout
+from sys import maxsize, stdout
+from threading import Event, Thread
 
 from importlib import import_module
 
@@ -9,9 +9,13 @@ from raw_sql_migrate import Config, rsm_config
 from raw_sql_migrate.engines import database_api
 from raw_sql_migrate.exceptions import (
     InconsistentParamsException, NoMigrationsFoundToApply,
-    ParamRequiredException, IncorrectDbBackendException,
+    ParamRequiredException, IncorrectDbBackendException, MigrationFailedException, RawSqlMigrateException,
+    CurrentMigrationNumberGiven,
 )
-from raw_sql_migrate.helpers import FileSystemHelper, MigrationHelper, DatabaseHelper
+from raw_sql_migrate.helpers import (
+    FileSystemHelper, MigrationHelper, DatabaseHelper, HistoryIndex, MigrationCatalog,
+)
+from raw_sql_migrate.instrumentation import instrumentation
 from raw_sql_migrate.migration import Migration
 
 __all__ = (
@@ -31,24 +35,48 @@ class Api(object):
             config_instance = Config()
             config_instance.init_from_file()
         rsm_config.set_config_instance(config_instance)
+        self.config = config_instance
+        instrumentation.configure(config_instance)
 
         try:
-            database_api_module = import_module(config.engine)
-            database_api.set_database_api(database_api_module.DatabaseApi(
-                config.host,
-                config.port,
-                config.name,
-                config.user,
-                config.password,
-                config.additional_connection_params
-            ))
+            self.database_api_module = import_module(config_instance.engine)
+            database_api.set_database_api(self._create_database_api())
         except (ImportError, AttributeError, ):
-            raise IncorrectDbBackendException(u'Failed to import given database engine: %s' % config.engine)
+            raise IncorrectDbBackendException(
+                u'Failed to import given database engine: %s' % config_instance.engine
+            )
+
+    def _create_database_api(self, config=None):
+        """
+        Returns database api instance for given config, api config by default.
+        """
+        if config is None:
+            config, database_api_module = self.config, self.database_api_module
+        else:
+            try:
+                database_api_module = import_module(config.engine)
+            except (ImportError, TypeError, ):
+                raise IncorrectDbBackendException(u'Failed to import given database engine: %s' % config.engine)
+        return database_api_module.DatabaseApi(
+            config.host,
+            config.port,
+            config.name,
+            config.user,
+            config.password,
+            config.additional_connection_params,
+            pool_min_size=config.pool_min_size,
+            pool_max_size=config.pool_max_size,
+            pool_timeout=config.pool_timeout,
+            statement_cache_size=config.statement_cache_size,
+            prepare_statements=config.prepare_statements,
+        )
 
     @staticmethod
     def _create_migration_history_table_if_not_exists():
         if not DatabaseHelper.migration_history_exists():
             DatabaseHelper.create_history_table()
+        else:
+            DatabaseHelper.upgrade_history_table()
 
     @staticmethod
     def _prepare_migration_data(package, migration_number):
@@ -77,6 +105,40 @@ class Api(object):
             )
         return packages, migration_number
 
+    @staticmethod
+    def _prepare_jobs(jobs):
+        try:
+            jobs = int(jobs or 1)
+        except (TypeError, ValueError, ):
+            raise InconsistentParamsException('Incorrect jobs number is given')
+        if jobs < 1:
+            raise InconsistentParamsException('Jobs number should not be less than 1')
+        pool_max_size = database_api.pool.max_size
+        if jobs > 1 and pool_max_size is not None and jobs >= pool_max_size:
+            raise InconsistentParamsException(
+                'Jobs number should be less than pool_max_size (%s), one connection is used by main thread'
+                % pool_max_size
+            )
+        return jobs
+
+    @staticmethod
+    def _prepare_batch_size(batch_size, atomic):
+        if not batch_size and not atomic:
+            return None
+        if not database_api.transactional_ddl:
+            raise InconsistentParamsException(
+                'Applying several migrations in one transaction is supported only by engines with transactional DDL'
+            )
+        if atomic:
+            return maxsize
+        try:
+            batch_size = int(batch_size)
+        except (TypeError, ValueError, ):
+            raise InconsistentParamsException('Incorrect batch size is given')
+        if batch_size < 1:
+            raise InconsistentParamsException('Batch size should not be less than 1')
+        return batch_size
+
     def create(self, package, name):
         """
         Creates a new migration in given package. Command makes next things:
@@ -102,64 +164,466 @@ class Api(object):
         )
         return migration.fs_file_name
 
-    def migrate(self, package=None, migration_number=None):
+    @staticmethod
+    def _has_pending_migrations(packages):
+        """
+        Checks with one query to head table whether some of packages have migrations newer than
+        latest applied one. Returns True if head table can't be read, for example it is not created yet.
+        """
+        try:
+            latest_numbers = DatabaseHelper.get_latest_migration_numbers()
+        except RawSqlMigrateException:
+            return True
+        finally:
+            # read transaction is not kept open while waiting for lock, so lock holder can alter history
+            # tables and history is read again after lock is taken
+            database_api.rollback()
+        return any(
+            MigrationCatalog.get(package_for_migrate).latest_number > latest_numbers.get(package_for_migrate, 0)
+            for package_for_migrate in packages
+        )
+
+    def migrate(self, package=None, migration_number=None, jobs=1, batch_size=None, atomic=False):
         """
         Migrates given package or config packages. Usage:
             migrate(package='package_a') - forwards to latest available migration
             migrate(package='package_a', migration_number=42) - if migration number is greater than current
         applied migration migrates forward to 42 migration, else backward.
             migrate() - migrates all packages found in config 'packages' section to latest available migrations
+            migrate(jobs=4) - same as above, but migrates up to 4 packages at the same time
+            migrate(atomic=True) - same as above, but all migrations of package are applied in one transaction
         :param package: package to search migrations in, if not provided tries to get all packages from
         'packages' config section. If found applies migration to all of them.
         :param migration_number: number of migration to apply. If number is behind of current migration
         system migrates back to given number, else migrates forward. If none is provided migrates to
         latest available.
-        :return: None
+        :param jobs: number of packages to migrate at the same time. Each package is migrated in
+        separate thread with its own database connection, migrations inside one package are still
+        applied in order. Packages should not depend on each other to be migrated in parallel.
+        :param batch_size: number of migrations applied in one transaction. Migration history of batch
+        is written with one query. Failed batch is rolled back completely. Supported only by engines
+        with transactional DDL.
+        :param atomic: apply all migrations of package in one transaction, same as infinite batch_size.
+        Migrate to latest migrations returns at once if head table shows there is nothing to apply.
+        Otherwise migrations are applied holding advisory lock of engine, so several nodes running
+        migrate at the same time wait for each other, and then skip migrations applied by others.
+        :return: dictionary with result for each package. Dictionary has next structure:
+        {
+            package:
+            {
+                state: one of MigrationHelper.PackageState values,
+                applied: list of applied migration names,
+                error: error message if package migration failed
+            }
+        }
         :raises InconsistentParamsException: raises when:
         1. package or 'packages' section are not provided
         2. package is not provided but migration_number is given
         3. given migration_number in package is given for migrate is equal to current applied
-        4. incorrect migration number is given
+        4. incorrect migration number, jobs number or batch size is given
+        5. batch_size or atomic are given for engine without transactional DDL
         :raises NoMigrationsFoundToApply: raises when in the given package there are no migration to apply
         :raises IncorrectMigrationFile: raises when migration file has no forward or backward function
+        :raises MigrationFailedException: raises when some package failed to migrate while migrating
+        packages in parallel. Exception results attribute contains result dictionary.
         """
 
         packages, migration_number = self._prepare_migration_data(package, migration_number)
+        jobs = self._prepare_jobs(jobs)
+        batch_size = self._prepare_batch_size(batch_size, atomic)
+
+        if migration_number is None and not self._has_pending_migrations(packages):
+            if package is not None:
+                raise NoMigrationsFoundToApply('No new migrations found in package %s' % package)
+            results = {}
+            for package_for_migrate in packages:
+                stdout.write('No new migrations found in package %s. Skipping.\n' % package_for_migrate)
+                results[package_for_migrate] = {
+                    'state': MigrationHelper.PackageState.UP_TO_DATE, 'applied': [], 'error': None,
+                }
+            return results
+
+        database_api.acquire_lock(DatabaseHelper.get_lock_name())
+        try:
+            return self._migrate_packages(package, packages, migration_number, jobs, batch_size)
+        finally:
+            database_api.release_lock()
 
+    def _migrate_packages(self, package, packages, migration_number, jobs, batch_size):
         self._create_migration_history_table_if_not_exists()
+        history_index = HistoryIndex.load()
 
-        migration_direction = None
-        for package_for_migrate in packages:
-            current_migration_number = DatabaseHelper.get_latest_migration_number(package_for_migrate)
-            if not migration_direction:
-                migration_direction = MigrationHelper.get_migration_direction(
-                    package_for_migrate, current_migration_number, migration_number
+        migration_direction = MigrationHelper.get_migration_direction(
+            packages[0], history_index.get_latest_migration_number(packages[0]), migration_number
+        )
+        if migration_direction is None:
+            raise CurrentMigrationNumberGiven('Current migration number matches given one')
+
+        results = dict(
+            (package_for_migrate, {'state': MigrationHelper.PackageState.NOT_STARTED, 'applied': [], 'error': None})
+            for package_for_migrate in packages
+        )
+
+        try:
+            if jobs == 1 or len(packages) == 1:
+                for package_for_migrate in packages:
+                    self._migrate_package(
+                        package_for_migrate, migration_number, migration_direction, history_index,
+                        results[package_for_migrate], raise_if_nothing_to_apply=package is not None,
+                        batch_size=batch_size
+                    )
+            else:
+                self._migrate_packages_in_parallel(
+                    packages, jobs, migration_number, migration_direction, history_index, results, batch_size
                 )
-                if migration_direction is None:
-                    raise InconsistentParamsException('Current migration number matches given one')
-
-            migration_data = FileSystemHelper.get_migrations_list(package_for_migrate)
-            numbers_to_apply = MigrationHelper.get_migrations_numbers_to_apply(
-                migration_data.keys(),
-                current_migration_number,
-                migration_number,
-                migration_direction
-            )
+        finally:
+            instrumentation.flush()
+        return results
 
-            if not numbers_to_apply:
-                if package is not None:
-                    raise NoMigrationsFoundToApply('No new migrations found in package %s' % package_for_migrate)
-                else:
-                    stdout.write('No new migrations found in package %s. Skipping.\n' % package_for_migrate)
-                    continue
+    def _run_on_databases(self, function, concurrency=1, continue_on_failure=None):
+        """
+        Calls function for every database of config databases section, up to concurrency databases
+        at the same time. Every database is handled in separate thread with its own database api and
+        config bound to it. When some database fails other databases are not started, unless
+        continue_on_failure is set.
+        :return: dictionary with next structure:
+        {
+            database:
+            {
+                result: function result, None if database failed or was not started,
+                error: error message if database failed
+            }
+        }
+        :raises InconsistentParamsException: raises when databases section is empty or concurrency is incorrect
+        :raises MigrationFailedException: raises when some database failed. Exception results attribute contains
+        result dictionary.
+        """
+        try:
+            from queue import Queue, Empty
+        except ImportError:
+            from Queue import Queue, Empty
+
+        names = self.config.get_database_names()
+        if not names:
+            raise InconsistentParamsException('No databases found in config databases section')
+        try:
+            concurrency = int(concurrency or 1)
+        except (TypeError, ValueError, ):
+            raise InconsistentParamsException('Incorrect concurrency is given')
+        if concurrency < 1:
+            raise InconsistentParamsException('Concurrency should not be less than 1')
+        if continue_on_failure is None:
+            continue_on_failure = self.config.continue_on_failure
+
+        results = dict((name, {'result': None, 'error': None}) for name in names)
+        names_queue = Queue()
+        for name in names:
+            names_queue.put(name)
+        failed = Event()
+
+        def worker():
+            while continue_on_failure or not failed.is_set():
+                try:
+                    name = names_queue.get_nowait()
+                except Empty:
+                    break
+                database_api_instance = None
+                try:
+                    database_config = self.config.get_database_config(name)
+                    database_api_instance = self._create_database_api(database_config)
+                    database_api.bind(database_api_instance)
+                    rsm_config.bind(database_config)
+                    results[name]['result'] = function()
+                except Exception as e:
+                    results[name]['error'] = str(e)
+                    failed.set()
+                finally:
+                    database_api.bind(None)
+                    rsm_config.bind(None)
+                    if database_api_instance is not None:
+                        database_api_instance.dispose()
+
+        threads = [Thread(target=worker) for _ in range(min(concurrency, len(names)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if failed.is_set():
+            failed_names = [name for name in names if results[name]['error'] is not None]
+            raise MigrationFailedException('Failed databases: %s' % ', '.join(failed_names), results)
+        return results
+
+    def _validate_databases_params(self, jobs, batch_size, atomic):
+        """
+        Checks jobs and batch size params against database api of every database of config
+        databases section, so no database is migrated when params don't fit some of them.
+        Databases with incorrect engine are skipped, they fail when migrated.
+        :raises InconsistentParamsException: raises when params don't fit some database
+        """
+        errors = []
+        for name in self.config.get_database_names():
+            try:
+                database_api_instance = self._create_database_api(self.config.get_database_config(name))
+            except IncorrectDbBackendException:
+                continue
+            database_api.bind(database_api_instance)
+            try:
+                self._prepare_jobs(jobs)
+                self._prepare_batch_size(batch_size, atomic)
+            except InconsistentParamsException as e:
+                errors.append('%s: %s' % (name, e, ))
+            finally:
+                database_api.bind(None)
+                database_api_instance.dispose()
+        if errors:
+            raise InconsistentParamsException('Incorrect params for databases: %s' % '; '.join(errors))
+
+    def migrate_databases(self, package=None, migration_number=None, concurrency=1, continue_on_failure=None, **kwargs):
+        """
+        Migrates every database of config databases section with the same params as migrate,
+        up to concurrency databases at the same time. Databases which are already migrated
+        to given migration get up to date state of packages.
+        :param continue_on_failure: whether to migrate other databases after some database failed,
+        config continue_on_failure is used by default
+        :param kwargs: jobs, batch_size and atomic params of migrate
+        :return: dictionary described in _run_on_databases, result of every database is migrate result
+        :raises InconsistentParamsException: raises when params are incorrect for some database,
+        before any database is migrated
+        :raises MigrationFailedException: raises when some database failed to migrate
+        """
+        packages, migration_number = self._prepare_migration_data(package, migration_number)
+        self._validate_databases_params(kwargs.get('jobs'), kwargs.get('batch_size'), kwargs.get('atomic'))
 
+        def migrate_database():
+            try:
+                return self.migrate(package, migration_number, **kwargs)
+            except (NoMigrationsFoundToApply, CurrentMigrationNumberGiven, ):
+                return dict(
+                    (package_for_migrate, {
+                        'state': MigrationHelper.PackageState.UP_TO_DATE, 'applied': [], 'error': None,
+                    }) for package_for_migrate in packages
+                )
+
+        return self._run_on_databases(migrate_database, concurrency, continue_on_failure)
+
+    def status_databases(self, package=None, concurrency=1):
+        """
+        Returns status of every database of config databases section. Result of every database
+        is status result, see _run_on_databases.
+        :raises MigrationFailedException: raises when status of some database can't be read
+        """
+        return self._run_on_databases(lambda: self.status(package), concurrency, continue_on_failure=True)
+
+    @staticmethod
+    def _get_migrations_to_apply(package, migration_number, migration_direction, history_index):
+        """
+        Returns package migrations list and ordered numbers of migrations which should be applied.
+        """
+        migration_data = FileSystemHelper.get_migrations_list(package)
+        numbers_to_apply = MigrationHelper.get_migrations_numbers_to_apply(
+            migration_data.keys(),
+            history_index.get_latest_migration_number(package),
+            migration_number,
+            migration_direction
+        )
+        return migration_data, numbers_to_apply
+
+    @staticmethod
+    def _migrate_package(
+            package, migration_number, migration_direction, history_index, result, raise_if_nothing_to_apply,
+            batch_size=None
+    ):
+        migration_data, numbers_to_apply = Api._get_migrations_to_apply(
+            package, migration_number, migration_direction, history_index
+        )
+
+        if not numbers_to_apply:
+            if raise_if_nothing_to_apply:
+                raise NoMigrationsFoundToApply('No new migrations found in package %s' % package)
+            stdout.write('No new migrations found in package %s. Skipping.\n' % package)
+            result['state'] = MigrationHelper.PackageState.UP_TO_DATE
+            return
+
+        batch = []
+        try:
             for migration_number_to_apply in numbers_to_apply:
                 file_name = migration_data[migration_number_to_apply]['file_name']
                 migration = Migration(
-                    py_package=package_for_migrate,
+                    py_package=package,
                     py_module_name=file_name
                 )
-                migration.migrate(migration_direction)
+                if batch_size is None or not migration.atomic:
+                    if batch:
+                        # non-atomic migration commits every statement, so batch is committed before it
+                        Api._commit_batch(package, batch, migration_direction, history_index, result)
+                        batch = []
+                    migration.migrate(migration_direction)
+                    Api._update_history_index(
+                        package, [migration.py_module_name], migration_direction, history_index, result
+                    )
+                    continue
+
+                migration.migrate(migration_direction, commit=False)
+                batch.append(migration)
+                if len(batch) >= batch_size:
+                    Api._commit_batch(package, batch, migration_direction, history_index, result)
+                    batch = []
+            if batch:
+                Api._commit_batch(package, batch, migration_direction, history_index, result)
+        except Exception as e:
+            result['state'] = MigrationHelper.PackageState.FAILED
+            result['error'] = str(e)
+            raise
+        result['state'] = MigrationHelper.PackageState.APPLIED
+
+    @staticmethod
+    def _update_history_index(package, names, migration_direction, history_index, result):
+        for name in names:
+            if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
+                history_index.add(package, name)
+            else:
+                history_index.remove(package, name)
+            result['applied'].append(name)
+
+    @staticmethod
+    def _commit_batch(package, migrations, migration_direction, history_index, result):
+        names = [migration.py_module_name for migration in migrations]
+        try:
+            stats = [migration.stats for migration in migrations]
+            if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
+                DatabaseHelper.write_migrations_history(names, package, stats)
+            else:
+                DatabaseHelper.delete_migrations_history(names, package, stats)
+            database_api.commit()
+        except Exception:
+            database_api.rollback()
+            database_api.release_connection()
+            raise
+        stdout.write('Committed %s migrations in package %s\n' % (len(names), package))
+        Api._update_history_index(package, names, migration_direction, history_index, result)
+
+    def _migrate_packages_in_parallel(
+            self, packages, jobs, migration_number, migration_direction, history_index, results, batch_size=None
+    ):
+        try:
+            from queue import Queue, Empty
+        except ImportError:
+            from Queue import Queue, Empty
+
+        packages_queue = Queue()
+        for package_for_migrate in packages:
+            packages_queue.put(package_for_migrate)
+        failed = Event()
+        main_database_api = database_api.get_database_api()
+
+        def worker():
+            worker_database_api = main_database_api.fork()
+            database_api.bind(worker_database_api)
+            try:
+                while not failed.is_set():
+                    try:
+                        package_for_migrate = packages_queue.get_nowait()
+                    except Empty:
+                        break
+                    try:
+                        self._migrate_package(
+                            package_for_migrate, migration_number, migration_direction, history_index,
+                            results[package_for_migrate], raise_if_nothing_to_apply=False,
+                            batch_size=batch_size
+                        )
+                    except Exception:
+                        failed.set()
+            finally:
+                database_api.bind(None)
+                worker_database_api.close()
+
+        threads = [Thread(target=worker) for _ in range(min(jobs, len(packages)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if failed.is_set():
+            failed_packages = [
+                package_for_migrate for package_for_migrate in packages
+                if results[package_for_migrate]['state'] == MigrationHelper.PackageState.FAILED
+            ]
+            raise MigrationFailedException(
+                'Failed to migrate packages: %s' % ', '.join(failed_packages), results
+            )
+
+    def plan(self, package=None, migration_number=None):
+        """
+        Returns queries which migrate with the same params would execute, without executing them.
+        Migrations are run against RecordingDatabaseApi, only head table is read from database with one query.
+        Queries returning rows get empty result, so plan is exact only for migrations which
+        do not depend on data read from database. Head row of package is moved once, with last
+        migration of package, as migrate does with atomic param. Usage is the same as for migrate.
+        :param package: package to plan, if not provided all packages from 'packages' config section are planned
+        :param migration_number: number of migration to plan migrate to
+        :return: list of migrations in order they would be applied. Each one is a dictionary with next structure:
+        {
+            package: package name,
+            name: migration name,
+            direction: one of MigrationHelper.MigrationDirection values,
+            statements: list of dictionaries with sql, params and optional comment
+        }
+        :raises InconsistentParamsException: raises on the same params as migrate
+        :raises IncorrectMigrationFile: raises when migration file has no forward or backward function
+        """
+        from raw_sql_migrate.engines.recording import RecordingDatabaseApi
+
+        packages, migration_number = self._prepare_migration_data(package, migration_number)
+
+        try:
+            history_index = HistoryIndex.load()
+        except RawSqlMigrateException:
+            # head table is missing, history table is not created yet or is created by previous version
+            database_api.rollback()
+            if DatabaseHelper.migration_history_exists():
+                history_index = HistoryIndex(DatabaseHelper.get_history_latest_migration_numbers().items())
+            else:
+                history_index = HistoryIndex()
+
+        migration_direction = MigrationHelper.get_migration_direction(
+            packages[0], history_index.get_latest_migration_number(packages[0]), migration_number
+        )
+        if migration_direction is None:
+            raise CurrentMigrationNumberGiven('Current migration number matches given one')
+
+        recording_database_api = RecordingDatabaseApi(database_api.get_database_api())
+        database_api.bind(recording_database_api)
+        result = []
+        try:
+            for package_for_plan in packages:
+                migration_data, numbers_to_apply = self._get_migrations_to_apply(
+                    package_for_plan, migration_number, migration_direction, history_index
+                )
+                for index, migration_number_to_apply in enumerate(numbers_to_apply):
+                    migration = Migration(
+                        py_package=package_for_plan,
+                        py_module_name=migration_data[migration_number_to_apply]['file_name']
+                    )
+                    migration.get_handler(migration_direction)(database_api)
+                    update_head = index == len(numbers_to_apply) - 1
+                    if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
+                        DatabaseHelper.write_migration_history(
+                            migration.py_module_name, package_for_plan, update_head=update_head
+                        )
+                    else:
+                        DatabaseHelper.delete_migration_history(
+                            migration.py_module_name, package_for_plan, update_head=update_head
+                        )
+                    result.append({
+                        'package': package_for_plan,
+                        'name': migration.py_module_name,
+                        'direction': migration_direction,
+                        'statements': recording_database_api.reset(),
+                    })
+        finally:
+            database_api.bind(None)
+        return result
 
     def status(self, package=None):
         """
@@ -178,23 +642,91 @@ class Api(object):
 
         return DatabaseHelper.status(package)
 
+    def check(self, package=None):
+        """
+        Checks whether database is migrated to latest migrations of given package or config packages.
+        Digest of package migration file names is compared with digest stored in head table when package
+        was migrated, all packages are checked with one query. Migration modules are not imported and
+        history table is not created or upgraded, so check is cheap enough for readiness probes.
+        Dictionary has next structure:
+        {
+            package:
+            {
+                up_to_date: whether latest migration of package is applied and applied migrations are not changed,
+                applied: name of latest applied migration, None if package is not migrated,
+                latest: file name of latest package migration, None if package has no migrations
+            }
+        }
+        :param package: package to check, if not provided all packages from 'packages' config section are checked
+        :raises InconsistentParamsException: raises when package or 'packages' section are not provided
+        """
+        packages, _ = self._prepare_migration_data(package, None)
+        try:
+            head_digests = DatabaseHelper.get_head_digests()
+        except RawSqlMigrateException:
+            head_digests = {}
+        finally:
+            database_api.rollback()
+
+        result = {}
+        for package_to_check in packages:
+            catalog = MigrationCatalog.get(package_to_check)
+            applied, applied_digest = head_digests.get(package_to_check, (None, None, ))
+            result[package_to_check] = {
+                'up_to_date': catalog.get_digest() == applied_digest,
+                'applied': applied,
+                'latest': catalog.migrations[catalog.latest_number]['file_name'] if catalog.numbers else None,
+            }
+        return result
+
+    def timings(self, package=None, limit=5):
+        """
+        Returns slowest applied migrations of given package or of all packages if 'package' is left None.
+        Only migrations applied by versions which record duration are returned. Dictionary has next structure:
+        {
+            package:
+            [
+                {
+                    name: migration name,
+                    duration_ms: migration duration in milliseconds,
+                    statement_count: number of executed statements,
+                    rows_affected: number of affected rows
+                }
+            ]
+        }
+        :param package: package to get timings of
+        :param limit: number of slowest migrations returned for each package
+        """
+        self._create_migration_history_table_if_not_exists()
+
+        result = {}
+        for row in DatabaseHelper.get_migrations_timings(package):
+            package_timings = result.setdefault(row[0], [])
+            if len(package_timings) < limit:
+                package_timings.append({
+                    'name': row[1], 'duration_ms': row[2], 'statement_count': row[3], 'rows_affected': row[4],
+                })
+        return result
+
     def squash(self, package, begin_from=1, name=None):
         """
         Squashes several migrations into one. Command reads all not applied migrations
-        in package migration directory and appends content of forward and backward
-        function into result functions. Squash also renames squashed migration with
-        'squashed_' prefix.
+        beginning from given number in package migration directory and joins bodies of their
+        forward functions in order of numbers and bodies of backward functions in reverse order.
+        Migrations are parsed one by one and result is written to file as it is built.
+        Squash also renames squashed migration with 'squashed_' prefix.
         :param package: path to package which migrations should be squashed
         :param begin_from: migration number to begin squash from. Should be not less than 1
         :param name: squashed migration name
+        :raises InconsistentParamsException: raises when given migrations are applied or not found
+        :raises IncorrectMigrationFile: raises when some migration can't be squashed, for example it is
+        plain sql, non-atomic or its functions return values
         """
-        result_forward_content = ''
-        result_backward_content = ''
-
         self._create_migration_history_table_if_not_exists()
 
         current_migration_number = DatabaseHelper.get_latest_migration_number(package)
-        last_file_system_migration_number = FileSystemHelper.get_file_system_latest_migration_number(package)
+        catalog = MigrationCatalog.get(package)
+        last_file_system_migration_number = catalog.latest_number
 
         if begin_from:
             begin_from = int(begin_from)
@@ -210,26 +742,13 @@ class Api(object):
                 'begin_from should not be less than 1'
             )
 
-        migration_data = FileSystemHelper.get_migrations_list(package)
-        ordered_keys = sorted(migration_data.keys())
-
-        for key in ordered_keys[begin_from:]:
-            file_name = migration_data[key]['file_name']
-            file_path = migration_data[key]['file_path']
-            stdout.write('Squashing migration %s...' % file_name)
-            file_forward_content, file_backward_content = FileSystemHelper.get_migration_file_content(file_path)
-            result_forward_content += file_forward_content
-            result_backward_content += file_backward_content
-            new_file_name = 'squashed_%s' % file_name
-            new_file_path = path.join(migration_data[key]['file_directory'], new_file_name)
-            rename(migration_data[key]['file_path'], new_file_path)
-
-        first_migration_number = ordered_keys[0]
+        migration_data = catalog.migrations
+        migrations = [migration_data[number] for number in catalog.numbers if number >= begin_from]
+        if not migrations:
+            raise InconsistentParamsException('No migrations found to squash beginning from %s' % begin_from)
 
         Migration.create_squashed(
             py_package=package,
             name=name,
-            migration_number=first_migration_number,
-            forward_content=result_forward_content,
-            backward_content=result_backward_content
+            migrations=migrations
         )
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+from asyncio import Lock, get_event_loop
+from sys import stdout
+from time import time
+
+from importlib import import_module
+
+from raw_sql_migrate import Config, rsm_config
+from raw_sql_migrate.api import Api
+from raw_sql_migrate.engines import database_api
+from raw_sql_migrate.engines.async_base import AsyncBaseApi, SyncDatabaseApi
+from raw_sql_migrate.exceptions import (
+    NoMigrationsFoundToApply, IncorrectDbBackendException, CurrentMigrationNumberGiven,
+)
+from raw_sql_migrate.helpers import MigrationHelper, DatabaseHelper, HistoryIndex
+from raw_sql_migrate.migration import Migration
+
+__all__ = (
+    'AsyncApi',
+)
+
+
+class AsyncApi(object):
+    """
+    Asyncio version of Api for engines based on AsyncBaseApi. Api instance works with one database,
+    does not use global database api and config, so many instances can migrate different databases
+    from one event loop at the same time:
+        apis = [AsyncApi(config) for config in configs]
+        await asyncio.gather(*(api.migrate('package_a') for api in apis))
+    Migrations can declare 'async def forward(database_api)', such handlers are awaited on event loop
+    with asyncio database api. Synchronous handlers and migration history queries are run in default
+    executor of event loop with synchronous database api which sends queries through event loop.
+    Instrumentation hooks are not configured by AsyncApi, call instrumentation.configure once if needed.
+    """
+
+    def __init__(self, config=None):
+        if config is not None:
+            config_instance = config
+        else:
+            config_instance = Config()
+            config_instance.init_from_file()
+        self.config = config_instance
+        self._pool_lock = None
+
+        try:
+            database_api_module = import_module(config_instance.engine)
+            database_api_class = database_api_module.DatabaseApi
+        except (ImportError, AttributeError, ):
+            raise IncorrectDbBackendException(
+                u'Failed to import given database engine: %s' % config_instance.engine
+            )
+        if not issubclass(database_api_class, AsyncBaseApi):
+            raise IncorrectDbBackendException(
+                u'Database engine %s is not asyncio engine, use Api instead' % config_instance.engine
+            )
+        self.database_api = database_api_class(
+            self.config.host,
+            self.config.port,
+            self.config.name,
+            self.config.user,
+            self.config.password,
+            self.config.additional_connection_params,
+            pool_min_size=self.config.pool_min_size,
+            pool_max_size=self.config.pool_max_size,
+            pool_timeout=self.config.pool_timeout,
+            statement_cache_size=self.config.statement_cache_size,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self.database_api.close()
+
+    async def _fork_database_api(self):
+        """
+        Returns database api instance with own connection from pool, pool is created on first call.
+        """
+        if self.database_api.pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = Lock()
+            async with self._pool_lock:
+                await self.database_api.create_pool()
+        database_api_instance = self.database_api.fork()
+        await database_api_instance.acquire()
+        return database_api_instance
+
+    async def _run_sync(self, database_api_instance, function, *args):
+        """
+        Calls function in executor thread with database api and config of this api bound to the thread.
+        """
+        loop = get_event_loop()
+        sync_database_api = SyncDatabaseApi(database_api_instance, loop)
+        config = self.config
+
+        def call():
+            database_api.bind(sync_database_api)
+            rsm_config.bind(config)
+            try:
+                return function(*args)
+            finally:
+                database_api.bind(None)
+                rsm_config.bind(None)
+
+        return await loop.run_in_executor(None, call)
+
+    async def execute(self, sql, params=None, return_result=None):
+        """
+        Executes raw sql query outside of transaction on connection taken from pool,
+        see AsyncBaseApi.execute.
+        """
+        database_api_instance = await self._fork_database_api()
+        try:
+            return await database_api_instance.execute(sql, params=params, return_result=return_result)
+        finally:
+            await database_api_instance.release_connection()
+
+    async def status(self, package=None):
+        """
+        Returns the same status dictionary as Api.status
+        """
+        def get_status():
+            Api._create_migration_history_table_if_not_exists()
+            return DatabaseHelper.status(package)
+
+        database_api_instance = await self._fork_database_api()
+        try:
+            return await self._run_sync(database_api_instance, get_status)
+        finally:
+            await database_api_instance.release_connection()
+
+    async def migrate(self, package=None, migration_number=None):
+        """
+        Migrates given package or config packages, usage and result are the same as of Api.migrate.
+        Packages are migrated one by one, each migration is applied in its own transaction.
+        :raises InconsistentParamsException: raises on the same params as Api.migrate
+        :raises NoMigrationsFoundToApply: raises when in the given package there are no migration to apply
+        :raises IncorrectMigrationFile: raises when migration file has no forward or backward function
+        """
+        def prepare():
+            packages, number = Api._prepare_migration_data(package, migration_number)
+            Api._create_migration_history_table_if_not_exists()
+            index = HistoryIndex.load()
+            direction = MigrationHelper.get_migration_direction(
+                packages[0], index.get_latest_migration_number(packages[0]), number
+            )
+            if direction is None:
+                raise CurrentMigrationNumberGiven('Current migration number matches given one')
+            return packages, number, direction, index
+
+        database_api_instance = await self._fork_database_api()
+        try:
+            packages, migration_number, migration_direction, history_index = await self._run_sync(
+                database_api_instance, prepare
+            )
+            results = dict(
+                (package_for_migrate, {'state': MigrationHelper.PackageState.NOT_STARTED, 'applied': [], 'error': None})
+                for package_for_migrate in packages
+            )
+            for package_for_migrate in packages:
+                await self._migrate_package(
+                    database_api_instance, package_for_migrate, migration_number, migration_direction,
+                    history_index, results[package_for_migrate], raise_if_nothing_to_apply=package is not None
+                )
+        finally:
+            await database_api_instance.release_connection()
+        return results
+
+    async def _migrate_package(
+            self, database_api_instance, package, migration_number, migration_direction, history_index, result,
+            raise_if_nothing_to_apply
+    ):
+        migration_data, numbers_to_apply = await self._run_sync(
+            database_api_instance, Api._get_migrations_to_apply,
+            package, migration_number, migration_direction, history_index
+        )
+
+        if not numbers_to_apply:
+            if raise_if_nothing_to_apply:
+                raise NoMigrationsFoundToApply('No new migrations found in package %s' % package)
+            stdout.write('No new migrations found in package %s. Skipping.\n' % package)
+            result['state'] = MigrationHelper.PackageState.UP_TO_DATE
+            return
+
+        try:
+            for migration_number_to_apply in numbers_to_apply:
+                migration = await self._run_sync(
+                    database_api_instance, Migration, package, migration_data[migration_number_to_apply]['file_name']
+                )
+                await self._apply_migration(database_api_instance, migration, migration_direction)
+                Api._update_history_index(
+                    package, [migration.py_module_name], migration_direction, history_index, result
+                )
+        except Exception as e:
+            result['state'] = MigrationHelper.PackageState.FAILED
+            result['error'] = str(e)
+            raise
+        result['state'] = MigrationHelper.PackageState.APPLIED
+
+    async def _call_handler(self, database_api_instance, handler):
+        if Migration.is_async_handler(handler):
+            await handler(database_api_instance)
+        else:
+            await self._run_sync(database_api_instance, handler, database_api)
+
+    async def _apply_migration(self, database_api_instance, migration, migration_direction):
+        """
+        Applies migration and writes its history in one transaction. Non-atomic migration is applied
+        outside of transaction, its history is written in transaction after it succeeded.
+        """
+        handler = migration.get_handler(migration_direction, allow_async=True)
+        stdout.write('Migrating %s to migration %s in package %s%s\n' % (
+            migration_direction, migration.py_module_name, migration.py_package,
+            '' if migration.atomic else ' in autocommit mode',
+        ))
+
+        database_api_instance.set_context(migration.py_package, migration.py_module_name)
+        try:
+            started_at = time()
+            statements_executed = database_api_instance.statements_executed
+            rows_affected = database_api_instance.rows_affected
+            if migration.atomic:
+                await database_api_instance.begin()
+                await self._call_handler(database_api_instance, handler)
+            else:
+                try:
+                    await self._call_handler(database_api_instance, handler)
+                except Exception as e:
+                    raise migration.get_non_atomic_failure(
+                        migration_direction, e, database_api_instance.statements_executed - statements_executed
+                    )
+                await database_api_instance.begin()
+            migration.stats = {
+                'duration_ms': int((time() - started_at) * 1000),
+                'statement_count': database_api_instance.statements_executed - statements_executed,
+                'rows_affected': database_api_instance.rows_affected - rows_affected,
+            }
+            if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
+                await self._run_sync(database_api_instance, migration.write_migration_history)
+            else:
+                await self._run_sync(database_api_instance, migration.delete_migration_history)
+            await database_api_instance.commit()
+        except Exception:
+            await database_api_instance.rollback()
+            raise
+        finally:
+            database_api_instance.set_context()
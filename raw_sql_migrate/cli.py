@@ -3,17 +3,45 @@
 import sys
 
 from raw_sql_migrate import Config, ConfigNotFoundException
-from raw_sql_migrate.api import Api
-from raw_sql_migrate.exceptions import NoMigrationsFoundToApply, InconsistentParamsException
+from raw_sql_migrate.exceptions import (
+    NoMigrationsFoundToApply, InconsistentParamsException, MigrationFailedException,
+)
 
 
 STATUS_HEADER_STRING = '%-40s %-40s %-40s \n' % (u'package', u'name', u'processed_at', )
 AFTER_STATUS_HEADER_STRING = '%s \n' % (u'-' * 120)
 STATUS_TEMPLATE_STRING = '%-40s %-40s %-40s \n'
 NO_MIGRATION_STRING = 'No migration history found.\n'
+TIMINGS_HEADER_STRING = '%-40s %-40s %-12s %-12s %-12s \n' % (
+    u'package', u'name', u'duration_ms', u'statements', u'rows',
+)
+TIMINGS_TEMPLATE_STRING = '%-40s %-40s %-12s %-12s %-12s \n'
+MIGRATE_SUMMARY_HEADER_STRING = '%-40s %-15s %-63s \n' % (u'package', u'state', u'details', )
+MIGRATE_SUMMARY_TEMPLATE_STRING = '%-40s %-15s %-63s \n'
+MATRIX_PACKAGE_TEMPLATE_STRING = '%-40s'
+DATABASE_ERROR_TEMPLATE_STRING = '%s: %s\n'
+NOT_APPLIED_CELL = '-'
+DATABASE_FAILED_CELL = 'failed'
+CHECK_FAILED_TEMPLATE_STRING = '%s is not migrated: applied %s, latest %s\n'
+CHECK_PASSED_STRING = 'Database is up to date.\n'
+DEFAULT_DATABASE_TEMPLATE_STRING = (
+    'Database section is not configured, using database %s of databases section. '
+    'Pass --all-databases to use all of them.\n'
+)
 
 
-def _get_api(config_path=None):
+def _write_default_database(config):
+    """
+    Writes which database of databases section is used when database section is not configured.
+    """
+    if config.default_database_name is not None:
+        sys.stderr.write(DEFAULT_DATABASE_TEMPLATE_STRING % config.default_database_name)
+
+
+def _get_api(config_path=None, all_databases=False):
+    # Api, helpers and engine are imported only when command needs them to keep rsm startup fast
+    from raw_sql_migrate.api import Api
+
     config = None
     if config_path:
         config = Config()
@@ -23,14 +51,96 @@ def _get_api(config_path=None):
             sys.stderr.write(e.message + '\n')
             return None
 
-    return Api(config=config)
+    api = Api(config=config)
+    if not all_databases:
+        _write_default_database(api.config)
+    return api
+
+
+def _write_matrix(databases, rows):
+    """
+    Writes table with row of cells for every package and column for every database.
+    :param rows: list of (package, cells) tuples, cells are in the same order as databases
+    """
+    widths = [
+        max([len(database)] + [len(cells[index]) for package, cells in rows])
+        for index, database in enumerate(databases)
+    ]
+    sys.stdout.write(
+        MATRIX_PACKAGE_TEMPLATE_STRING % u'package' +
+        ''.join(' %-*s' % (width, database) for width, database in zip(widths, databases)) + ' \n'
+    )
+    sys.stdout.write(AFTER_STATUS_HEADER_STRING)
+    for package, cells in rows:
+        sys.stdout.write(
+            MATRIX_PACKAGE_TEMPLATE_STRING % package +
+            ''.join(' %-*s' % (width, cell) for width, cell in zip(widths, cells)) + ' \n'
+        )
+
+
+def _write_databases_errors(results):
+    for database in sorted(results):
+        if results[database]['error'] is not None:
+            sys.stderr.write(DATABASE_ERROR_TEMPLATE_STRING % (database, results[database]['error'], ))
+
+
+def _get_matrix_rows(results, get_cell, empty_cell):
+    """
+    Returns rows for _write_matrix from results of databases.
+    :param get_cell: callable taking package result of database, returns cell text
+    :param empty_cell: cell of package missing in result of database
+    """
+    databases = sorted(results)
+    packages = sorted(set(
+        package for database in databases for package in (results[database]['result'] or {})
+    ))
+    rows = []
+    for package in packages:
+        cells = []
+        for database in databases:
+            result = results[database]
+            if result['error'] is not None:
+                cells.append(DATABASE_FAILED_CELL)
+            elif result['result'] is None or package not in result['result']:
+                cells.append(empty_cell)
+            else:
+                cells.append(get_cell(result['result'][package]))
+        rows.append((package, cells, ))
+    return databases, rows
+
+
+def _status_all_databases(api, args):
+    from raw_sql_migrate.helpers import MigrationHelper
+
+    try:
+        results = api.status_databases(package=args.package, concurrency=args.concurrency)
+    except MigrationFailedException as e:
+        results = e.results
+    databases, rows = _get_matrix_rows(
+        results,
+        lambda package_status: package_status['name'][:MigrationHelper.DIGITS_IN_MIGRATION_NUMBER],
+        NOT_APPLIED_CELL
+    )
+    if not rows:
+        sys.stdout.write(NO_MIGRATION_STRING)
+    else:
+        _write_matrix(databases, rows)
+    _write_databases_errors(results)
 
 
 def status(args):
-    api = _get_api(config_path=args.config)
+    api = _get_api(config_path=args.config, all_databases=args.all_databases)
     if not api:
         return
 
+    if args.all_databases:
+        _status_all_databases(api, args)
+        return
+
+    if args.timings:
+        _write_timings(api.timings(package=args.package, limit=args.limit))
+        return
+
     result = api.status(package=args.package)
     if not result:
         sys.stdout.write(NO_MIGRATION_STRING)
@@ -43,6 +153,40 @@ def status(args):
         )
 
 
+def check(args):
+    api = _get_api(config_path=args.config)
+    if not api:
+        sys.exit(1)
+
+    try:
+        result = api.check(package=args.package)
+    except InconsistentParamsException as e:
+        sys.stderr.write(str(e) + '\n')
+        sys.exit(1)
+
+    not_migrated = [package for package in sorted(result) if not result[package]['up_to_date']]
+    for package in not_migrated:
+        sys.stderr.write(CHECK_FAILED_TEMPLATE_STRING % (
+            package, result[package]['applied'] or NOT_APPLIED_CELL, result[package]['latest'] or NOT_APPLIED_CELL,
+        ))
+    if not_migrated:
+        sys.exit(1)
+    sys.stdout.write(CHECK_PASSED_STRING)
+
+
+def _write_timings(result):
+    if not result:
+        sys.stdout.write(NO_MIGRATION_STRING)
+        return
+    sys.stdout.write(TIMINGS_HEADER_STRING)
+    sys.stdout.write(AFTER_STATUS_HEADER_STRING)
+    for package in sorted(result):
+        for timing in result[package]:
+            sys.stdout.write(TIMINGS_TEMPLATE_STRING % (
+                package, timing['name'], timing['duration_ms'], timing['statement_count'], timing['rows_affected'],
+            ))
+
+
 def create(args):
 
     api = _get_api(config_path=args.config)
@@ -55,21 +199,109 @@ def create(args):
     sys.stdout.write('%s migration was created for %s package\n' % (migration_name, args.package))
 
 
+def _write_migrate_summary(results):
+    sys.stdout.write(MIGRATE_SUMMARY_HEADER_STRING)
+    sys.stdout.write(AFTER_STATUS_HEADER_STRING)
+    for package in sorted(results):
+        result = results[package]
+        details = result['error'] or ', '.join(result['applied'])
+        sys.stdout.write(MIGRATE_SUMMARY_TEMPLATE_STRING % (package, result['state'], details, ))
+
+
+def _migrate_all_databases(api, args):
+    from raw_sql_migrate.helpers import MigrationHelper
+
+    try:
+        results = api.migrate_databases(
+            package=args.package, migration_number=args.migration_number, concurrency=args.concurrency,
+            continue_on_failure=args.continue_on_failure, jobs=args.jobs, batch_size=args.batch_size,
+            atomic=args.atomic
+        )
+    except InconsistentParamsException as e:
+        sys.stderr.write(str(e) + '\n')
+        sys.exit(1)
+    except MigrationFailedException as e:
+        results = e.results
+        failed = True
+        sys.stderr.write(str(e) + '\n')
+    else:
+        failed = False
+    _write_matrix(*_get_matrix_rows(
+        results, lambda package_result: package_result['state'], MigrationHelper.PackageState.NOT_STARTED
+    ))
+    _write_databases_errors(results)
+    if failed:
+        sys.exit(1)
+    sys.stdout.write('Done.\n')
+
+
 def migrate(args):
 
-    api = _get_api(config_path=args.config)
+    api = _get_api(config_path=args.config, all_databases=args.all_databases)
 
     if not api:
         return
 
+    if args.all_databases:
+        _migrate_all_databases(api, args)
+        return
+
     try:
-        api.migrate(package=args.package, migration_number=args.migration_number)
+        results = api.migrate(
+            package=args.package, migration_number=args.migration_number, jobs=args.jobs,
+            batch_size=args.batch_size, atomic=args.atomic
+        )
     except (NoMigrationsFoundToApply, InconsistentParamsException) as e:
         sys.stderr.write(e.message + '\n')
+    except MigrationFailedException as e:
+        _write_migrate_summary(e.results)
+        sys.stderr.write(str(e) + '\n')
+        sys.exit(1)
     else:
+        _write_migrate_summary(results)
         sys.stdout.write('Done.\n')
 
 
+def _write_plan_sql(plan, output):
+    for migration in plan:
+        output.write('-- %s: %s %s\n' % (migration['package'], migration['direction'], migration['name'], ))
+        for statement in migration['statements']:
+            if statement.get('comment'):
+                output.write('-- %s\n' % statement['comment'])
+            if statement['params']:
+                output.write('-- params: %r\n' % (statement['params'], ))
+            output.write('%s;\n' % statement['sql'])
+        output.write('\n')
+
+
+def _write_plan_json(plan, output):
+    import json
+
+    json.dump(plan, output, indent=2, default=str)
+    output.write('\n')
+
+
+def plan(args):
+
+    api = _get_api(config_path=args.config)
+
+    if not api:
+        return
+
+    try:
+        result = api.plan(package=args.package, migration_number=args.migration_number)
+    except InconsistentParamsException as e:
+        sys.stderr.write(str(e) + '\n')
+        return
+
+    write_plan = _write_plan_json if args.format == 'json' else _write_plan_sql
+    if args.output:
+        with open(args.output, 'w') as output:
+            write_plan(result, output)
+    else:
+        write_plan(result, sys.stdout)
+
+
 def squash(args):
 
     api = _get_api(config_path=args.config)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from threading import local
+
 __all__ = (
     'database_api_storage'
 )
@@ -8,10 +10,24 @@ class DatabaseApiStorage(object):
 
     _database_api = None
 
+    def __init__(self):
+        self._local = local()
+
     def set_database_api(self, database_api_instance):
         self._database_api = database_api_instance
 
+    def bind(self, database_api_instance):
+        """
+        Binds database api instance to current thread only. Pass None to
+        return to instance given to set_database_api.
+        """
+        self._local.database_api = database_api_instance
+
+    def get_database_api(self):
+        return getattr(self._local, 'database_api', None) or self._database_api
+
     def __getattr__(self, item):
-        return self._database_api and getattr(self._database_api, item)
+        database_api_instance = self.get_database_api()
+        return database_api_instance and getattr(database_api_instance, item)
 
 database_api = DatabaseApiStorage()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from raw_sql_migrate.engines.async_base import AsyncBaseApi
+
+__all__ = (
+    'DatabaseApi',
+)
+
+
+class DatabaseApi(AsyncBaseApi):
+    """
+    MySQL asyncio database api based on aiomysql. Connections are opened in autocommit mode,
+    transactions of migrations are started explicitly.
+    """
+
+    engine = __name__
+    default_port = 3306
+    default_pool_max_size = 10
+    backslash_escapes = True
+    upsert_template = 'INSERT INTO %(table)s (%(columns)s) VALUES (%(values)s) ON DUPLICATE KEY UPDATE %(updates)s'
+    upsert_update_template = '%(column)s = VALUES(%(column)s)'
+    current_schema_function = 'DATABASE()'
+
+    async def _create_pool(self):
+        try:
+            from aiomysql import create_pool
+        except ImportError:
+            raise Exception('Failed to import aiomysql, ensure you have installed it')
+
+        return await create_pool(
+            db=self.name,
+            user=self.user,
+            password=self.password,
+            port=self.port if self.port else self.default_port,
+            host=self.host,
+            minsize=self.pool_min_size,
+            maxsize=self.pool_max_size or max(self.pool_min_size, self.default_pool_max_size),
+            autocommit=True,
+            **self.additional_connection_params
+        )
+
+    async def _close_pool(self, pool):
+        pool.close()
+        await pool.wait_closed()
+
+    async def _acquire(self, pool):
+        if self.pool_timeout is None:
+            return await pool.acquire()
+        from asyncio import wait_for
+
+        return await wait_for(pool.acquire(), self.pool_timeout)
+
+    async def _release(self, pool, connection):
+        await pool.release(connection)
+
+    async def _execute(self, connection, sql, params, fetch):
+        cursor = await connection.cursor()
+        try:
+            await cursor.execute(sql, params)
+            rows = list(await cursor.fetchall()) if fetch else None
+            return rows, cursor.rowcount
+        finally:
+            await cursor.close()
+
+    async def _execute_page(self, connection, sql, page):
+        """
+        Driver rewrites INSERT ... VALUES into one multi-row INSERT.
+        """
+        cursor = await connection.cursor()
+        try:
+            await cursor.executemany(sql, page)
+            return cursor.rowcount
+        finally:
+            await cursor.close()
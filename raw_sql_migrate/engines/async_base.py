@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+from asyncio import run_coroutine_threadsafe
+from itertools import islice
+from time import time
+
+from raw_sql_migrate.engines.base import BaseApi
+from raw_sql_migrate.engines.statements import StatementCache, convert_placeholders
+from raw_sql_migrate.splitter import SqlStatementSplitter
+from raw_sql_migrate.exceptions import RawSqlMigrateException
+from raw_sql_migrate.instrumentation import instrumentation
+
+__all__ = (
+    'AsyncBaseApi',
+    'SyncDatabaseApi',
+)
+
+
+class AsyncBaseApi(object):
+    """
+    Base asyncio database api. Pool of driver connections is created by create_pool and shared
+    by all instances created with fork method. Instance holds connection taken with acquire until
+    release_connection is called, so one instance should be used by one task at a time.
+    Queries use the same %s and %(name)s placeholders as synchronous engines.
+    Instance counts executed statements and affected rows in statements_executed
+    and rows_affected attributes.
+    """
+
+    engine = None
+    host = None
+    port = None
+    name = None
+    user = None
+    password = None
+    additional_connection_params = {}
+    pool = None
+    pool_min_size = 1
+    pool_max_size = None
+    pool_timeout = None
+    _connection = None
+    default_port = None
+    default_page_size = 1000
+    statement_cache_size = 100
+    transactional_ddl = False
+    backslash_escapes = False
+    auto_increment_primary_key = 'SERIAL PRIMARY KEY'
+    upsert_template = (
+        'INSERT INTO %(table)s (%(columns)s) VALUES (%(values)s) ON CONFLICT (%(key)s) DO UPDATE SET %(updates)s'
+    )
+    upsert_update_template = '%(column)s = EXCLUDED.%(column)s'
+    current_schema_function = 'current_schema()'
+    max_query_params = None
+    placeholder_format = None
+    statements_executed = 0
+    rows_affected = 0
+    package = None
+    migration = None
+
+    CursorResult = BaseApi.CursorResult
+
+    def __init__(self, host, port, name, user, password, additional_connection_params,
+                 pool_min_size=1, pool_max_size=None, pool_timeout=None, pool=None, statement_cache_size=None):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.user = user
+        self.password = password
+        self.additional_connection_params = additional_connection_params
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.pool_timeout = pool_timeout
+        if statement_cache_size is not None:
+            self.statement_cache_size = statement_cache_size
+        self.pool = pool
+        self.statement_cache = StatementCache(self.statement_cache_size)
+
+    def fork(self):
+        """
+        Returns new instance with the same connection params and pool, but own connection.
+        """
+        return self.__class__(
+            self.host, self.port, self.name, self.user, self.password, self.additional_connection_params,
+            pool_min_size=self.pool_min_size, pool_max_size=self.pool_max_size, pool_timeout=self.pool_timeout,
+            pool=self.pool, statement_cache_size=self.statement_cache_size
+        )
+
+    async def _create_pool(self):
+        """
+        Returns new driver connection pool
+        """
+        raise NotImplementedError()
+
+    async def _close_pool(self, pool):
+        raise NotImplementedError()
+
+    async def _acquire(self, pool):
+        """
+        Takes connection from driver pool, waiting at most pool_timeout seconds.
+        """
+        raise NotImplementedError()
+
+    async def _release(self, pool, connection):
+        raise NotImplementedError()
+
+    async def _execute(self, connection, sql, params, fetch):
+        """
+        Executes sql with params converted by _convert_query.
+        :return: tuple of list of result rows (None if fetch is False) and number of affected rows
+        reported by driver (None if unknown)
+        """
+        raise NotImplementedError()
+
+    async def _execute_page(self, connection, sql, page):
+        """
+        Sends one page of execute_many rows converted by _convert_query.
+        :return: number of affected rows, None if unknown
+        """
+        raise NotImplementedError()
+
+    async def create_pool(self):
+        if self.pool is None:
+            self.pool = await self._create_pool()
+
+    async def close(self):
+        """
+        Releases connection and closes pool, should be called on instance which created pool.
+        """
+        await self.release_connection()
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await self._close_pool(pool)
+
+    async def acquire(self):
+        if self._connection is None:
+            await self.create_pool()
+            self._connection = await self._acquire(self.pool)
+
+    async def release_connection(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await self._release(self.pool, connection)
+
+    def _convert_query(self, sql, params):
+        """
+        Converts %s and %(name)s placeholders into numbered ones of placeholder_format.
+        Engines with pyformat drivers leave placeholder_format None and get query as is.
+        """
+        if self.placeholder_format is None:
+            return sql, params
+        try:
+            sql, keys = self.statement_cache.get(sql)
+        except KeyError:
+            converted = convert_placeholders(sql, self.placeholder_format)
+            self.statement_cache.put(sql, converted)
+            sql, keys = converted
+        return sql, [params[key] for key in keys]
+
+    async def begin(self):
+        await self.execute('BEGIN')
+
+    async def commit(self):
+        await self.execute('COMMIT')
+
+    async def rollback(self):
+        if self._connection is None:
+            return
+        try:
+            await self.execute('ROLLBACK')
+        except RawSqlMigrateException:
+            pass
+
+    def set_context(self, package=None, migration=None):
+        """
+        Sets migration which statements of this instance belong to, for instrumentation hooks.
+        """
+        self.package = package
+        self.migration = migration
+
+    async def table_exists(self, table_name):
+        sql = """
+            SELECT *
+            FROM information_schema.tables
+            WHERE table_schema = %s AND table_name = %%(table_name)s
+        """ % self.current_schema_function
+        rows = await self.execute(sql, params={'table_name': table_name}, return_result=self.CursorResult.FETCHALL)
+        return bool(rows)
+
+    async def get_table_columns(self, table_name):
+        """
+        Returns set of lower case column names of given table, empty if table does not exist.
+        """
+        sql = """
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %%(table_name)s
+        """ % self.current_schema_function
+        rows = await self.execute(sql, params={'table_name': table_name}, return_result=self.CursorResult.FETCHALL)
+        return set(row[0].lower() for row in rows)
+
+    async def execute(self, sql, params=None, return_result=None):
+        """
+        Executes raw sql query on connection of this instance, it is acquired if needed.
+        :param sql: Raw SQL query
+        :param params: arguments for query
+        :param return_result: one of CursorResult values except ITER:
+            ROWCOUNT - returns number of affected rows
+            FETCHALL - returns list of all result rows
+            None - returns nothing
+        """
+        if return_result == self.CursorResult.ITER:
+            raise RawSqlMigrateException('ITER result is not supported by asyncio engines')
+        if not params:
+            params = {}
+
+        await self.acquire()
+        event = None
+        try:
+            if instrumentation.enabled:
+                event = instrumentation.before_execute(sql, params, self.package, self.migration)
+            converted_sql, converted_params = self._convert_query(sql, params)
+            rows, rowcount = await self._execute(
+                self._connection, converted_sql, converted_params, return_result == self.CursorResult.FETCHALL
+            )
+            self.statements_executed += 1
+            if rowcount and rowcount > 0:
+                self.rows_affected += rowcount
+            if event is not None:
+                instrumentation.after_execute(event, rowcount)
+        except Exception as e:
+            if event is not None and event.duration is None:
+                instrumentation.after_execute(event, error=e)
+            raise RawSqlMigrateException(e)
+
+        if return_result == self.CursorResult.ROWCOUNT:
+            return rowcount
+        elif return_result == self.CursorResult.FETCHALL:
+            return rows
+
+    async def execute_many(self, sql, rows, page_size=None):
+        """
+        Executes sql for every params in rows, sending them by pages of page_size.
+        Rows can be any iterable and are never loaded into memory at once.
+        :return: number of affected rows reported by driver
+        """
+        page_size = page_size or self.default_page_size
+        rows = iter(rows)
+        result = 0
+
+        await self.acquire()
+        try:
+            while True:
+                page = list(islice(rows, page_size))
+                if not page:
+                    break
+                event = (
+                    instrumentation.before_execute(sql, page, self.package, self.migration)
+                    if instrumentation.enabled else None
+                )
+                converted_page = [self._convert_query(sql, params) for params in page]
+                try:
+                    rowcount = await self._execute_page(
+                        self._connection, converted_page[0][0], [params for _, params in converted_page]
+                    )
+                except Exception as e:
+                    if event is not None:
+                        instrumentation.after_execute(event, error=e)
+                    raise
+                if event is not None:
+                    instrumentation.after_execute(event, rowcount)
+                self.statements_executed += 1
+                if rowcount and rowcount > 0:
+                    result += rowcount
+                    self.rows_affected += rowcount
+        except Exception as e:
+            raise RawSqlMigrateException(e)
+
+        return result
+
+    async def backfill(self, table, key_column, update_sql, chunk_size=None, pause=0):
+        """
+        Backfill commits chunks in the middle of transaction of migration which is controlled by AsyncApi,
+        so it is not supported by asyncio engines.
+        :raises RawSqlMigrateException: always
+        """
+        raise RawSqlMigrateException('Backfill is not supported by asyncio engines')
+
+    async def execute_file(self, file_path, chunk_size=None):
+        """
+        Executes SQL script statement by statement, reading it by chunks of chunk_size bytes.
+        Reading file blocks event loop only for one chunk at a time.
+        :return: number of executed statements
+        """
+        statements = 0
+        started_at = time()
+        with open(file_path, 'rb') as file_descriptor:
+            splitter = SqlStatementSplitter(
+                file_descriptor, chunk_size=chunk_size, backslash_escapes=self.backslash_escapes
+            )
+            for statement in splitter:
+                # execute formats query with params, so percent signs of raw sql are escaped
+                await self.execute(statement.replace('%', '%%'))
+                statements += 1
+        BaseApi._write_execute_file_progress(file_path, statements, splitter.bytes_read, started_at)
+        return statements
+
+
+class SyncDatabaseApi(object):
+    """
+    Synchronous database api which runs queries of asyncio database api on its event loop.
+    Used by AsyncApi to call synchronous migrations and migration history helpers in executor
+    threads. Transaction is controlled by AsyncApi, so commit, rollback and release_connection
+    do nothing. Other attributes are taken from wrapped database api.
+    :var database_api_instance: AsyncBaseApi instance with acquired connection
+    :var loop: event loop database_api_instance is used in
+    """
+
+    def __init__(self, database_api_instance, loop):
+        self.database_api_instance = database_api_instance
+        self.loop = loop
+
+    def __getattr__(self, item):
+        return getattr(self.database_api_instance, item)
+
+    def _run(self, coroutine):
+        return run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def execute(self, sql, params=None, return_result=None, batch_size=None):
+        return self._run(self.database_api_instance.execute(sql, params=params, return_result=return_result))
+
+    def execute_many(self, sql, rows, page_size=None):
+        return self._run(self.database_api_instance.execute_many(sql, rows, page_size=page_size))
+
+    def execute_file(self, file_path, chunk_size=None):
+        return self._run(self.database_api_instance.execute_file(file_path, chunk_size=chunk_size))
+
+    def backfill(self, table, key_column, update_sql, chunk_size=None, pause=0):
+        return self._run(self.database_api_instance.backfill(
+            table, key_column, update_sql, chunk_size=chunk_size, pause=pause
+        ))
+
+    def table_exists(self, table_name):
+        return self._run(self.database_api_instance.table_exists(table_name))
+
+    def get_table_columns(self, table_name):
+        return self._run(self.database_api_instance.get_table_columns(table_name))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def release_connection(self):
+        pass
+
+    def set_autocommit(self, autocommit):
+        pass
+
+    def set_batched(self, batched):
+        pass
+
+    def close(self):
+        pass
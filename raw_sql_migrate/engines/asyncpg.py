@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from raw_sql_migrate.engines.async_base import AsyncBaseApi
+
+__all__ = (
+    'DatabaseApi',
+)
+
+
+class DatabaseApi(AsyncBaseApi):
+    """
+    PostgreSQL asyncio database api based on asyncpg. Placeholders are converted into $N ones,
+    driver prepares and caches statements itself.
+    """
+
+    engine = __name__
+    default_port = 5432
+    default_pool_max_size = 10
+    transactional_ddl = True
+    max_query_params = 32767
+    placeholder_format = '$%d'
+
+    async def _create_pool(self):
+        try:
+            from asyncpg import create_pool
+        except ImportError:
+            raise Exception('Failed to import asyncpg, ensure you have installed it')
+
+        return await create_pool(
+            database=self.name,
+            user=self.user,
+            password=self.password,
+            port=self.port if self.port else self.default_port,
+            host=self.host,
+            min_size=self.pool_min_size,
+            max_size=self.pool_max_size or max(self.pool_min_size, self.default_pool_max_size),
+            statement_cache_size=self.statement_cache_size,
+            **self.additional_connection_params
+        )
+
+    async def _close_pool(self, pool):
+        await pool.close()
+
+    async def _acquire(self, pool):
+        return await pool.acquire(timeout=self.pool_timeout)
+
+    async def _release(self, pool, connection):
+        await pool.release(connection)
+
+    @staticmethod
+    def _get_rowcount(status):
+        """
+        Returns number of rows from command status like 'INSERT 0 5' or 'UPDATE 5'.
+        """
+        count = status.rsplit(' ', 1)[-1] if status else ''
+        return int(count) if count.isdigit() else None
+
+    async def _execute(self, connection, sql, params, fetch):
+        if fetch:
+            rows = await connection.fetch(sql, *params)
+            return [tuple(row) for row in rows], len(rows)
+        status = await connection.execute(sql, *params)
+        return None, self._get_rowcount(status)
+
+    async def _execute_page(self, connection, sql, page):
+        """
+        Driver does not report number of affected rows for executemany.
+        """
+        await connection.executemany(sql, page)
+        return None
@@ -1,13 +1,84 @@
 # -*- coding: utf-8 -*-
 
+from itertools import islice
+from sys import stdout
+from time import sleep, time
+
+from raw_sql_migrate.engines.pool import ConnectionPool
+from raw_sql_migrate.engines.statements import StatementCache
+from raw_sql_migrate.splitter import SqlStatementSplitter
 from raw_sql_migrate.exceptions import RawSqlMigrateException
+from raw_sql_migrate.instrumentation import instrumentation
 
 __all__ = (
     'BaseApi',
+    'CursorIterator',
 )
 
 
+class CursorIterator(object):
+    """
+    Iterates over cursor rows fetching them by batches of batch_size rows. Cursor is closed
+    when all rows are read, when close is called or when iterator is garbage collected.
+    Can be used as context manager.
+    """
+
+    def __init__(self, cursor, batch_size):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.cursor is not None:
+            try:
+                return next(self._rows)
+            except StopIteration:
+                pass
+            try:
+                rows = self.cursor.fetchmany(self.batch_size)
+            except Exception as e:
+                self.close()
+                raise RawSqlMigrateException(e)
+            if rows:
+                self._rows = iter(rows)
+            else:
+                self.close()
+        raise StopIteration
+
+    next = __next__
+
+    def close(self):
+        if self.cursor is not None:
+            cursor, self.cursor = self.cursor, None
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
 class BaseApi(object):
+    """
+    Base database api. Connections are taken from pool shared by all instances
+    created with fork method. Instance holds checked out connection until
+    release_connection or close is called. Every connection has one reusable cursor
+    and cache of prepared statements, they are closed when connection is discarded.
+    Engines with advisory_locks support acquire_lock, which is used to serialize
+    migrate runs of several nodes.
+    Instance counts executed statements and affected rows in statements_executed
+    and rows_affected attributes.
+    """
 
     engine = None
     host = None
@@ -16,54 +87,475 @@ class BaseApi(object):
     user = None
     password = None
     additional_connection_params = {}
+    pool = None
     _connection = None
+    _lock_connection = None
     default_port = None
+    default_page_size = 1000
+    default_batch_size = 2000
+    statement_cache_size = 100
+    prepare_statements = False
+    transactional_ddl = False
+    advisory_locks = False
+    backslash_escapes = False
+    progress_interval = 10
+    auto_increment_primary_key = 'SERIAL PRIMARY KEY'
+    upsert_template = (
+        'INSERT INTO %(table)s (%(columns)s) VALUES (%(values)s) ON CONFLICT (%(key)s) DO UPDATE SET %(updates)s'
+    )
+    upsert_update_template = '%(column)s = EXCLUDED.%(column)s'
+    current_schema_function = 'current_schema()'
+    max_query_params = None
+    statements_executed = 0
+    rows_affected = 0
+    autocommit = False
+    batched = False
 
     class CursorResult(object):
 
         ROWCOUNT = 'rowcount'
         FETCHALL = 'fetchall'
+        ITER = 'iter'
 
-    def __init__(self, host, port, name, user, password, additional_connection_params):
+    def __init__(self, host, port, name, user, password, additional_connection_params,
+                 pool_min_size=1, pool_max_size=None, pool_timeout=None, pool=None, statement_cache_size=None,
+                 prepare_statements=None):
         self.host = host
         self.port = port
         self.name = name
         self.user = user
         self.password = password
         self.additional_connection_params = additional_connection_params
+        if statement_cache_size is not None:
+            self.statement_cache_size = statement_cache_size
+        if prepare_statements is not None:
+            self.prepare_statements = prepare_statements
+        if pool is None:
+            pool = ConnectionPool(
+                self._connect, self._ping, pool_min_size, pool_max_size, pool_timeout,
+                on_discard=self._on_connection_discard
+            )
+        self.pool = pool
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._connection:
-            self._connection.close()
+        self.dispose()
+
+    def fork(self):
+        """
+        Returns new instance with the same connection params and pool, but own connection.
+        """
+        return self.__class__(
+            self.host, self.port, self.name, self.user, self.password, self.additional_connection_params,
+            pool=self.pool, statement_cache_size=self.statement_cache_size, prepare_statements=self.prepare_statements
+        )
+
+    def _connect(self):
+        """
+        Opens new database connection
+        """
+        raise NotImplementedError()
+
+    def _ping(self, connection):
+        """
+        Checks connection before it is checked out from pool. Should raise or return False
+        if connection is not usable.
+        """
+        raise NotImplementedError()
+
+    def _is_connection_closed(self, connection):
+        """
+        Cheap check without round trip to database whether connection is lost.
+        """
+        return False
 
     @property
     def connection(self):
-        raise NotImplementedError()
+        if self._connection is None:
+            self._connection = self.pool.checkout()
+        return self._connection
+
+    @staticmethod
+    def _on_connection_discard(connection, info):
+        cursor = info.get('cursor')
+        if cursor is not None:
+            cursor.close()
+
+    def _get_cursor(self):
+        """
+        Returns reusable cursor of current connection.
+        """
+        info = self.pool.get_info(self.connection)
+        cursor = info.get('cursor')
+        if cursor is None:
+            cursor = info['cursor'] = self.connection.cursor()
+        return cursor
+
+    @property
+    def statement_cache(self):
+        """
+        Cache of statements prepared on current connection.
+        """
+        info = self.pool.get_info(self.connection)
+        statement_cache = info.get('statement_cache')
+        if statement_cache is None:
+            cursor = self._get_cursor()
+            statement_cache = info['statement_cache'] = StatementCache(
+                self.statement_cache_size,
+                on_evict=lambda sql, statement: self._deallocate_statement(cursor, statement)
+            )
+        return statement_cache
+
+    def get_statement_cache_stats(self):
+        """
+        Returns dictionary with hits, misses and size of current connection statement cache.
+        """
+        return self.statement_cache.stats()
+
+    def _execute_statement(self, cursor, sql, params):
+        """
+        Executes sql on cursor. Engines with server side prepared statements override it
+        to prepare repeated queries and cache them in statement_cache.
+        """
+        cursor.execute(sql, params)
+
+    def _execute_streaming(self, cursor, sql, params):
+        """
+        Executes sql on cursor returned by _create_streaming_cursor.
+        """
+        cursor.execute(sql, params)
+
+    def _deallocate_statement(self, cursor, statement):
+        """
+        Frees prepared statement evicted from statement_cache.
+        """
+        pass
+
+    def release_connection(self):
+        """
+        Returns connection to pool, not committed transaction is rolled back.
+        """
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self.pool.release(connection)
+
+    def _discard_connection(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self.pool.discard(connection)
+
+    def close(self):
+        """
+        Returns connection to pool and releases lock. Pool is kept for other instances sharing it.
+        """
+        self.release_connection()
+        self.release_lock()
+
+    def dispose(self):
+        """
+        Closes instance and connections of its pool, should be called on instance which created pool
+        when all instances created with fork are closed.
+        """
+        self.close()
+        self.pool.close()
 
     def rollback(self):
-        self._connection.rollback()
+        if self._connection is None:
+            return
+        try:
+            self._connection.rollback()
+        except Exception:
+            self._discard_connection()
 
     def commit(self):
-        self._connection.commit()
+        self.connection.commit()
+
+    def _set_autocommit(self, connection, autocommit):
+        """
+        Switches driver connection autocommit mode.
+        """
+        raise NotImplementedError()
+
+    def set_autocommit(self, autocommit):
+        """
+        Switches current connection to autocommit mode, where every statement is committed as soon
+        as it is executed, or back to transaction mode. Not committed transaction is committed first.
+        Used by non-atomic migrations. Connection which failed to switch is discarded.
+        """
+        try:
+            self.commit()
+            self._set_autocommit(self.connection, autocommit)
+        except Exception as e:
+            self._discard_connection()
+            raise RawSqlMigrateException(e)
+        self.autocommit = autocommit
 
-    def execute(self, sql, params=None, return_result=None):
+    def set_batched(self, batched):
+        """
+        Marks that queries are executed in transaction shared by several migrations, which is
+        committed by caller. Used by migrate with batch size, backfill can't be called in this mode.
+        """
+        self.batched = batched
+
+    def _acquire_lock(self, connection, name):
+        """
+        Takes session level advisory lock with given name on connection, waiting until it is free.
+        """
+        raise NotImplementedError()
+
+    def acquire_lock(self, name):
+        """
+        Takes advisory lock with given name, waiting until other sessions release it. Lock is held
+        on separate connection opened outside of pool, so transactions and connections released by
+        this instance do not affect it. Engines without advisory_locks do nothing.
+        """
+        if not self.advisory_locks or self._lock_connection is not None:
+            return
+        connection = None
+        try:
+            connection = self._connect()
+            self._acquire_lock(connection, name)
+        except Exception as e:
+            if connection is not None:
+                connection.close()
+            raise RawSqlMigrateException(e)
+        self._lock_connection = connection
+
+    def release_lock(self):
+        """
+        Releases lock taken by acquire_lock, session locks are released when their connection is closed.
+        """
+        if self._lock_connection is not None:
+            connection, self._lock_connection = self._lock_connection, None
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def table_exists(self, table_name):
+        sql = """
+            SELECT *
+            FROM information_schema.tables
+            WHERE table_schema = %s AND table_name = %%(table_name)s
+        """ % self.current_schema_function
+        return bool(self.execute(sql, params={'table_name': table_name}, return_result=self.CursorResult.ROWCOUNT))
+
+    def get_table_columns(self, table_name):
+        """
+        Returns set of lower case column names of given table, empty if table does not exist.
+        """
+        sql = """
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %%(table_name)s
+        """ % self.current_schema_function
+        rows = self.execute(sql, params={'table_name': table_name}, return_result=self.CursorResult.FETCHALL)
+        return set(row[0].lower() for row in rows)
+
+    def _create_streaming_cursor(self, batch_size):
+        """
+        Returns cursor which does not load whole result into memory. Default implementation
+        returns ordinary cursor, engines override it with server side cursors.
+        """
+        return self.connection.cursor()
+
+    def execute(self, sql, params=None, return_result=None, batch_size=None):
+        """
+        Executes raw sql query.
+        :param sql: Raw SQL query
+        :param params: arguments for query
+        :param return_result: one of CursorResult values:
+            ROWCOUNT - returns number of affected rows
+            FETCHALL - returns list of all result rows
+            ITER - returns CursorIterator over result rows. Rows are fetched from server side cursor
+            by batches of batch_size, so memory usage does not depend on result size.
+            None - returns nothing
+        :param batch_size: number of rows fetched at once for ITER result
+        """
         if not params:
             params = {}
 
         result = None
+        event = None
 
-        cursor = self.connection.cursor()
+        streaming = return_result == BaseApi.CursorResult.ITER
+        if streaming:
+            batch_size = batch_size or self.default_batch_size
+            cursor = self._create_streaming_cursor(batch_size)
+        else:
+            cursor = self._get_cursor()
         try:
-            cursor.execute(sql, params)
+            if instrumentation.enabled:
+                event = instrumentation.before_execute(sql, params)
+            if streaming:
+                self._execute_streaming(cursor, sql, params)
+            else:
+                self._execute_statement(cursor, sql, params)
+                self._count_rows(cursor.rowcount)
+            self.statements_executed += 1
+            if event is not None:
+                instrumentation.after_execute(event, None if streaming else cursor.rowcount)
             if return_result is None:
                 result = None
             elif return_result == BaseApi.CursorResult.ROWCOUNT:
                 result = cursor.rowcount
             elif return_result == BaseApi.CursorResult.FETCHALL:
                 result = cursor.fetchall()
+            elif return_result == BaseApi.CursorResult.ITER:
+                result = CursorIterator(cursor, batch_size)
         except Exception as e:
-            cursor.close()
-            self.connection.close()
+            if event is not None and event.duration is None:
+                instrumentation.after_execute(event, error=e)
+            if streaming:
+                cursor.close()
+            if self._is_connection_closed(self._connection):
+                self._discard_connection()
             raise RawSqlMigrateException(e)
 
         return result
+
+    def execute_many(self, sql, rows, page_size=None):
+        """
+        Executes sql for every params in rows. Rows are read by pages of page_size
+        and each page is sent to database in one call, so rows can be any iterable
+        (for example generator) and are never loaded into memory at once.
+        :param sql: Raw SQL query
+        :param rows: iterable of params for query
+        :param page_size: number of rows sent to database in one call
+        :return: number of affected rows reported by driver
+        """
+        page_size = page_size or self.default_page_size
+        rows = iter(rows)
+        result = 0
+
+        cursor = self._get_cursor()
+        try:
+            while True:
+                page = list(islice(rows, page_size))
+                if not page:
+                    break
+                event = instrumentation.before_execute(sql, page) if instrumentation.enabled else None
+                try:
+                    rowcount = self._execute_page(cursor, sql, page)
+                except Exception as e:
+                    if event is not None:
+                        instrumentation.after_execute(event, error=e)
+                    raise
+                if event is not None:
+                    instrumentation.after_execute(event, rowcount)
+                self.statements_executed += 1
+                if rowcount and rowcount > 0:
+                    result += rowcount
+                    self.rows_affected += rowcount
+        except Exception as e:
+            if self._is_connection_closed(self._connection):
+                self._discard_connection()
+            raise RawSqlMigrateException(e)
+
+        return result
+
+    def _count_rows(self, rowcount):
+        if rowcount and rowcount > 0:
+            self.rows_affected += rowcount
+
+    def _execute_page(self, cursor, sql, page):
+        """
+        Sends one page of execute_many rows. Default implementation relies on
+        driver executemany, MySQLdb rewrites INSERT ... VALUES into one multi-row INSERT.
+        :return: number of affected rows
+        """
+        cursor.executemany(sql, page)
+        return cursor.rowcount
+
+    def backfill(self, table, key_column, update_sql, chunk_size=None, pause=0):
+        """
+        Runs update_sql over table by chunks of chunk_size rows walking key_column
+        in order (keyset pagination). Each chunk is committed separately, so locks are held
+        only while chunk is processed. Chunk bounds are given to update_sql as start
+        and end params, example:
+            UPDATE test SET value = 0 WHERE id BETWEEN %(start)s AND %(end)s
+        Note that committed chunks are not rolled back if migration fails later, so
+        update_sql should be safe to run again. Backfill commits current transaction, so it can't
+        be called by migrations applied with --batch-size or --atomic, where one transaction is
+        shared by several migrations.
+        :param table: table to walk
+        :param key_column: unique column of table, usually primary key
+        :param update_sql: Raw SQL query executed for every chunk
+        :param chunk_size: number of rows in one chunk
+        :param pause: seconds to sleep after each chunk
+        :return: number of affected rows
+        :raises RawSqlMigrateException: raises when called in transaction shared by several migrations
+        """
+        if self.batched:
+            raise RawSqlMigrateException(
+                'Backfill commits every chunk, so it can not be used by migrations applied with batch size or atomic'
+            )
+        chunk_size = chunk_size or self.default_page_size
+        chunk_sql = 'SELECT min(%s), max(%s) FROM (SELECT %s FROM %s %%s ORDER BY %s LIMIT %d) rsm_chunk' % (
+            key_column, key_column, key_column, table, key_column, chunk_size,
+        )
+        first_chunk_sql = chunk_sql % ''
+        next_chunk_sql = chunk_sql % ('WHERE %s > %%(last)s' % key_column)
+
+        result = 0
+        processing_time = 0
+        last = None
+        while True:
+            started_at = time()
+            if last is None:
+                rows = self.execute(first_chunk_sql, return_result=self.CursorResult.FETCHALL)
+            else:
+                rows = self.execute(next_chunk_sql, params={'last': last}, return_result=self.CursorResult.FETCHALL)
+            start, end = rows[0]
+            if start is None:
+                break
+
+            rowcount = self.execute(
+                update_sql, params={'start': start, 'end': end}, return_result=self.CursorResult.ROWCOUNT
+            )
+            self.commit()
+            processing_time += time() - started_at
+            if rowcount and rowcount > 0:
+                result += rowcount
+            last = end
+
+            stdout.write('Backfilled %s rows in %s up to %s=%s, %d rows/s\n' % (
+                result, table, key_column, end, result / processing_time if processing_time else result,
+            ))
+            if pause:
+                sleep(pause)
+
+        return result
+
+    def execute_file(self, file_path, chunk_size=None):
+        """
+        Executes SQL script statement by statement. Script is read by chunks of chunk_size
+        bytes and every statement is executed as soon as it is read, so scripts of any size
+        are executed with flat memory usage. Statements are executed as is, without params.
+        Progress is written every progress_interval seconds and when script is finished.
+        :param file_path: path to SQL script
+        :param chunk_size: number of bytes read at once
+        :return: number of executed statements
+        """
+        statements = 0
+        started_at = reported_at = time()
+        with open(file_path, 'rb') as file_descriptor:
+            splitter = SqlStatementSplitter(
+                file_descriptor, chunk_size=chunk_size, backslash_escapes=self.backslash_escapes
+            )
+            for statement in splitter:
+                # execute formats query with params, so percent signs of raw sql are escaped
+                self.execute(statement.replace('%', '%%'))
+                statements += 1
+                if time() - reported_at >= self.progress_interval:
+                    reported_at = time()
+                    self._write_execute_file_progress(file_path, statements, splitter.bytes_read, started_at)
+        self._write_execute_file_progress(file_path, statements, splitter.bytes_read, started_at)
+        return statements
+
+    @staticmethod
+    def _write_execute_file_progress(file_path, statements, bytes_read, started_at):
+        elapsed = time() - started_at
+        stdout.write('Executed %d statements (%d bytes) of %s in %.1fs, %d statements/s, %d bytes/s\n' % (
+            statements, bytes_read, file_path, elapsed,
+            statements / elapsed if elapsed else statements, bytes_read / elapsed if elapsed else bytes_read,
+        ))
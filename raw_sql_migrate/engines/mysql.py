@@ -1,10 +1,7 @@
-
-try:
-    from MySQLdb import connect
-except ImportError:
-    connect = None
+# -*- coding: utf-8 -*-
 
 from raw_sql_migrate.engines.base import BaseApi
+from raw_sql_migrate.exceptions import RawSqlMigrateException
 
 __all__ = (
     'DatabaseApi',
@@ -15,21 +12,57 @@ class DatabaseApi(BaseApi):
 
     engine = __name__
     default_port = 3306
+    backslash_escapes = True
+    advisory_locks = True
+    upsert_template = 'INSERT INTO %(table)s (%(columns)s) VALUES (%(values)s) ON DUPLICATE KEY UPDATE %(updates)s'
+    upsert_update_template = '%(column)s = VALUES(%(column)s)'
+    current_schema_function = 'DATABASE()'
+    max_lock_name_length = 64
 
-    @property
-    def connection(self):
-
-        if not connect:
+    def _connect(self):
+        try:
+            from MySQLdb import connect
+        except ImportError:
             raise Exception('Failed to import MySQLdb, ensure you have installed MySQLdb-python package')
 
-        if self._connection is None:
-            port = self.port if self.port else self.default_port
-            self._connection = connect(
-                db=self.name,
-                user=self.user,
-                passwd=self.password,
-                port=port,
-                host=self.host,
-                **self.additional_connection_params
-            )
-        return self._connection
+        port = self.port if self.port else self.default_port
+        return connect(
+            db=self.name,
+            user=self.user,
+            passwd=self.password,
+            port=port,
+            host=self.host,
+            **self.additional_connection_params
+        )
+
+    def _ping(self, connection):
+        connection.ping()
+        return True
+
+    def _is_connection_closed(self, connection):
+        return connection is None or not connection.open
+
+    def _set_autocommit(self, connection, autocommit):
+        connection.autocommit(autocommit)
+
+    def _acquire_lock(self, connection, name):
+        """
+        GET_LOCK with negative timeout waits for lock forever, supported since MySQL 5.7.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT GET_LOCK(%s, -1)', (name[:self.max_lock_name_length], ))
+            acquired = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        if acquired != 1:
+            raise RawSqlMigrateException('Failed to get lock %s' % name)
+
+    def _create_streaming_cursor(self, batch_size):
+        """
+        SSCursor keeps result on server side. Note that connection can't run other queries
+        until all rows are read or cursor is closed, use fork to get another connection.
+        """
+        from MySQLdb.cursors import SSCursor
+
+        return self.connection.cursor(SSCursor)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from threading import Condition
+
+from raw_sql_migrate.exceptions import RawSqlMigrateException, PoolTimeoutException
+
+__all__ = (
+    'ConnectionPool',
+)
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of database connections.
+    :var connect: callable without arguments returning new connection
+    :var ping: callable taking connection, should raise or return False if connection is not usable.
+    Connections are checked on checkout, broken ones are replaced with new connections.
+    :var min_size: number of connections opened on first checkout and kept open
+    :var max_size: maximum number of opened connections, None means no limit
+    :var timeout: seconds to wait for free connection when max_size is reached, None means forever
+    :var on_discard: callable taking connection and its info dictionary, called before connection is closed
+    """
+
+    def __init__(self, connect, ping, min_size=1, max_size=None, timeout=None, on_discard=None):
+        if max_size is not None and max_size < max(min_size, 1):
+            raise RawSqlMigrateException('Pool max size should not be less than min size and 1')
+        self.connect = connect
+        self.ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.on_discard = on_discard
+        self._idle = []
+        self._info = {}
+        self._size = 0
+        self._condition = Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    def _reserve(self):
+        """
+        Returns idle connection or None if caller is allowed to open new one.
+        """
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self.max_size is None or self._size < self.max_size:
+                    self._size += 1
+                    return None
+                self._condition.wait(self.timeout)
+                if not self._idle and self.max_size is not None and self._size >= self.max_size:
+                    if self.timeout is not None:
+                        raise PoolTimeoutException(
+                            'No free connection in pool after %s seconds' % self.timeout
+                        )
+
+    def _open(self):
+        try:
+            return self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _is_usable(self, connection):
+        try:
+            return self.ping(connection) is not False
+        except Exception:
+            return False
+
+    def fill(self):
+        """
+        Opens connections until pool has min_size of them.
+        """
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            connection = self._open()
+            self.release(connection)
+
+    def checkout(self):
+        """
+        Returns usable connection from pool, opens new one if there is no idle connections.
+        """
+        if self._size < self.min_size:
+            self.fill()
+        while True:
+            connection = self._reserve()
+            if connection is None:
+                return self._open()
+            if self._is_usable(connection):
+                return connection
+            self.discard(connection)
+
+    def release(self, connection):
+        """
+        Returns connection to pool. Not finished transaction is rolled back.
+        """
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def get_info(self, connection):
+        """
+        Returns dictionary for data bound to connection, like reusable cursors.
+        It lives until connection is discarded.
+        """
+        return self._info.setdefault(id(connection), {})
+
+    def discard(self, connection):
+        """
+        Closes connection and removes it from pool.
+        """
+        info = self._info.pop(id(connection), {})
+        try:
+            if self.on_discard is not None:
+                self.on_discard(connection, info)
+            connection.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
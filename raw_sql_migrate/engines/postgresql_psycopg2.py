@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
-try:
-    from psycopg2 import connect
-except ImportError:
-    connect = None
+import re
+
+from itertools import count
+from zlib import crc32
 
 from raw_sql_migrate.engines.base import BaseApi
+from raw_sql_migrate.engines.statements import convert_placeholders
 
 __all__ = (
     'DatabaseApi',
@@ -16,20 +17,155 @@ class DatabaseApi(BaseApi):
 
     engine = __name__
     default_port = 5432
+    transactional_ddl = True
+    advisory_locks = True
+    cursor_names = count(1)
+    statement_names = count(1)
+    preparable_re = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|VALUES|WITH)\b', re.I)
+    values_placeholder_re = re.compile(r'\bVALUES\s+%s(?:\s+ON\s+CONFLICT\b.*|\s+RETURNING\b.*)?;?\s*$', re.I | re.S)
 
-    @property
-    def connection(self):
-
-        if not connect:
+    def _connect(self):
+        try:
+            from psycopg2 import connect
+        except ImportError:
             raise Exception('Failed to import psycopg2, ensure you have installed it')
 
-        if self._connection is None:
-            self._connection = connect(
-                database=self.name,
-                user=self.user,
-                password=self.password,
-                port=self.port if self.port else self.default_port,
-                host=self.host,
-                **self.additional_connection_params
+        return connect(
+            database=self.name,
+            user=self.user,
+            password=self.password,
+            port=self.port if self.port else self.default_port,
+            host=self.host,
+            **self.additional_connection_params
+        )
+
+    def _ping(self, connection):
+        if connection.closed:
+            return False
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+        connection.rollback()
+        return True
+
+    def _is_connection_closed(self, connection):
+        return connection is None or bool(connection.closed)
+
+    def _set_autocommit(self, connection, autocommit):
+        connection.autocommit = autocommit
+
+    def _acquire_lock(self, connection, name):
+        """
+        pg_advisory_lock takes integer key, so it is computed from lock name.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT pg_advisory_lock(%s)', (crc32(name.encode('utf-8')) & 0xffffffff, ))
+        finally:
+            cursor.close()
+        connection.commit()
+
+    def _execute_page(self, cursor, sql, page):
+        """
+        Queries like 'INSERT INTO table (a, b) VALUES %s' are sent as one multi-row INSERT
+        with execute_values, other queries are joined into one call with execute_batch.
+        Note that for execute_batch driver reports rowcount of the last query only.
+        """
+        from psycopg2.extras import execute_batch, execute_values
+
+        if self.values_placeholder_re.search(sql):
+            execute_values(cursor, sql, page, page_size=len(page))
+        else:
+            execute_batch(cursor, sql, page, page_size=len(page))
+        return cursor.rowcount
+
+    def _create_streaming_cursor(self, batch_size):
+        """
+        Named cursor is server side cursor, rows are fetched from it by batches.
+        """
+        cursor = self.connection.cursor(name='rsm_cursor_%d' % next(self.cursor_names))
+        cursor.itersize = batch_size
+        return cursor
+
+    @staticmethod
+    def _has_adapted_params(params):
+        """
+        Checks whether some of params is tuple, list or dict, which psycopg2 adapts into sql,
+        like IN %s tuple, so query with them can't be prepared.
+        """
+        values = params.values() if isinstance(params, dict) else params
+        return any(isinstance(value, (tuple, list, dict, )) for value in values)
+
+    def _prepare(self, cursor, sql):
+        """
+        Prepares query, returns (name, keys) tuple of prepared statement or False if server rejected it,
+        for example because type of some param can't be inferred. In transaction PREPARE is run inside
+        savepoint, so its failure does not abort transaction.
+        """
+        prepared_sql, keys = convert_placeholders(sql, '$%d')
+        name = 'rsm_statement_%d' % next(self.statement_names)
+        in_transaction = not self.autocommit
+        if in_transaction:
+            cursor.execute('SAVEPOINT rsm_prepare')
+        try:
+            cursor.execute('PREPARE %s AS %s' % (name, prepared_sql))
+        except Exception:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT rsm_prepare')
+            return False
+        if in_transaction:
+            cursor.execute('RELEASE SAVEPOINT rsm_prepare')
+        return name, keys
+
+    def _execute_statement(self, cursor, sql, params):
+        """
+        With prepare_statements query with params executed second time on the same connection is prepared
+        with PREPARE and then executed with EXECUTE, so server parses and plans it only once. Queries which
+        psycopg2 should adapt params into or which fail to prepare are executed as is. Other statements,
+        like DDL, deallocate prepared statements of connection, so they are not executed with stale plans.
+        """
+        if not self.prepare_statements:
+            cursor.execute(sql, params)
+            return
+
+        statement_sql = sql.strip().rstrip(';')
+        if not self.preparable_re.match(statement_sql):
+            statement_cache = self.statement_cache
+            if any(statement_cache.values()):
+                cursor.execute('DEALLOCATE ALL')
+                statement_cache.clear()
+            cursor.execute(sql, params)
+            return
+        if not params or ';' in statement_sql or self._has_adapted_params(params):
+            cursor.execute(sql, params)
+            return
+
+        statement_cache = self.statement_cache
+        try:
+            statement = statement_cache.get(sql)
+        except KeyError:
+            statement_cache.put(sql, None)
+            cursor.execute(sql, params)
+            return
+
+        if statement is None:
+            statement = self._prepare(cursor, statement_sql)
+            statement_cache.put(sql, statement)
+        if not statement:
+            cursor.execute(sql, params)
+            return
+
+        name, keys = statement
+        if keys:
+            cursor.execute(
+                'EXECUTE %s (%s)' % (name, ', '.join(['%s'] * len(keys))),
+                [params[key] for key in keys]
             )
-        return self._connection
+        else:
+            cursor.execute('EXECUTE %s' % name)
+
+    def _deallocate_statement(self, cursor, statement):
+        if statement:
+            cursor.execute('DEALLOCATE %s' % statement[0])
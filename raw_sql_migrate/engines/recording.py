@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from raw_sql_migrate.splitter import SqlStatementSplitter
+
+__all__ = (
+    'RecordingDatabaseApi',
+)
+
+
+class RecordingDatabaseApi(object):
+    """
+    Stand-in for database api which records queries instead of executing them. Other
+    attributes, like CursorResult or transactional_ddl, are taken from wrapped database api.
+    Queries returning rows get empty result, so plan is exact only for migrations which
+    do not depend on data read from database.
+    :var database_api_instance: real database api instance
+    :var statements: list of recorded statements, each one is a dictionary with sql and params
+    and optional comment
+    """
+
+    def __init__(self, database_api_instance):
+        self.database_api_instance = database_api_instance
+        self.statements = []
+
+    def __getattr__(self, item):
+        return getattr(self.database_api_instance, item)
+
+    def reset(self):
+        """
+        Returns statements recorded so far and starts new list.
+        """
+        statements, self.statements = self.statements, []
+        return statements
+
+    def _record(self, sql, params=None, comment=None):
+        statement = {'sql': sql.strip().rstrip(';').rstrip(), 'params': params or None}
+        if comment is not None:
+            statement['comment'] = comment
+        self.statements.append(statement)
+
+    def execute(self, sql, params=None, return_result=None, batch_size=None):
+        self._record(sql, params)
+        if return_result == self.CursorResult.ROWCOUNT:
+            return 0
+        elif return_result == self.CursorResult.FETCHALL:
+            return []
+        elif return_result == self.CursorResult.ITER:
+            return iter(())
+
+    def execute_many(self, sql, rows, page_size=None):
+        rows = list(rows)
+        self._record(sql, rows, comment='executed for each of %d rows' % len(rows))
+        return 0
+
+    def execute_file(self, file_path, chunk_size=None):
+        statements = 0
+        with open(file_path, 'rb') as file_descriptor:
+            splitter = SqlStatementSplitter(
+                file_descriptor, chunk_size=chunk_size, backslash_escapes=self.backslash_escapes
+            )
+            for statement in splitter:
+                self._record(statement)
+                statements += 1
+        return statements
+
+    def backfill(self, table, key_column, update_sql, chunk_size=None, pause=0):
+        chunk_size = chunk_size or self.default_page_size
+        self._record(update_sql, comment='executed and committed for every %d rows of %s ordered by %s' % (
+            chunk_size, table, key_column,
+        ))
+        return 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def release_connection(self):
+        pass
+
+    def set_autocommit(self, autocommit):
+        pass
+
+    def set_batched(self, batched):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import re
+
+from raw_sql_migrate.engines.base import BaseApi
+from raw_sql_migrate.engines.statements import convert_placeholders
+
+__all__ = (
+    'DatabaseApi',
+)
+
+
+class DatabaseApi(BaseApi):
+    """
+    SQLite database api. Database name is path to database file, :memory: for in-memory
+    database. In-memory database exists only while its connection is open, so pool of
+    in-memory database has one connection and migrate can't use jobs.
+    Connections are opened in autocommit mode and transaction is started explicitly before
+    first query which is not read only, so DDL is rolled back together with other queries
+    of failed migration. BEGIN IMMEDIATE is used, so writers of parallel migrate wait for
+    each other for driver timeout instead of failing on lock upgrade. Transaction state is
+    tracked by instance, because connection in_transaction attribute is missing on python 2.
+    """
+
+    engine = __name__
+    transactional_ddl = True
+    auto_increment_primary_key = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    upsert_template = 'INSERT OR REPLACE INTO %(table)s (%(columns)s) VALUES (%(values)s)'
+    max_query_params = 999
+    memory_database_names = ('', ':memory:', )
+    read_only_re = re.compile(r'^\s*(SELECT|PRAGMA|EXPLAIN)\b', re.I)
+    _in_transaction = False
+
+    def __init__(self, host, port, name, user, password, additional_connection_params,
+                 pool_min_size=1, pool_max_size=None, pool_timeout=None, pool=None, statement_cache_size=None,
+                 prepare_statements=None):
+        if name in self.memory_database_names:
+            pool_min_size = pool_max_size = 1
+        super(DatabaseApi, self).__init__(
+            host, port, name, user, password, additional_connection_params, pool_min_size=pool_min_size,
+            pool_max_size=pool_max_size, pool_timeout=pool_timeout, pool=pool, statement_cache_size=statement_cache_size,
+            prepare_statements=prepare_statements
+        )
+
+    def _connect(self):
+        from sqlite3 import connect
+
+        return connect(
+            self.name or ':memory:',
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            **self.additional_connection_params
+        )
+
+    def _ping(self, connection):
+        connection.execute('SELECT 1')
+        return True
+
+    def _convert_query(self, sql, params):
+        """
+        Converts %s and %(name)s placeholders into numbered ?NNN ones. Converted queries are kept
+        in statement_cache, driver caches prepared statements itself.
+        """
+        statement_cache = self.statement_cache
+        try:
+            sql, keys = statement_cache.get(sql)
+        except KeyError:
+            converted = convert_placeholders(sql, '?%d')
+            statement_cache.put(sql, converted)
+            sql, keys = converted
+        return sql, [params[key] for key in keys]
+
+    def _set_autocommit(self, connection, autocommit):
+        """
+        Connections are opened in autocommit mode, in it transaction is just not started.
+        """
+        pass
+
+    def _begin(self, cursor, sql):
+        if self.read_only_re.match(sql) or self.autocommit or self._in_transaction:
+            return
+        cursor.execute('BEGIN IMMEDIATE')
+        self._in_transaction = True
+
+    def commit(self):
+        super(DatabaseApi, self).commit()
+        self._in_transaction = False
+
+    def rollback(self):
+        self._in_transaction = False
+        super(DatabaseApi, self).rollback()
+
+    def release_connection(self):
+        self._in_transaction = False
+        super(DatabaseApi, self).release_connection()
+
+    def _discard_connection(self):
+        self._in_transaction = False
+        super(DatabaseApi, self)._discard_connection()
+
+    def _execute_statement(self, cursor, sql, params):
+        sql, params = self._convert_query(sql, params)
+        self._begin(cursor, sql)
+        cursor.execute(sql, params)
+
+    def _execute_page(self, cursor, sql, page):
+        converted_sql, keys = convert_placeholders(sql, '?%d')
+        self._begin(cursor, converted_sql)
+        cursor.executemany(converted_sql, ([params[key] for key in keys] for params in page))
+        return cursor.rowcount
+
+    def _execute_streaming(self, cursor, sql, params):
+        cursor.execute(*self._convert_query(sql, params))
+
+    def table_exists(self, table_name):
+        rows = self.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %(table_name)s",
+            params={'table_name': table_name}, return_result=self.CursorResult.FETCHALL
+        )
+        return bool(rows)
+
+    def get_table_columns(self, table_name):
+        rows = self.execute(
+            'PRAGMA main.table_info(%s)' % table_name, return_result=self.CursorResult.FETCHALL
+        )
+        return set(row[1].lower() for row in rows)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+__all__ = (
+    'StatementCache',
+    'convert_placeholders',
+)
+
+
+PLACEHOLDER_RE = re.compile(r'%(?:\((\w+)\))?s|%%')
+
+
+def convert_placeholders(sql, placeholder_format):
+    """
+    Converts pyformat placeholders (%s, %(name)s) into numbered ones. Same named
+    placeholder gets the same number.
+    :param sql: Raw SQL query with pyformat placeholders
+    :param placeholder_format: format of numbered placeholder. Example: $%d
+    :return: tuple of converted sql and list of param keys for every placeholder number:
+    indexes for %s placeholders and names for %(name)s ones
+    """
+    keys = []
+
+    def replace(match):
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            keys.append(len(keys))
+        elif name in keys:
+            return placeholder_format % (keys.index(name) + 1)
+        else:
+            keys.append(name)
+        return placeholder_format % len(keys)
+
+    return PLACEHOLDER_RE.sub(replace, sql), keys
+
+
+class StatementCache(object):
+    """
+    LRU cache of statements prepared on one connection.
+    :var max_size: maximum number of cached statements
+    :var on_evict: callable taking key and value of statement removed from cache
+    :var hits: number of lookups found in cache
+    :var misses: number of lookups not found in cache
+    """
+
+    def __init__(self, max_size, on_evict=None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._statements = {}
+        # keys from least to most recently used, OrderedDict is missing on python 2.6
+        self._keys = []
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get(self, key):
+        """
+        Returns cached value and marks it as recently used.
+        :raises KeyError: raises if key is not cached
+        """
+        try:
+            value = self._statements[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self._keys.remove(key)
+        self._keys.append(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._statements:
+            self._keys.remove(key)
+        self._statements[key] = value
+        self._keys.append(key)
+        while len(self._keys) > self.max_size:
+            evicted_key = self._keys.pop(0)
+            evicted_value = self._statements.pop(evicted_key)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_value)
+
+    def values(self):
+        return [self._statements[key] for key in self._keys]
+
+    def clear(self):
+        """
+        Forgets all statements without calling on_evict, used when they are freed at once.
+        """
+        self._statements.clear()
+        del self._keys[:]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._statements)}
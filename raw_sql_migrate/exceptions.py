@@ -7,6 +7,10 @@ __all__ = (
     'ParamRequiredException',
     'NoMigrationsFoundToApply',
     'IncorrectMigrationFile',
+    'MigrationFailedException',
+    'PoolTimeoutException',
+    'NonAtomicMigrationFailedException',
+    'CurrentMigrationNumberGiven',
 )
 
 
@@ -30,9 +34,28 @@ class NoMigrationsFoundToApply(RawSqlMigrateException):
     pass
 
 
+class CurrentMigrationNumberGiven(InconsistentParamsException):
+    pass
+
+
 class IncorrectMigrationFile(RawSqlMigrateException):
     pass
 
 
 class IncorrectPackage(RawSqlMigrateException):
     pass
+
+
+class MigrationFailedException(RawSqlMigrateException):
+
+    def __init__(self, message, results=None):
+        super(MigrationFailedException, self).__init__(message)
+        self.results = results
+
+
+class PoolTimeoutException(RawSqlMigrateException):
+    pass
+
+
+class NonAtomicMigrationFailedException(RawSqlMigrateException):
+    pass
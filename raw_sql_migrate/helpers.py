@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import ast
 import os
 
+from bisect import bisect_left, bisect_right
+from hashlib import sha1
 from importlib import import_module
+from shutil import copyfileobj
+from tempfile import TemporaryFile
+from threading import Lock
 
 from raw_sql_migrate import rsm_config
 from raw_sql_migrate.engines import database_api
@@ -12,6 +18,8 @@ __all__ = (
     'FileSystemHelper',
     'MigrationHelper',
     'DatabaseHelper',
+    'HistoryIndex',
+    'MigrationCatalog',
 )
 
 
@@ -30,6 +38,20 @@ class FileSystemHelper(object):
 
         return filename
 
+    @staticmethod
+    def is_sql_migration_file(filename):
+        return filename is not None and filename.endswith(MigrationHelper.SQL_FORWARD_SUFFIX)
+
+    @staticmethod
+    def trim_sql_extension(filename):
+        """
+        :param filename: string filename to trim '.forward.sql' or '.backward.sql' extension
+        """
+        for suffix in (MigrationHelper.SQL_FORWARD_SUFFIX, MigrationHelper.SQL_BACKWARD_SUFFIX, ):
+            if filename.endswith(suffix):
+                return filename[:-len(suffix)]
+        return filename
+
     @staticmethod
     def get_package_migrations_directory(package):
         try:
@@ -48,70 +70,176 @@ class FileSystemHelper(object):
 
     @classmethod
     def get_file_system_latest_migration_number(cls, package):
-        data = cls.get_migrations_list(package)
-        if not data:
-            return 0
-        number = sorted(data.keys())[-1]
-        return number
+        return MigrationCatalog.get(package).latest_number
 
     @classmethod
     def get_migrations_list(cls, package, directory=None):
+        """
+        Returns dictionary of package migrations with migration numbers as keys. Without directory
+        result is served from package MigrationCatalog and should not be modified.
+        """
         if not directory:
-            directory = FileSystemHelper.get_package_migrations_directory(package)
+            return MigrationCatalog.get(package).migrations
+        return cls.scan_migrations_directory(directory)
+
+    @staticmethod
+    def scan_migrations_directory(directory):
+        """
+        Finds python migrations (NNNN_name.py) and plain sql migrations, which are given by
+        NNNN_name.forward.sql file and optional NNNN_name.backward.sql file.
+        """
+        digits = MigrationHelper.DIGITS_IN_MIGRATION_NUMBER
         result = {}
         for file_name in os.listdir(directory):
-            if file_name[MigrationHelper.DIGITS_IN_MIGRATION_NUMBER] == '_' and file_name.endswith('.py'):
-                result[int(file_name[:MigrationHelper.DIGITS_IN_MIGRATION_NUMBER])] = {
-                    'file_name': file_name,
-                    'file_path': os.path.join(directory, file_name),
-                    'file_directory': directory,
-                }
+            if not file_name[:digits].isdigit() or file_name[digits:digits + 1] != '_':
+                continue
+            if file_name.endswith('.py'):
+                file_type = MigrationHelper.MigrationFileType.PYTHON
+            elif file_name.endswith(MigrationHelper.SQL_FORWARD_SUFFIX):
+                file_type = MigrationHelper.MigrationFileType.SQL
+            else:
+                continue
+            result[int(file_name[:digits])] = {
+                'file_name': file_name,
+                'file_path': os.path.join(directory, file_name),
+                'file_directory': directory,
+                'file_type': file_type,
+            }
         return result
 
     @staticmethod
     def get_migration_python_path_and_name(name, package):
-        migration_module_name = name.strip('.py')
+        migration_module_name = FileSystemHelper.trim_py_extension(name)
         return '.'.join((package, 'migrations', migration_module_name,)), migration_module_name
 
     @staticmethod
-    def get_migration_file_content(file_path):
-        with open(file_path, 'r') as descriptor:
-            lines = [line for line in descriptor]
-
-        forward_start_index = None
-        forward_end_index = None
-        backward_start_index = None
-        backward_end_index = len(lines)
-
-        for line in lines:
-            if 'def forward(' in line:
-                forward_start_index = lines.index(line) + 1
-            elif 'def backward(' in line:
-                forward_end_index = lines.index(line) - 1
-                backward_start_index = lines.index(line) + 1
-        if forward_start_index is None or forward_end_index is None or backward_start_index is None:
-            raise IncorrectMigrationFile('Incorrect migration file found: %s' % file_path)
+    def _get_node_end(lines, node, next_node):
+        """
+        Returns index of line after end of top level node. Python versions without end_lineno
+        take lines up to next node, except trailing blank and comment lines.
+        """
+        end_lineno = getattr(node, 'end_lineno', None)
+        if end_lineno is not None:
+            return end_lineno
+        end = next_node.lineno - 1 if next_node is not None else len(lines)
+        while end > node.lineno and (not lines[end - 1].strip() or lines[end - 1].lstrip().startswith('#')):
+            end -= 1
+        return end
 
-        return (
-            ''.join(lines[forward_start_index:forward_end_index]).replace('\n\n', '\n'),
-            ''.join(lines[backward_start_index:backward_end_index]).replace('\n\n', '\n'),
-        )
+    @staticmethod
+    def _check_function(file_path, node):
+        """
+        Checks that body of migration function can be joined with bodies of other migrations.
+        """
+        arguments = [getattr(argument, 'arg', None) or getattr(argument, 'id', None) for argument in node.args.args]
+        if arguments != ['database_api']:
+            raise IncorrectMigrationFile(
+                'Function %s of migration file %s should take only database_api argument' % (node.name, file_path, )
+            )
+        nodes = list(node.body)
+        while nodes:
+            child = nodes.pop()
+            if isinstance(child, ast.Return):
+                raise IncorrectMigrationFile(
+                    'Function %s of migration file %s returns at line %s' % (node.name, file_path, child.lineno, )
+                )
+            if not isinstance(child, (ast.FunctionDef, ast.ClassDef, ast.Lambda, )):
+                nodes.extend(ast.iter_child_nodes(child))
+
+    @staticmethod
+    def _get_function_body(lines, node, end):
+        """
+        Returns source of function body reindented to four spaces, comments before first statement
+        are kept. Body which only passes is empty.
+        """
+        if all(isinstance(statement, ast.Pass) for statement in node.body):
+            return ''
+        start = node.body[0].lineno - 1
+        while start > node.lineno and lines[start - 1].lstrip().startswith('#'):
+            start -= 1
+        indent = lines[node.body[0].lineno - 1][:node.body[0].col_offset]
+        body_lines = lines[start:end]
+        if indent != MigrationHelper.INDENT:
+            body_lines = [
+                MigrationHelper.INDENT + line[len(indent):] if line.startswith(indent) else line
+                for line in body_lines
+            ]
+        body = ''.join(body_lines).rstrip()
+        return body + '\n' if body else ''
+
+    @classmethod
+    def parse_migration_file(cls, file_path):
+        """
+        Parses python migration with ast, migration module is not imported.
+        :return: dictionary with next structure:
+        {
+            imports: list of source of top level import statements,
+            forward: source of forward function body indented by four spaces, empty if it only passes,
+            backward: same for backward function,
+            atomic: False if migration sets ATOMIC = False
+        }
+        :raises IncorrectMigrationFile: raises when file can't be parsed, has no forward or backward
+        function, they are async or there is other top level code than imports, docstring and ATOMIC
+        """
+        with open(file_path, 'rb') as descriptor:
+            source = descriptor.read()
+        try:
+            module = ast.parse(source, file_path)
+        except SyntaxError as e:
+            raise IncorrectMigrationFile('Failed to parse migration file %s: %s' % (file_path, e, ))
+        lines = source.decode('utf-8').splitlines(True)
+
+        result = {'imports': [], 'forward': None, 'backward': None, 'atomic': True}
+        for index, node in enumerate(module.body):
+            next_node = module.body[index + 1] if index + 1 < len(module.body) else None
+            end = cls._get_node_end(lines, node, next_node)
+            if isinstance(node, (ast.Import, ast.ImportFrom, )):
+                result['imports'].append(''.join(lines[node.lineno - 1:end]).rstrip() + '\n')
+            elif isinstance(node, ast.FunctionDef) and node.name in (
+                    MigrationHelper.MigrationDirection.FORWARD, MigrationHelper.MigrationDirection.BACKWARD,
+            ):
+                cls._check_function(file_path, node)
+                result[node.name] = cls._get_function_body(lines, node, end)
+            elif (
+                    isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                    isinstance(node.targets[0], ast.Name) and node.targets[0].id == 'ATOMIC'
+            ):
+                result['atomic'] = ast.literal_eval(node.value) is not False
+            elif not (index == 0 and isinstance(node, ast.Expr) and ast.get_docstring(module) is not None):
+                raise IncorrectMigrationFile(
+                    'Migration file %s has top level code at line %s, only imports, forward and backward '
+                    'functions are supported' % (file_path, node.lineno, )
+                )
+        if result['forward'] is None or result['backward'] is None:
+            raise IncorrectMigrationFile('Incorrect migration file found: %s' % file_path)
+        return result
 
 
 class MigrationHelper(object):
 
     MIGRATION_NAME_TEMPLATE = '%04d'
+    INDENT = '    '
     PASS_LINE = '    pass'
-    MIGRATION_TEMPLATE = """
+    MIGRATION_HEADER = """
 # -*- coding: utf-8 -*-
 
 # Use database_api execute method to call raw sql query.
-# execute(sql, params=None, return_result=None)
+# execute(sql, params=None, return_result=None, batch_size=None)
 #   sql: Raw SQL query
 #   params: arguments dict for query
 #   return_result: type of query result, constants for it
-#       are located in database_api.CursorResults class. Possible variants: ROWCOUNT, FETCHALL
-
+#       are located in database_api.CursorResults class. Possible variants: ROWCOUNT, FETCHALL, ITER
+#   batch_size: number of rows fetched at once for ITER result
+# Use database_api execute_many method to execute query for many params.
+# execute_many(sql, rows, page_size=None)
+#   sql: Raw SQL query
+#   rows: iterable of params for query, it is read by pages so it can be a generator
+#   page_size: number of rows sent to database in one call
+# Use database_api backfill method to update large table by chunks committed separately.
+# backfill(table, key_column, update_sql, chunk_size=None, pause=0)
+#   update_sql: Raw SQL query with %(start)s and %(end)s params of chunk key_column bounds
+"""
+    MIGRATION_TEMPLATE = MIGRATION_HEADER.replace('%', '%%') + """
 
 def forward(database_api):
 %s
@@ -125,16 +253,36 @@ def backward(database_api):
 
 """
     DIGITS_IN_MIGRATION_NUMBER = 4
+    SQL_FORWARD_SUFFIX = '.forward.sql'
+    SQL_BACKWARD_SUFFIX = '.backward.sql'
+
+    class MigrationFileType(object):
+        PYTHON = 'python'
+        SQL = 'sql'
 
     class MigrationDirection(object):
         FORWARD = 'forward'
         BACKWARD = 'backward'
 
+    class PackageState(object):
+        NOT_STARTED = 'not started'
+        UP_TO_DATE = 'up to date'
+        APPLIED = 'applied'
+        FAILED = 'failed'
+
     @classmethod
     def generate_migration_name(cls, name=None, current_number=1):
         prefix = cls.MIGRATION_NAME_TEMPLATE % current_number
         return prefix if not name else '%s_%s.py' % (prefix, name,)
 
+    @classmethod
+    def get_migration_number(cls, name):
+        """
+        :param name: migration name or file name. Example: 0010_initial
+        :return: integer migration number
+        """
+        return int(name[:cls.DIGITS_IN_MIGRATION_NUMBER])
+
     @classmethod
     def get_empty_migration_file_content(cls):
         return cls.MIGRATION_TEMPLATE % (cls.PASS_LINE, cls.PASS_LINE,)
@@ -146,10 +294,58 @@ def backward(database_api):
             file_descriptor.write(cls.get_empty_migration_file_content())
 
     @classmethod
-    def create_squashed_migration_file(cls, path_to_migrations, name, forward_content, backward_content):
-        migration_file_path = os.path.join(path_to_migrations, name)
-        with open(migration_file_path, 'w') as file_descriptor:
-            file_descriptor.write(cls.MIGRATION_TEMPLATE % (forward_content, backward_content,))
+    def write_squashed_migration_file(cls, file_path, migrations):
+        """
+        Writes migration which executes forward function bodies of given python migrations in their order
+        and backward function bodies in reverse order. Migration files are parsed one at a time, bodies are
+        written to temporary files as soon as they are parsed, so memory usage does not depend on number
+        of migrations.
+        :param migrations: list of migration dictionaries of get_migrations_list ordered by number
+        :raises IncorrectMigrationFile: raises when some migration can't be squashed
+        """
+        imports = []
+        backward_offsets = []
+        with TemporaryFile() as forward_file:
+            with TemporaryFile() as backward_file:
+                for migration in migrations:
+                    if migration['file_type'] != cls.MigrationFileType.PYTHON:
+                        raise IncorrectMigrationFile(
+                            'Plain sql migration %s can\'t be squashed' % migration['file_name']
+                        )
+                    content = FileSystemHelper.parse_migration_file(migration['file_path'])
+                    if not content['atomic']:
+                        raise IncorrectMigrationFile(
+                            'Non-atomic migration %s can\'t be squashed' % migration['file_name']
+                        )
+                    for import_source in content['imports']:
+                        if import_source not in imports:
+                            imports.append(import_source)
+                    comment = u'%s# %s\n' % (cls.INDENT, migration['file_name'], )
+                    if content['forward']:
+                        forward_file.write((comment + content['forward']).encode('utf-8'))
+                    if content['backward']:
+                        backward = (comment + content['backward']).encode('utf-8')
+                        backward_offsets.append((backward_file.tell(), len(backward), ))
+                        backward_file.write(backward)
+
+                # __future__ imports should be the first statements of module
+                imports.sort(key=lambda import_source: not import_source.startswith('from __future__'))
+                with open(file_path, 'wb') as file_descriptor:
+                    file_descriptor.write(cls.MIGRATION_HEADER.encode('utf-8'))
+                    if imports:
+                        file_descriptor.write((u'\n' + u''.join(imports)).encode('utf-8'))
+                    file_descriptor.write(b'\n\ndef forward(database_api):\n')
+                    if forward_file.tell():
+                        forward_file.seek(0)
+                        copyfileobj(forward_file, file_descriptor)
+                    else:
+                        file_descriptor.write((cls.PASS_LINE + '\n').encode('utf-8'))
+                    file_descriptor.write(b'\n\ndef backward(database_api):\n')
+                    for offset, size in reversed(backward_offsets):
+                        backward_file.seek(offset)
+                        file_descriptor.write(backward_file.read(size))
+                    if not backward_offsets:
+                        file_descriptor.write((cls.PASS_LINE + '\n').encode('utf-8'))
 
     @classmethod
     def get_migration_direction(cls, package_param, current_migration_number, migration_number):
@@ -184,22 +380,40 @@ def backward(database_api):
 
 class DatabaseHelper(object):
 
+    BULK_HISTORY_SIZE = 1000
+    HISTORY_STATS_COLUMNS = (
+        ('duration_ms', 'INTEGER', ),
+        ('statement_count', 'INTEGER', ),
+        ('rows_affected', 'BIGINT', ),
+    )
+    HISTORY_DIRECTION_COLUMN = ('direction', 'VARCHAR(10)', )
+
     @staticmethod
     def migration_history_exists():
+        return database_api.table_exists(rsm_config.history_table_name)
 
-        sql = '''
-            SELECT *
-            FROM information_schema.tables
-            WHERE table_name=%(history_table_name)s
-        '''
-
-        result = database_api.execute(
-            sql,
-            params={'history_table_name': rsm_config.history_table_name},
-            return_result='rowcount',
-        )
+    @staticmethod
+    def get_head_table_name():
+        """
+        Returns name of table which keeps latest applied migration of every package.
+        """
+        return '%s_head' % rsm_config.history_table_name
+
+    @staticmethod
+    def get_lock_name():
+        """
+        Returns name of advisory lock taken by migrate, it is shared by all nodes using the same history table.
+        """
+        return 'rsm_%s' % rsm_config.history_table_name
 
-        return True if result else False
+    @classmethod
+    def _get_bulk_size(cls, params_per_row):
+        """
+        Returns number of rows written with one query, so engine limit of query params is not exceeded.
+        """
+        if database_api.max_query_params is None:
+            return cls.BULK_HISTORY_SIZE
+        return max(1, min(cls.BULK_HISTORY_SIZE, (database_api.max_query_params - 1) // params_per_row))
 
     @classmethod
     def get_latest_migration_number(cls, package):
@@ -208,90 +422,336 @@ class DatabaseHelper(object):
             cls.create_history_table()
         else:
             sql = '''
-                SELECT name
+                SELECT version
                 FROM %s
-                WHERE package = %%s
-                ORDER BY id DESC LIMIT 1;
-            ''' % rsm_config.history_table_name
+                WHERE package = %%s;
+            ''' % cls.get_head_table_name()
             query_params = (package,)
 
             rows = database_api.execute(sql, params=query_params, return_result='fetchall')
-            if rows:
-                name = rows[0][0]
-                result = int(name.split('_')[0].strip('0'))
+            if rows and rows[0][0] is not None:
+                result = rows[0][0]
 
         return result
 
+    @classmethod
+    def get_latest_migration_numbers(cls):
+        """
+        Returns dictionary with number of latest applied migration of every package read from head table.
+        """
+        rows = database_api.execute(
+            'SELECT package, version FROM %s;' % cls.get_head_table_name(),
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        return dict((package, version or 0) for package, version in rows)
+
     @staticmethod
-    def create_history_table():
+    def get_history_latest_migration_numbers():
+        """
+        Returns dictionary with number of latest applied migration of every package read from
+        history table created by previous versions, which has no head table yet.
+        """
+        rows = database_api.execute(
+            'SELECT package, name FROM %s;' % rsm_config.history_table_name,
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        result = {}
+        for package, name in rows:
+            result[package] = max(result.get(package, 0), MigrationHelper.get_migration_number(name))
+        return result
+
+    @classmethod
+    def create_history_table(cls):
 
         sql = '''
             CREATE TABLE %s (
-                id SERIAL PRIMARY KEY,
+                id %s,
                 package VARCHAR(200) NOT NULL,
                 name VARCHAR(200) NOT NULL,
-                processed_at  TIMESTAMP default current_timestamp
+                version INTEGER,
+                direction VARCHAR(10),
+                processed_at  TIMESTAMP default current_timestamp,
+                duration_ms INTEGER,
+                statement_count INTEGER,
+                rows_affected BIGINT
             );
-        ''' % rsm_config.history_table_name
+        ''' % (rsm_config.history_table_name, database_api.auto_increment_primary_key, )
         database_api.execute(
             sql, params=(), return_result=None
         )
+        cls._create_history_index()
+        if database_api.table_exists(cls.get_head_table_name()):
+            database_api.execute('DELETE FROM %s' % cls.get_head_table_name(), params=(), return_result=None)
+        else:
+            cls._create_head_table()
         database_api.commit()
 
     @staticmethod
-    def drop_history_table():
+    def _create_history_index():
+        sql = 'CREATE INDEX %s_package_version ON %s (package, version)' % (
+            rsm_config.history_table_name, rsm_config.history_table_name,
+        )
+        database_api.execute(sql, params=(), return_result=None)
 
+    @classmethod
+    def _create_head_table(cls):
         sql = '''
-            DROP TABLE %s;
-        ''' % rsm_config.history_table_name
-        database_api.execute(
-            sql, params=(rsm_config.history_table_name,), return_result=None
+            CREATE TABLE %s (
+                package VARCHAR(200) NOT NULL PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                version INTEGER,
+                processed_at TIMESTAMP NULL,
+                digest VARCHAR(40)
+            );
+        ''' % cls.get_head_table_name()
+        database_api.execute(sql, params=(), return_result=None)
+
+    @classmethod
+    def upgrade_history_table(cls):
+        """
+        Adds columns and tables missing in history table created by previous versions. When version column
+        is added it is filled from migration names and (package, version) index is created. Rows written
+        before direction column was added are forward ones. When head table is created it is filled with
+        latest applied migrations, when its digest column is added it is filled from package migrations.
+        """
+        columns = database_api.get_table_columns(rsm_config.history_table_name)
+        missing_columns = [
+            column for column in cls.HISTORY_STATS_COLUMNS + (cls.HISTORY_DIRECTION_COLUMN, )
+            if column[0] not in columns
+        ]
+        for column_name, column_type in missing_columns:
+            sql = 'ALTER TABLE %s ADD COLUMN %s %s' % (rsm_config.history_table_name, column_name, column_type, )
+            database_api.execute(sql, params=(), return_result=None)
+
+        if 'version' not in columns:
+            database_api.execute(
+                'ALTER TABLE %s ADD COLUMN version INTEGER' % rsm_config.history_table_name,
+                params=(), return_result=None
+            )
+            rows = database_api.execute(
+                'SELECT DISTINCT name FROM %s' % rsm_config.history_table_name,
+                params=(), return_result=database_api.CursorResult.FETCHALL
+            )
+            database_api.execute_many(
+                'UPDATE %s SET version = %%s WHERE name = %%s' % rsm_config.history_table_name,
+                ((MigrationHelper.get_migration_number(row[0]), row[0], ) for row in rows)
+            )
+            cls._create_history_index()
+
+        head_table_exists = database_api.table_exists(cls.get_head_table_name())
+        if not head_table_exists:
+            cls._create_head_table()
+            sql = '''
+                INSERT INTO %s (package, name, version, processed_at)
+                SELECT package, name, version, processed_at FROM %s
+                WHERE id IN (
+                    SELECT max(id)
+                    FROM %s
+                    GROUP BY package
+                );
+            ''' % ((cls.get_head_table_name(), ) + (rsm_config.history_table_name, ) * 2)
+            database_api.execute(sql, params=(), return_result=None)
+
+        head_digest_missing = not head_table_exists or 'digest' not in database_api.get_table_columns(
+            cls.get_head_table_name()
         )
+        if head_table_exists and head_digest_missing:
+            database_api.execute(
+                'ALTER TABLE %s ADD COLUMN digest VARCHAR(40)' % cls.get_head_table_name(), params=(), return_result=None
+            )
+        if head_digest_missing:
+            rows = database_api.execute(
+                'SELECT package, version FROM %s' % cls.get_head_table_name(),
+                params=(), return_result=database_api.CursorResult.FETCHALL
+            )
+            database_api.execute_many(
+                'UPDATE %s SET digest = %%s WHERE package = %%s' % cls.get_head_table_name(),
+                ((cls._get_migrations_digest(package, version), package, ) for package, version in rows)
+            )
+
+        if missing_columns or 'version' not in columns or head_digest_missing:
+            database_api.commit()
+
+    @classmethod
+    def drop_history_table(cls):
+
+        for table_name in (rsm_config.history_table_name, cls.get_head_table_name(), ):
+            sql = '''
+                DROP TABLE %s;
+            ''' % table_name
+            database_api.execute(
+                sql, params=(), return_result=None
+            )
         database_api.commit()
 
     @staticmethod
-    def write_migration_history(name, package):
+    def _get_migrations_digest(package, version):
+        """
+        Returns digest of package migrations up to given version, None if package can't be imported.
+        """
+        try:
+            return MigrationCatalog.get(package).get_digest(version)
+        except IncorrectPackage:
+            return None
 
-        sql = '''
-            INSERT INTO %s(name, package)
-            VALUES (%%s, %%s);
-        ''' % rsm_config.history_table_name
-        database_api.execute(sql, params=(name, package, ), return_result=None)
+    @classmethod
+    def _get_head_upsert_sql(cls):
+        columns = ('package', 'name', 'version', 'processed_at', 'digest', )
+        return database_api.upsert_template % {
+            'table': cls.get_head_table_name(),
+            'columns': ', '.join(columns),
+            'values': '%s, %s, %s, current_timestamp, %s',
+            'key': columns[0],
+            'updates': ', '.join(
+                database_api.upsert_update_template % {'column': column} for column in columns[1:]
+            ),
+        }
 
-    @staticmethod
-    def delete_migration_history(name, package):
-        sql = '''
-            DELETE FROM %s
-            WHERE name=%%s and package=%%s
-        ''' % rsm_config.history_table_name
-        database_api.execute(sql, params=(name, package, ), return_result=None)
+    @classmethod
+    def _update_head(cls, package, name):
+        """
+        Points head row of package to given migration with one upsert, removes it when name is None.
+        Head row keeps digest of package migrations up to its version, which is compared with digest
+        of all package migrations by check. Runs in transaction of history change.
+        """
+        if name is None:
+            database_api.execute(
+                'DELETE FROM %s WHERE package = %%s' % cls.get_head_table_name(), params=(package, ),
+                return_result=None
+            )
+            return
+        version = MigrationHelper.get_migration_number(name)
+        database_api.execute(
+            cls._get_head_upsert_sql(),
+            params=(package, name, version, cls._get_migrations_digest(package, version), ),
+            return_result=None
+        )
 
     @staticmethod
-    def status(package=None):
-        migration_history_param = (rsm_config.history_table_name, ) * 2
-        if package:
+    def _get_previous_migration_name(name, package):
+        catalog = MigrationCatalog.get(package)
+        previous_number = catalog.previous_number(MigrationHelper.get_migration_number(name))
+        return None if previous_number is None else catalog.get_name(previous_number)
+
+    @classmethod
+    def _get_history_stats_values(cls, stats):
+        stats = stats or {}
+        return tuple(stats.get(column_name) for column_name, column_type in cls.HISTORY_STATS_COLUMNS)
+
+    @classmethod
+    def _write_history_rows(cls, names, package, direction, stats=None):
+        """
+        Writes history rows of several migrations with multi-row INSERT.
+        """
+        if stats is None:
+            stats = [None] * len(names)
+        bulk_size = cls._get_bulk_size(4 + len(cls.HISTORY_STATS_COLUMNS))
+        for start in range(0, len(names), bulk_size):
+            chunk = names[start:start + bulk_size]
             sql = '''
-                SELECT package, name, processed_at FROM  %s
-                WHERE id IN (
-                    SELECT max(id)
-                    FROM %s
-                    GROUP BY package
+                INSERT INTO %s(name, package, version, direction, duration_ms, statement_count, rows_affected)
+                VALUES %s;
+            ''' % (rsm_config.history_table_name, ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(chunk)))
+            params = []
+            for name, migration_stats in zip(chunk, stats[start:start + bulk_size]):
+                params.extend(
+                    (name, package, MigrationHelper.get_migration_number(name), direction, ) +
+                    cls._get_history_stats_values(migration_stats)
                 )
-                AND package = %%s
-                ORDER BY package;
-            '''
-            params = (package, )
-        else:
-            sql = '''
-                SELECT package, name, processed_at FROM  %s
-                WHERE id IN (
-                    SELECT max(id)
-                    FROM %s
-                    GROUP BY package
-                ) ORDER BY package;
-            '''
-            params = ()
-        sql = sql % migration_history_param
+            database_api.execute(sql, params=tuple(params), return_result=None)
+
+    @classmethod
+    def write_migration_history(cls, name, package, stats=None, update_head=True):
+        """
+        :param stats: optional dictionary with duration_ms, statement_count and rows_affected of migration
+        :param update_head: whether to point head row of package to migration
+        """
+        cls.write_migrations_history([name], package, None if stats is None else [stats], update_head)
+
+    @classmethod
+    def delete_migration_history(cls, name, package, stats=None, update_head=True):
+        """
+        Writes backward row of migration, history is append-only log, so rows are never deleted.
+        Head row of package is pointed to previous migration of package.
+        :param stats: optional dictionary with duration_ms, statement_count and rows_affected of migration
+        :param update_head: whether to point head row of package to previous migration
+        """
+        cls.delete_migrations_history([name], package, None if stats is None else [stats], update_head)
+
+    @classmethod
+    def write_migrations_history(cls, names, package, stats=None, update_head=True):
+        """
+        Writes history of several migrations with multi-row INSERT and points head row of package
+        to the latest of them.
+        :param stats: optional list of stats dictionaries in the same order as names
+        :param update_head: whether to point head row of package to the latest migration
+        """
+        cls._write_history_rows(names, package, MigrationHelper.MigrationDirection.FORWARD, stats)
+        if update_head:
+            cls._update_head(package, max(names, key=MigrationHelper.get_migration_number))
+
+    @classmethod
+    def delete_migrations_history(cls, names, package, stats=None, update_head=True):
+        """
+        Writes backward rows of several migrations with multi-row INSERT and points head row of package
+        to migration preceding the earliest of them.
+        :param stats: optional list of stats dictionaries in the same order as names
+        :param update_head: whether to point head row of package to previous migration
+        """
+        cls._write_history_rows(names, package, MigrationHelper.MigrationDirection.BACKWARD, stats)
+        if update_head:
+            cls._update_head(
+                package,
+                cls._get_previous_migration_name(min(names, key=MigrationHelper.get_migration_number), package)
+            )
+
+    @classmethod
+    def get_migrations_timings(cls, package=None):
+        """
+        Returns (package, name, duration_ms, statement_count, rows_affected) rows of applied migrations
+        with recorded duration, slowest first within each package. Only the latest history row of every
+        migration is used and only if it is forward one covered by head row of package, so rolled back
+        migrations are not reported.
+        """
+        sql = '''
+            SELECT history.package, history.name, history.duration_ms, history.statement_count, history.rows_affected
+            FROM %s history
+            JOIN %s head ON head.package = history.package AND history.version <= head.version
+            WHERE history.duration_ms IS NOT NULL AND (history.direction IS NULL OR history.direction = %%s)
+                AND history.id = (
+                    SELECT max(latest.id) FROM %s latest
+                    WHERE latest.package = history.package AND latest.name = history.name
+                ) %s
+            ORDER BY history.package, history.duration_ms DESC;
+        ''' % (
+            rsm_config.history_table_name, cls.get_head_table_name(), rsm_config.history_table_name,
+            'AND history.package = %s' if package else '',
+        )
+        params = (MigrationHelper.MigrationDirection.FORWARD, ) + ((package, ) if package else ())
+        return database_api.execute(sql, params=params, return_result=database_api.CursorResult.FETCHALL)
+
+    @classmethod
+    def get_head_digests(cls):
+        """
+        Returns dictionary with (latest applied migration name, digest) of every package from head table.
+        """
+        rows = database_api.execute(
+            'SELECT package, name, digest FROM %s;' % cls.get_head_table_name(),
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        return dict((package, (name, digest, )) for package, name, digest in rows)
+
+    @classmethod
+    def status(cls, package=None):
+        """
+        Returns latest applied migration of given package or of all packages from head table.
+        """
+        sql = '''
+            SELECT package, name, processed_at FROM %s
+            %s
+            ORDER BY package;
+        ''' % (cls.get_head_table_name(), 'WHERE package = %s' if package else '', )
+        params = (package, ) if package else ()
         rows = database_api.execute(
             sql, params=params, return_result=database_api.CursorResult.FETCHALL
         )
@@ -299,3 +759,141 @@ class DatabaseHelper(object):
         for row in rows:
             result[row[0]] = {'name': row[1], 'processed_at': row[2]}
         return result
+
+
+class HistoryIndex(object):
+    """
+    In-memory index of latest applied migration of every package. Index is loaded from
+    head table with a single query, after that all per package lookups are served from memory.
+    Index should be updated with add/remove when migrations are applied, it is safe
+    to update it from several threads.
+    """
+
+    def __init__(self, rows=()):
+        """
+        :param rows: iterable of (package, number of latest applied migration)
+        """
+        self._numbers = dict(rows)
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls):
+        return cls(DatabaseHelper.get_latest_migration_numbers().items())
+
+    def add(self, package, name):
+        with self._lock:
+            self._numbers[package] = MigrationHelper.get_migration_number(name)
+
+    def remove(self, package, name):
+        """
+        Points package to migration preceding given one in package migrations.
+        """
+        previous_number = MigrationCatalog.get(package).previous_number(MigrationHelper.get_migration_number(name))
+        with self._lock:
+            self._numbers[package] = previous_number or 0
+
+    def get_latest_migration_number(self, package):
+        return self._numbers.get(package, 0)
+
+
+class MigrationCatalog(object):
+    """
+    Cached list of package migrations. One catalog is kept per package, its directory
+    is scanned once and rescanned only when directory modification time changes.
+    Next, previous and latest migration numbers are found with binary search.
+    Digests of migration file names are computed once per scan.
+    """
+
+    _catalogs = {}
+    _lock = Lock()
+
+    def __init__(self, package):
+        self.package = package
+        self.directory = FileSystemHelper.get_package_migrations_directory(package)
+        self._directory_state = None
+        self._migrations = {}
+        self._numbers = []
+        self._digests = None
+
+    @classmethod
+    def get(cls, package):
+        """
+        Returns up to date catalog of given package.
+        """
+        with cls._lock:
+            catalog = cls._catalogs.get(package)
+            if catalog is None:
+                catalog = cls._catalogs[package] = cls(package)
+        catalog.refresh()
+        return catalog
+
+    def _get_directory_state(self):
+        try:
+            stat = os.stat(self.directory)
+        except OSError:
+            return None
+        return stat.st_ino, getattr(stat, 'st_mtime_ns', stat.st_mtime)
+
+    def refresh(self):
+        """
+        Rescans directory if it was changed since last scan.
+        """
+        directory_state = self._get_directory_state()
+        if directory_state is None:
+            self.directory = FileSystemHelper.get_package_migrations_directory(self.package)
+            directory_state = self._get_directory_state()
+        if directory_state != self._directory_state:
+            self._migrations = FileSystemHelper.scan_migrations_directory(self.directory)
+            self._numbers = sorted(self._migrations.keys())
+            self._digests = None
+            self._directory_state = directory_state
+
+    def invalidate(self):
+        """
+        Forces rescan on next refresh. Called after files are written to directory, because
+        modification time resolution of some file systems is too low to notice the change.
+        """
+        self._directory_state = None
+
+    @property
+    def migrations(self):
+        return self._migrations
+
+    @property
+    def numbers(self):
+        return self._numbers
+
+    @property
+    def latest_number(self):
+        return self._numbers[-1] if self._numbers else 0
+
+    def get_digest(self, number=None):
+        """
+        Returns sha1 hex digest of ordered file names of migrations with numbers up to given one,
+        of all migrations by default. Returns None if there are no such migrations.
+        """
+        numbers, digests = self._numbers, self._digests
+        if digests is None:
+            digests = []
+            digest = sha1()
+            for migration_number in numbers:
+                digest.update(self._migrations[migration_number]['file_name'].encode('utf-8') + b'\n')
+                digests.append(digest.hexdigest())
+            self._digests = digests
+        index = len(numbers) if number is None else bisect_right(numbers, number)
+        return digests[index - 1] if index else None
+
+    def get_name(self, number):
+        """
+        Returns name of migration with given number as it is written to history.
+        """
+        file_name = self._migrations[number]['file_name']
+        return FileSystemHelper.trim_sql_extension(FileSystemHelper.trim_py_extension(file_name))
+
+    def next_number(self, number):
+        index = bisect_right(self._numbers, number)
+        return self._numbers[index] if index < len(self._numbers) else None
+
+    def previous_number(self, number):
+        index = bisect_left(self._numbers, number)
+        return self._numbers[index - 1] if index else None
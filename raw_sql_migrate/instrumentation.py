@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+
+from bisect import bisect_left
+from threading import Lock, local
+
+try:
+    from time import perf_counter
+except ImportError:
+    from time import time as perf_counter
+
+__all__ = (
+    'instrumentation',
+    'StatementEvent',
+    'SlowStatementLog',
+    'JsonLinesExporter',
+    'PrometheusTextfileExporter',
+)
+
+
+class StatementEvent(object):
+    """
+    Statement executed by database api, given to instrumentation hooks.
+    :var sql: Raw SQL query
+    :var params: query params, list of params for execute_many pages
+    :var package: package of migration being applied, None outside of migration
+    :var migration: name of migration being applied, None outside of migration
+    :var duration: execution time in seconds, None in before execute hooks
+    :var rowcount: number of affected rows reported by driver, None if unknown
+    :var error: exception raised by driver, None if statement succeeded
+    """
+
+    __slots__ = ('sql', 'params', 'package', 'migration', 'duration', 'rowcount', 'error', 'started_at', )
+
+    def __init__(self, sql, params, package=None, migration=None):
+        self.sql = sql
+        self.params = params
+        self.package = package
+        self.migration = migration
+        self.duration = None
+        self.rowcount = None
+        self.error = None
+        self.started_at = None
+
+
+class Instrumentation(object):
+    """
+    Registry of statement hooks called by database api. Before execute hooks are called with
+    StatementEvent before statement is sent to database, after execute hooks are called with
+    the same event when statement is finished or failed. When no hooks are added database
+    api only checks enabled attribute. Hooks should be thread safe, they are called from
+    threads of parallel migrate. Errors of hooks are written to stderr and don't fail statements.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._before_execute_hooks = ()
+        self._after_execute_hooks = ()
+        self._configured_hooks = ()
+        self._context = local()
+
+    def _update_enabled(self):
+        self.enabled = bool(self._before_execute_hooks or self._after_execute_hooks)
+
+    def add_hook(self, before_execute=None, after_execute=None):
+        """
+        :param before_execute: callable taking StatementEvent
+        :param after_execute: callable taking StatementEvent
+        """
+        if before_execute is not None:
+            self._before_execute_hooks += (before_execute, )
+        if after_execute is not None:
+            self._after_execute_hooks += (after_execute, )
+        self._update_enabled()
+
+    def remove_hook(self, hook):
+        self._before_execute_hooks = tuple(item for item in self._before_execute_hooks if item != hook)
+        self._after_execute_hooks = tuple(item for item in self._after_execute_hooks if item != hook)
+        self._update_enabled()
+
+    def configure(self, config):
+        """
+        Replaces hooks created from previous config with slow statement log and exporters
+        enabled in given config. Hooks added with add_hook are kept.
+        """
+        for hook in self._configured_hooks:
+            self.remove_hook(hook)
+            if hasattr(hook, 'close'):
+                hook.close()
+
+        hooks = []
+        if config.slow_statement_threshold is not None:
+            hooks.append(SlowStatementLog(config.slow_statement_threshold))
+        if config.statement_log:
+            hooks.append(JsonLinesExporter(config.statement_log))
+        if config.prometheus_textfile:
+            hooks.append(PrometheusTextfileExporter(config.prometheus_textfile))
+        for hook in hooks:
+            self.add_hook(after_execute=hook)
+        self._configured_hooks = tuple(hooks)
+
+    def flush(self):
+        """
+        Asks hooks which aggregate data, like PrometheusTextfileExporter, to write it.
+        """
+        for hook in self._after_execute_hooks:
+            if hasattr(hook, 'flush'):
+                self._call_hook(hook.flush)
+
+    @staticmethod
+    def _call_hook(hook, *args):
+        try:
+            hook(*args)
+        except Exception as e:
+            sys.stderr.write('Instrumentation hook %r failed: %s\n' % (hook, e, ))
+
+    def set_context(self, package=None, migration=None):
+        """
+        Sets migration which statements executed in current thread belong to.
+        """
+        self._context.package = package
+        self._context.migration = migration
+
+    def before_execute(self, sql, params, package=None, migration=None):
+        """
+        :param package: package of migration, taken from context of current thread if not given
+        :param migration: name of migration, taken from context of current thread if not given
+        """
+        if package is None:
+            package, migration = getattr(self._context, 'package', None), getattr(self._context, 'migration', None)
+        event = StatementEvent(sql, params, package, migration)
+        for hook in self._before_execute_hooks:
+            self._call_hook(hook, event)
+        event.started_at = perf_counter()
+        return event
+
+    def after_execute(self, event, rowcount=None, error=None):
+        event.duration = perf_counter() - event.started_at
+        event.rowcount = rowcount
+        event.error = error
+        for hook in self._after_execute_hooks:
+            self._call_hook(hook, event)
+
+
+class SlowStatementLog(object):
+    """
+    After execute hook which writes statements executed longer than threshold seconds.
+    """
+
+    def __init__(self, threshold, output=None):
+        self.threshold = threshold
+        self.output = output or sys.stderr
+        self._lock = Lock()
+
+    def __call__(self, event):
+        if event.duration < self.threshold:
+            return
+        with self._lock:
+            self.output.write('Slow statement (%.3fs) in %s %s: %s\n' % (
+                event.duration, event.package, event.migration, ' '.join(event.sql.split()),
+            ))
+
+
+class JsonLinesExporter(object):
+    """
+    After execute hook which appends one JSON object per statement to file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = None
+        self._lock = Lock()
+
+    def __call__(self, event):
+        line = json.dumps({
+            'package': event.package,
+            'migration': event.migration,
+            'sql': event.sql,
+            'duration': event.duration,
+            'rowcount': event.rowcount,
+            'error': str(event.error) if event.error is not None else None,
+        })
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_path, 'a')
+            self._file.write(line + '\n')
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class PrometheusTextfileExporter(object):
+    """
+    After execute hook which collects statement latency histogram per package and migration
+    and writes it in Prometheus text format, for example for node_exporter textfile collector.
+    File is replaced atomically on flush.
+    """
+
+    default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, )
+    metric_name = 'rsm_statement_duration_seconds'
+
+    def __init__(self, file_path, buckets=None):
+        self.file_path = file_path
+        self.buckets = tuple(sorted(buckets or self.default_buckets))
+        self._histograms = {}
+        self._lock = Lock()
+
+    def __call__(self, event):
+        key = (event.package or '', event.migration or '', )
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect_left(self.buckets, event.duration)
+            if index < len(self.buckets):
+                histogram['buckets'][index] += 1
+            histogram['sum'] += event.duration
+            histogram['count'] += 1
+
+    @staticmethod
+    def _escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def render(self):
+        lines = [
+            '# HELP %s Duration of statements executed by rsm.' % self.metric_name,
+            '# TYPE %s histogram' % self.metric_name,
+        ]
+        with self._lock:
+            for (package, migration), histogram in sorted(self._histograms.items()):
+                labels = 'package="%s",migration="%s"' % (self._escape(package), self._escape(migration), )
+                cumulative = 0
+                for bucket, count in zip(self.buckets, histogram['buckets']):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%r"} %d' % (self.metric_name, labels, float(bucket), cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (self.metric_name, labels, histogram['count']))
+                lines.append('%s_sum{%s} %r' % (self.metric_name, labels, histogram['sum']))
+                lines.append('%s_count{%s} %d' % (self.metric_name, labels, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        temporary_file_path = '%s.%d.tmp' % (self.file_path, os.getpid())
+        with open(temporary_file_path, 'w') as file_descriptor:
+            file_descriptor.write(self.render())
+        os.rename(temporary_file_path, self.file_path)
+
+    def close(self):
+        if self._histograms:
+            self.flush()
+
+
+instrumentation = Instrumentation()
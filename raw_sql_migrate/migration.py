@@ -1,20 +1,56 @@
 # -*- coding: utf-8 -*-
 
-from os import path
+from os import path, remove, rename
 
 from importlib import import_module
+from inspect import isfunction
 from sys import stdout
+from time import time
 
 from raw_sql_migrate import rsm_config
-from raw_sql_migrate.helpers import MigrationHelper, FileSystemHelper, DatabaseHelper
+from raw_sql_migrate.helpers import MigrationHelper, FileSystemHelper, DatabaseHelper, MigrationCatalog
 from raw_sql_migrate.engines import database_api
-from raw_sql_migrate.exceptions import IncorrectMigrationFile
+from raw_sql_migrate.exceptions import IncorrectMigrationFile, NonAtomicMigrationFailedException
+from raw_sql_migrate.instrumentation import instrumentation
 
 __all__ = (
     'Migration',
+    'SqlMigrationModule',
 )
 
 
+class SqlMigrationModule(object):
+    """
+    Stands in for python module of plain sql migration. Its forward and backward functions
+    execute content of NNNN_name.forward.sql and NNNN_name.backward.sql files, backward
+    function is defined only if backward file exists. Files are executed statement by statement
+    without loading them into memory. Migration is non-atomic if first line of forward file
+    is NON_ATOMIC_MARKER comment.
+    """
+
+    NON_ATOMIC_MARKER = '-- rsm: atomic=false'
+
+    def __init__(self, directory, name):
+        self.__name__ = name
+        self.forward_file_path = path.join(directory, name + MigrationHelper.SQL_FORWARD_SUFFIX)
+        self.backward_file_path = path.join(directory, name + MigrationHelper.SQL_BACKWARD_SUFFIX)
+        self.forward = self._get_handler(self.forward_file_path)
+        if path.exists(self.backward_file_path):
+            self.backward = self._get_handler(self.backward_file_path)
+        with open(self.forward_file_path, 'rb') as file_descriptor:
+            first_line = file_descriptor.readline().decode('utf-8', 'replace')
+        self.ATOMIC = ' '.join(first_line.lower().split()) != self.NON_ATOMIC_MARKER
+
+    def __repr__(self):
+        return '<sql migration %s>' % self.__name__
+
+    @staticmethod
+    def _get_handler(file_path):
+        def handler(database_api):
+            database_api.execute_file(file_path)
+        return handler
+
+
 class Migration(object):
     """
     Migration module wrapper
@@ -27,8 +63,11 @@ class Migration(object):
     :var fs_migration_directory: string containing file system path to migration_directory
     Example: ../package_a/package_b/migrations/
     :var fs_file_name: string containing file name of migration
-    Example: 0001_initial.py
-    :var module: module object of migration
+    Example: 0001_initial.py or 0001_initial.forward.sql
+    :var module: module object of migration, SqlMigrationModule for plain sql migrations
+    :var stats: dictionary with duration_ms, statement_count and rows_affected of last migrate call
+    :var atomic: False if migration module sets ATOMIC = False. Such migration is executed in autocommit
+    mode, for queries which can't run inside transaction, like CREATE INDEX CONCURRENTLY.
     """
     py_package = None
     py_migration_package = None
@@ -37,62 +76,148 @@ class Migration(object):
     fs_migration_directory = None
     fs_file_name = None
     module = None
+    stats = None
+    atomic = True
 
     def __init__(self, py_package, py_module_name=None):
         self.py_package = py_package
-        self.fs_migration_directory = FileSystemHelper.get_package_migrations_directory(py_package)
+        self.fs_migration_directory = MigrationCatalog.get(py_package).directory
+        if FileSystemHelper.is_sql_migration_file(py_module_name):
+            self.py_module_name = FileSystemHelper.trim_sql_extension(py_module_name)
+            self.fs_file_name = py_module_name
+            self.module = SqlMigrationModule(self.fs_migration_directory, self.py_module_name)
+            self.atomic = self.module.ATOMIC
+            return
+
         self.py_module_name = FileSystemHelper.trim_py_extension(py_module_name)
-        self.fs_file_name = '%s.py' % py_module_name
+        self.fs_file_name = '%s.py' % self.py_module_name
         self.py_module, self.py_module_name = FileSystemHelper.get_migration_python_path_and_name(
             py_module_name, py_package
         )
         self.module = import_module(self.py_module)
+        self.atomic = getattr(self.module, 'ATOMIC', True) is not False
 
-    def migrate(self, migration_direction):
+    def migrate(self, migration_direction, commit=True):
         """
         Migrates migration found in self.module towards to given direction.
         :param migration_direction: Direction towards which to migrate. Can be forward or backward.
+        :param commit: if False only handler is executed, caller should write migration history
+        and commit transaction itself. Used to apply several migrations in one transaction.
+        Non-atomic migrations are always committed.
+        :raises NonAtomicMigrationFailedException: raises when non-atomic migration failed, its
+        executed statements are not rolled back
         :return:
         """
 
+        handler = self.get_handler(migration_direction)
+        stdout.write('Migrating %s to migration %s in package %s%s\n' % (
+            migration_direction, self.py_module_name, self.py_package, '' if self.atomic else ' in autocommit mode',
+        ))
+
+        instrumentation.set_context(self.py_package, self.py_module_name)
+        try:
+            started_at = time()
+            statements_executed, rows_affected = database_api.statements_executed, database_api.rows_affected
+            if self.atomic and not commit:
+                database_api.set_batched(True)
+                try:
+                    handler(database_api)
+                finally:
+                    database_api.set_batched(False)
+            elif self.atomic:
+                handler(database_api)
+            else:
+                self._run_in_autocommit(handler, migration_direction)
+                commit = True
+            self.stats = {
+                'duration_ms': int((time() - started_at) * 1000),
+                'statement_count': database_api.statements_executed - statements_executed,
+                'rows_affected': database_api.rows_affected - rows_affected,
+            }
+            if commit:
+                if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
+                    self.write_migration_history()
+                else:
+                    self.delete_migration_history()
+                database_api.commit()
+        except Exception as e:
+            database_api.rollback()
+            database_api.release_connection()
+            raise e
+        finally:
+            instrumentation.set_context()
+
+    def _run_in_autocommit(self, handler, migration_direction):
+        """
+        Runs handler of non-atomic migration in autocommit mode. Migration history is written
+        by caller in transaction after handler succeeded.
+        """
+        database_api.set_autocommit(True)
+        statements_executed = database_api.statements_executed
+        try:
+            handler(database_api)
+        except Exception as e:
+            try:
+                database_api.set_autocommit(False)
+            except Exception:
+                pass
+            raise self.get_non_atomic_failure(
+                migration_direction, e, database_api.statements_executed - statements_executed
+            )
+        database_api.set_autocommit(False)
+
+    def get_non_atomic_failure(self, migration_direction, error, statements_executed):
+        """
+        Returns exception describing failure of non-atomic migration and how to recover from it.
+        """
+        return NonAtomicMigrationFailedException(
+            'Non-atomic migration %s of package %s failed to migrate %s: %s\n'
+            '%d statements executed before failure were committed and are not rolled back, migration '
+            'history is not changed. Check state of database, for example drop invalid index left by '
+            'CREATE INDEX CONCURRENTLY, make migration statements safe to run again (IF NOT EXISTS, '
+            'IF EXISTS) and run migrate again.' % (
+                self.py_module_name, self.py_package, migration_direction, error, statements_executed,
+            )
+        )
+
+    def get_handler(self, migration_direction, allow_async=False):
+        """
+        Returns forward or backward function of migration module.
+        :param allow_async: whether handler can be coroutine function, only AsyncApi can apply them
+        :raises IncorrectMigrationFile: raises if module has no function for given direction
+        or it is coroutine function and allow_async is False
+        """
         assert self.module is not None
 
-        if hasattr(self.module, migration_direction):
-            handler = getattr(self.module, migration_direction)
-            stdout.write('Migrating %s to migration %s in package %s\n' % (
-                migration_direction, self.py_module_name, self.py_package,
-            ))
-        else:
+        if not hasattr(self.module, migration_direction):
             raise IncorrectMigrationFile('Module %s has no %s function' % (
                 self.module, migration_direction,
             ))
+        handler = getattr(self.module, migration_direction)
+        if not allow_async and self.is_async_handler(handler):
+            raise IncorrectMigrationFile('Module %s has async %s function, apply it with AsyncApi' % (
+                self.module, migration_direction,
+            ))
+        return handler
 
-        try:
-            handler(database_api)
-            if migration_direction == MigrationHelper.MigrationDirection.FORWARD:
-                self.write_migration_history()
-            else:
-                self.delete_migration_history()
-            database_api.commit()
-        except Exception as e:
-            if not database_api._connection.closed:
-                database_api.rollback()
-                database_api._connection.close()
-            raise e
+    @staticmethod
+    def is_async_handler(handler):
+        # CO_COROUTINE flag, checked by code flags to keep working on python versions without asyncio
+        return isfunction(handler) and bool(handler.__code__.co_flags & 0x80)
 
     def write_migration_history(self):
         """
         Writes migrate history entity for given migration
         :return:
         """
-        DatabaseHelper.write_migration_history(self.py_module_name, self.py_package)
+        DatabaseHelper.write_migration_history(self.py_module_name, self.py_package, self.stats)
 
     def delete_migration_history(self):
         """
-        Deletes migrate history entity in DB for given migration
+        Writes backward migrate history entity in DB for given migration
         :return:
         """
-        DatabaseHelper.delete_migration_history(self.py_module_name, self.py_package)
+        DatabaseHelper.delete_migration_history(self.py_module_name, self.py_package, self.stats)
 
     @staticmethod
     def create(py_package, name):
@@ -101,28 +226,45 @@ class Migration(object):
         :param name: new migration name given by user. Example: initial
         :return:
         """
-        current_migration_number = FileSystemHelper.get_file_system_latest_migration_number(py_package)
-        fs_migration_directory = FileSystemHelper.get_package_migrations_directory(py_package)
-        fs_file_name = MigrationHelper.generate_migration_name(name, current_migration_number + 1)
-        MigrationHelper.create_migration_file(fs_migration_directory, fs_file_name)
+        catalog = MigrationCatalog.get(py_package)
+        fs_file_name = MigrationHelper.generate_migration_name(name, catalog.latest_number + 1)
+        MigrationHelper.create_migration_file(catalog.directory, fs_file_name)
+        catalog.invalidate()
         return Migration(py_package, FileSystemHelper.trim_py_extension(fs_file_name))
 
     @staticmethod
-    def create_squashed(py_package, name, migration_number, forward_content, backward_content):
+    def create_squashed(py_package, name, migrations):
         """
-        Creates squashed migration and binds current instance to result module
+        Creates migration with number of first given migration, which executes all of them,
+        renames squashed migrations with 'squashed_' prefix and binds current instance to result module.
+        Squashed migrations are renamed only after result file is written.
         :param name: new migration name given by user. Example: initial
-        :param migration_number: first squashed migration number
-        :param forward_content: forward content of all squashed migrations
-        :param backward_content: backward content of all squashed migrations
+        :param migrations: list of migration dictionaries of get_migrations_list ordered by number
+        :raises IncorrectMigrationFile: raises when some migration can't be squashed
         :return:
         """
+        migration_number = MigrationHelper.get_migration_number(migrations[0]['file_name'])
         if name is None:
             name = '%04d_squashed.py' % migration_number
         else:
             name = MigrationHelper.generate_migration_name(name, migration_number)
-        fs_migration_directory = FileSystemHelper.get_package_migrations_directory(py_package)
-        fs_file_path = path.join(fs_migration_directory, name)
-        with open(fs_file_path, 'w') as file_descriptor:
-            file_descriptor.write(MigrationHelper.MIGRATION_TEMPLATE % (forward_content, backward_content, ))
+        catalog = MigrationCatalog.get(py_package)
+        fs_file_path = path.join(catalog.directory, name)
+        # temporary file name does not look like migration, so it is not found by migrations scan
+        temporary_file_path = fs_file_path + '.tmp'
+        try:
+            MigrationHelper.write_squashed_migration_file(temporary_file_path, migrations)
+        except Exception:
+            if path.exists(temporary_file_path):
+                remove(temporary_file_path)
+            raise
+
+        for migration in migrations:
+            rename(
+                migration['file_path'],
+                path.join(migration['file_directory'], 'squashed_%s' % migration['file_name'])
+            )
+        rename(temporary_file_path, fs_file_path)
+        catalog.invalidate()
+        stdout.write('Squashed %s migrations into %s\n' % (len(migrations), name, ))
         return Migration(py_package, FileSystemHelper.trim_py_extension(name))
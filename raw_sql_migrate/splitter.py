@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import re
+
+__all__ = (
+    'SqlStatementSplitter',
+)
+
+
+class SqlStatementSplitter(object):
+    """
+    Splits SQL script into statements reading it by chunks, so memory usage does not depend
+    on script size, only on size of the longest statement. Semicolons inside quoted strings,
+    quoted identifiers, comments and PostgreSQL dollar-quoted strings do not end statement.
+    Statements containing only comments are skipped. Block comments are not nested.
+    :var file_object: script opened in binary mode
+    :var chunk_size: number of bytes read at once
+    :var backslash_escapes: whether backslash escapes quote inside strings, like in MySQL. Otherwise
+    backslash escapes quote only inside PostgreSQL escape strings with E prefix: E'it\\'s'
+    :var bytes_read: number of bytes read from file_object so far
+    """
+
+    NORMAL = 'normal'
+    QUOTE = 'quote'
+    LINE_COMMENT = 'line_comment'
+    BLOCK_COMMENT = 'block_comment'
+    DOLLAR_QUOTE = 'dollar_quote'
+
+    default_chunk_size = 1024 * 1024
+    special_re = re.compile(r'[;\'"`$/-]')
+    dollar_tag_re = re.compile(r'\$(?:[^\W\d]\w*)?\$', re.UNICODE)
+    dollar_tag_prefix_re = re.compile(r'\$\w*\Z', re.UNICODE)
+    identifier_char_re = re.compile(r'[\w$]', re.UNICODE)
+
+    def __init__(self, file_object, chunk_size=None, backslash_escapes=False, encoding='utf-8'):
+        self.file_object = file_object
+        self.chunk_size = chunk_size or self.default_chunk_size
+        self.backslash_escapes = backslash_escapes
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.bytes_read = 0
+
+    def _read(self):
+        data = self.file_object.read(self.chunk_size)
+        self.bytes_read += len(data)
+        return self.decoder.decode(data, final=not data), not data
+
+    @staticmethod
+    def _get_preceding_text(buffer, pos, pieces, size):
+        """
+        Returns up to size characters of statement preceding pos, part of them can be in pieces read before.
+        """
+        text = buffer[max(pos - size, 0):pos]
+        index = len(pieces)
+        while len(text) < size and index:
+            index -= 1
+            text = pieces[index][len(text) - size:] + text
+        return text
+
+    def _is_escape_string(self, buffer, pos, pieces):
+        """
+        Returns whether quote at pos starts PostgreSQL escape string, it is prefixed by E not being
+        the last character of identifier.
+        """
+        text = self._get_preceding_text(buffer, pos, pieces, 2)
+        return text[-1:] in ('E', 'e') and not (len(text) == 2 and self.identifier_char_re.match(text[0]))
+
+    def __iter__(self):
+        buffer, eof = self._read()
+        pieces = []
+        start = pos = 0
+        state = self.NORMAL
+        quote = None
+        escapes = False
+        has_content = False
+
+        while True:
+            need_more = False
+            length = len(buffer)
+
+            if state == self.NORMAL:
+                match = self.special_re.search(buffer, pos)
+                next_pos = match.start() if match else length
+                if not has_content and buffer[pos:next_pos].strip():
+                    has_content = True
+                pos = next_pos
+                if match is None:
+                    need_more = True
+                else:
+                    char = buffer[pos]
+                    if char == ';':
+                        if has_content:
+                            pieces.append(buffer[start:pos])
+                            yield ''.join(pieces).strip()
+                        pieces = []
+                        pos += 1
+                        start = pos
+                        has_content = False
+                    elif char in '\'"`':
+                        state, quote, has_content = self.QUOTE, char, True
+                        escapes = self.backslash_escapes or (
+                            char == '\'' and self._is_escape_string(buffer, pos, pieces)
+                        )
+                        pos += 1
+                    elif char in '-/':
+                        if pos + 1 >= length and not eof:
+                            need_more = True
+                        elif buffer[pos + 1:pos + 2] == ('-' if char == '-' else '*'):
+                            state = self.LINE_COMMENT if char == '-' else self.BLOCK_COMMENT
+                            pos += 2
+                        else:
+                            has_content = True
+                            pos += 1
+                    else:
+                        tag_match = self.dollar_tag_re.match(buffer, pos)
+                        previous_char = buffer[pos - 1] if pos else (pieces[-1][-1:] if pieces else '')
+                        if previous_char and self.identifier_char_re.match(previous_char):
+                            tag_match = None
+                        elif tag_match is None and not eof and self.dollar_tag_prefix_re.match(buffer, pos):
+                            need_more = True
+                        has_content = True
+                        if need_more:
+                            pass
+                        elif tag_match is None:
+                            pos += 1
+                        else:
+                            state, quote = self.DOLLAR_QUOTE, tag_match.group(0)
+                            pos = tag_match.end()
+
+            elif state == self.QUOTE:
+                index = buffer.find(quote, pos)
+                if escapes:
+                    backslash_index = buffer.find('\\', pos, index if index != -1 else length)
+                    if backslash_index != -1:
+                        if backslash_index + 1 >= length and not eof:
+                            pos = backslash_index
+                            need_more = True
+                        else:
+                            pos = backslash_index + 2
+                        index = None
+                if index is None:
+                    pass
+                elif index == -1:
+                    pos = length
+                    need_more = True
+                else:
+                    state = self.NORMAL
+                    pos = index + 1
+
+            elif state == self.LINE_COMMENT:
+                index = buffer.find('\n', pos)
+                if index == -1:
+                    pos = length
+                    need_more = True
+                else:
+                    state = self.NORMAL
+                    pos = index + 1
+
+            else:
+                terminator = '*/' if state == self.BLOCK_COMMENT else quote
+                index = buffer.find(terminator, pos)
+                if index == -1:
+                    pos = max(pos, length - len(terminator) + 1)
+                    need_more = True
+                else:
+                    state = self.NORMAL
+                    pos = index + len(terminator)
+
+            if need_more:
+                if eof:
+                    break
+                pieces.append(buffer[start:pos])
+                data, eof = self._read()
+                buffer = buffer[pos:] + data
+                start = pos = 0
+
+        pieces.append(buffer[start:])
+        if has_content:
+            statement = ''.join(pieces).strip()
+            if statement:
+                yield statement
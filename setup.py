@@ -2,7 +2,7 @@
 
 from setuptools import setup, find_packages
 
-__version__ = '0.3.4'
+__version__ = '0.4.0'
 
 requirements = []
 
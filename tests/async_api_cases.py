@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from asyncio import gather, new_event_loop
+from os import makedirs, path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from raw_sql_migrate import Config
+from raw_sql_migrate.async_api import AsyncApi
+from raw_sql_migrate.engines import database_api
+from raw_sql_migrate.engines.asyncpg import DatabaseApi as AsyncpgDatabaseApi
+from raw_sql_migrate.exceptions import IncorrectMigrationFile, RawSqlMigrateException
+from raw_sql_migrate.helpers import MigrationHelper, MigrationCatalog
+
+from tests.base import BaseTestCase
+
+
+__all__ = (
+    'AsyncApiTestCase',
+)
+
+
+class AsyncApiTestCase(BaseTestCase):
+
+    migrations = (
+        ('0001_async_create.py', 'def', "database_api.execute('CREATE TABLE async_test (id INTEGER)')",
+         "database_api.execute('DROP TABLE async_test')"),
+        ('0002_async_insert.py', 'async def', "await database_api.execute_many("
+         "'INSERT INTO async_test (id) VALUES (%s)', ((number, ) for number in range(5)))",
+         "await database_api.execute('DELETE FROM async_test')"),
+    )
+
+    def setUp(self):
+        super(AsyncApiTestCase, self).setUp()
+        self.directory = mkdtemp()
+        makedirs(self.file_system_test_migrations_path)
+        with open(self.file_system_path_to_init_py_in_migrations_directory, 'w') as file_descriptor:
+            file_descriptor.write(MigrationHelper.INIT_FILE_TEMPLATE)
+        for file_name, definition, forward, backward in self.migrations:
+            with open(path.join(self.file_system_test_migrations_path, file_name), 'w') as file_descriptor:
+                file_descriptor.write(
+                    '%s forward(database_api):\n    %s\n\n\n%s backward(database_api):\n    %s\n' % (
+                        definition, forward, definition, backward,
+                    )
+                )
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+        self.loop = new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        rmtree(self.directory)
+        super(AsyncApiTestCase, self).tearDown()
+
+    def get_api(self, name):
+        return AsyncApi(Config({'engine': 'tests.async_sqlite', 'name': path.join(self.directory, name)}))
+
+    def test_migrate_many_databases(self):
+        apis = [self.get_api('test_%d.db' % number) for number in range(3)]
+
+        async def migrate():
+            results = await gather(*(api.migrate(self.python_path_to_test_package) for api in apis))
+            statuses = await gather(*(api.status() for api in apis))
+            rows = await apis[0].execute(
+                'SELECT count(*) FROM async_test', return_result=apis[0].database_api.CursorResult.FETCHALL
+            )
+            await gather(*(api.close() for api in apis))
+            return results, statuses, rows
+
+        results, statuses, rows = self.loop.run_until_complete(migrate())
+        for result in results:
+            self.assertEqual(
+                result[self.python_path_to_test_package]['applied'], ['0001_async_create', '0002_async_insert']
+            )
+        for status in statuses:
+            self.assertEqual(status[self.python_path_to_test_package]['name'], '0002_async_insert')
+        self.assertEqual(rows[0][0], 5)
+
+    def test_migrate_backward(self):
+        api = self.get_api('test.db')
+
+        async def migrate():
+            await api.migrate(self.python_path_to_test_package)
+            await api.migrate(self.python_path_to_test_package, 0)
+            status = await api.status()
+            await api.close()
+            return status
+
+        self.assertEqual(self.loop.run_until_complete(migrate()), {})
+
+    def test_async_handler_is_rejected_by_sync_api(self):
+        from raw_sql_migrate.migration import Migration
+
+        migration = Migration(self.python_path_to_test_package, '0002_async_insert')
+        self.assertRaises(IncorrectMigrationFile, migration.get_handler, MigrationHelper.MigrationDirection.FORWARD)
+
+    def test_backfill_is_not_supported(self):
+        api = self.get_api('test.db')
+
+        def backfill():
+            database_api.backfill('async_test', 'id', 'UPDATE async_test SET id = id')
+
+        async def run():
+            database_api_instance = await api._fork_database_api()
+            try:
+                await api._run_sync(database_api_instance, backfill)
+            finally:
+                await database_api_instance.release_connection()
+                await api.close()
+
+        self.assertRaises(RawSqlMigrateException, self.loop.run_until_complete, run())
+
+    def test_asyncpg_rowcount(self):
+        self.assertEqual(AsyncpgDatabaseApi._get_rowcount('INSERT 0 5'), 5)
+        self.assertEqual(AsyncpgDatabaseApi._get_rowcount('UPDATE 2'), 2)
+        self.assertEqual(AsyncpgDatabaseApi._get_rowcount('CREATE TABLE'), None)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from sqlite3 import connect
+
+from raw_sql_migrate.engines.async_base import AsyncBaseApi
+
+__all__ = (
+    'DatabaseApi',
+)
+
+
+class DatabaseApi(AsyncBaseApi):
+    """
+    Asyncio engine for AsyncApi tests. Queries are executed by sqlite3 synchronously,
+    pool is a list of idle connections to database file given as name.
+    """
+
+    engine = __name__
+    transactional_ddl = True
+    auto_increment_primary_key = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    max_query_params = 999
+    placeholder_format = '?%d'
+
+    async def _create_pool(self):
+        return []
+
+    async def _close_pool(self, pool):
+        while pool:
+            pool.pop().close()
+
+    async def _acquire(self, pool):
+        if pool:
+            return pool.pop()
+        return connect(self.name, isolation_level=None, check_same_thread=False)
+
+    async def _release(self, pool, connection):
+        pool.append(connection)
+
+    async def _execute(self, connection, sql, params, fetch):
+        cursor = connection.execute(sql, params)
+        return (cursor.fetchall() if fetch else None), cursor.rowcount
+
+    async def _execute_page(self, connection, sql, page):
+        return connection.executemany(sql, page).rowcount
+
+    async def table_exists(self, table_name):
+        rows = await self.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %(table_name)s",
+            params={'table_name': table_name}, return_result=self.CursorResult.FETCHALL
+        )
+        return bool(rows)
+
+    async def get_table_columns(self, table_name):
+        rows = await self.execute('PRAGMA table_info(%s)' % table_name, return_result=self.CursorResult.FETCHALL)
+        return set(row[1].lower() for row in rows)
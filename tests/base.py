@@ -42,13 +42,14 @@ class DatabaseTestCase(BaseTestCase):
         cls.api = Api(cls.config)
 
     def tearDown(self):
-        try:
-            database_api.execute(
-                '''
-                DROP TABLE %s;
-                ''' % self.config.history_table_name
-            )
-            database_api.commit()
-        except:
-            pass
+        for table_name in (self.config.history_table_name, '%s_head' % self.config.history_table_name, ):
+            try:
+                database_api.execute(
+                    '''
+                    DROP TABLE %s;
+                    ''' % table_name
+                )
+                database_api.commit()
+            except:
+                database_api.rollback()
         super(DatabaseTestCase, self).tearDown()
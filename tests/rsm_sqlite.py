@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+RSM_CONFIG = {
+    'database': {
+        'engine': 'raw_sql_migrate.engines.sqlite3',
+        'name': ':memory:',
+    },
+    'history_table_name': 'migration_history',
+    'packages': [
+        'tests.test_package',
+    ],
+}
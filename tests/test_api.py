@@ -1,19 +1,38 @@
 # -*- coding: utf-8 -*-
 
-from os.path import exists
-
-from raw_sql_migrate.exceptions import ParamRequiredException
+from os.path import exists, join
+from sqlite3 import ProgrammingError
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import patch
+
+from raw_sql_migrate import Config
+from raw_sql_migrate.api import Api
+from raw_sql_migrate.exceptions import (
+    ParamRequiredException, MigrationFailedException, NonAtomicMigrationFailedException, InconsistentParamsException,
+    RawSqlMigrateException,
+)
 from raw_sql_migrate.engines import database_api
-from raw_sql_migrate.helpers import FileSystemHelper, DatabaseHelper
+from raw_sql_migrate.engines.sqlite3 import DatabaseApi as SqliteDatabaseApi
+from raw_sql_migrate.helpers import FileSystemHelper, DatabaseHelper, MigrationHelper, MigrationCatalog
+
+from tests.base import BaseTestCase, DatabaseTestCase
 
-from tests.base import DatabaseTestCase
+
+connect_sqlite = SqliteDatabaseApi._connect
 
 
 __all__ = (
     'GenerateMigrationNameTestCase',
     'MigrateForwardTestCase',
     'MigrateBackwardTestCase',
+    'PlanTestCase',
     'StatusTestCase',
+    'CheckTestCase',
+    'HistoryTableUpgradeTestCase',
+    'MultipleDatabasesTestCase',
+    'NonAtomicMigrationTestCase',
 )
 
 
@@ -69,6 +88,34 @@ class MigrateForwardTestCase(DatabaseTestCase):
         self.api.migrate()
         self.assertTrue(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 1)
 
+    def test_atomic_migrate(self):
+        if not database_api.transactional_ddl:
+            # TestCase.skipTest is missing on python 2.6
+            from nose.plugins.skip import SkipTest
+
+            raise SkipTest('Engine has no transactional DDL')
+        self.api.create(self.python_path_to_test_package, 'test_migration_name2')
+        self.api.migrate(self.python_path_to_test_package, atomic=True)
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 2)
+
+    def test_up_to_date_check(self):
+        self.api.migrate()
+        statements_executed = database_api.statements_executed
+        with patch.object(database_api.get_database_api(), 'acquire_lock') as acquire_lock:
+            results = self.api.migrate()
+        self.assertFalse(acquire_lock.called)
+        self.assertEqual(database_api.statements_executed - statements_executed, 1)
+        self.assertEqual(
+            results[self.python_path_to_test_package]['state'], MigrationHelper.PackageState.UP_TO_DATE
+        )
+
+    def test_migrate_with_lock(self):
+        with patch.object(database_api.get_database_api(), 'acquire_lock') as acquire_lock:
+            with patch.object(database_api.get_database_api(), 'release_lock') as release_lock:
+                self.api.migrate(self.python_path_to_test_package)
+        acquire_lock.assert_called_once_with(DatabaseHelper.get_lock_name())
+        self.assertTrue(release_lock.called)
+
 
 class MigrateBackwardTestCase(DatabaseTestCase):
 
@@ -85,6 +132,51 @@ class MigrateBackwardTestCase(DatabaseTestCase):
         self.api.migrate(self.python_path_to_test_package, 0)
         self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 0)
 
+    def test_backward_is_appended_to_history(self):
+        self.api.create(self.python_path_to_test_package, 'second')
+        self.api.migrate(self.python_path_to_test_package)
+        statements_executed = database_api.statements_executed
+        DatabaseHelper.delete_migration_history('0002_second', self.python_path_to_test_package)
+        self.assertEqual(database_api.statements_executed - statements_executed, 2)
+        database_api.commit()
+        self.assertEqual(
+            self.api.status()[self.python_path_to_test_package]['name'], '0001_test_migration_name'
+        )
+        rows = database_api.execute(
+            'SELECT name, direction FROM %s ORDER BY id' % self.config.history_table_name,
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        self.assertEqual([tuple(row) for row in rows], [
+            ('0001_test_migration_name', 'forward'), ('0002_second', 'forward'), ('0002_second', 'backward'),
+        ])
+
+
+class PlanTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super(PlanTestCase, self).setUp()
+        self.api.create(self.python_path_to_test_package, 'test_migration_name')
+        self.api.create(self.python_path_to_test_package, 'test_migration_name2')
+
+    def test_plan_does_not_migrate(self):
+        statements_executed = database_api.statements_executed
+        plan = self.api.plan(self.python_path_to_test_package)
+        self.assertEqual(database_api.statements_executed - statements_executed, 1)
+        self.assertEqual(
+            [migration['name'] for migration in plan], ['0001_test_migration_name', '0002_test_migration_name2']
+        )
+        self.assertEqual(len(plan[0]['statements']), 1)
+        self.assertEqual(
+            plan[0]['statements'][0]['params'][:2], ('0001_test_migration_name', self.python_path_to_test_package)
+        )
+        self.assertEqual(len(plan[1]['statements']), 2)
+        self.assertEqual(
+            plan[1]['statements'][1]['params'][:3],
+            (self.python_path_to_test_package, '0002_test_migration_name2', 2, )
+        )
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 0)
+
+
 class SquashTestCase(DatabaseTestCase):
 
     def setUp(self):
@@ -104,6 +196,38 @@ class SquashTestCase(DatabaseTestCase):
         self.assertEqual(len(migrations), 1)
         self.assertTrue(migrations.get(1) is not None)
 
+    def test_squash_order(self):
+        FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        for number in (1, 2, 3):
+            file_name = MigrationHelper.generate_migration_name('order_%s' % number, number)
+            with open(join(self.file_system_test_migrations_path, file_name), 'w') as file_descriptor:
+                file_descriptor.write(MigrationHelper.MIGRATION_TEMPLATE % (
+                    "    database_api.execute('CREATE TABLE rsm_squash_%s (id INTEGER)')" % number,
+                    "    database_api.execute('DROP TABLE rsm_squash_%s')" % number,
+                ))
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+
+        self.api.squash(self.python_path_to_test_package, begin_from=2, name='order')
+        migrations = FileSystemHelper.get_migrations_list(self.python_path_to_test_package)
+        self.assertEqual(
+            [migrations[number]['file_name'] for number in sorted(migrations)], ['0001_order_1.py', '0002_order.py']
+        )
+        with open(migrations[2]['file_path']) as file_descriptor:
+            content = file_descriptor.read()
+        positions = [
+            content.index(query) for query in (
+                'CREATE TABLE rsm_squash_2', 'CREATE TABLE rsm_squash_3', 'DROP TABLE rsm_squash_3',
+                'DROP TABLE rsm_squash_2',
+            )
+        ]
+        self.assertEqual(positions, sorted(positions))
+
+        self.api.migrate(self.python_path_to_test_package)
+        self.assertTrue(database_api.table_exists('rsm_squash_3'))
+        self.api.migrate(self.python_path_to_test_package, 1)
+        self.assertFalse(database_api.table_exists('rsm_squash_2'))
+        self.api.migrate(self.python_path_to_test_package, 0)
+
 
 class StatusTestCase(DatabaseTestCase):
 
@@ -132,3 +256,334 @@ class StatusTestCase(DatabaseTestCase):
         data = self.api.status()
         self.assertEqual(len(data.keys()), 1)
         self.assertEqual(data['test_package']['name'], '0001_initial')
+
+    def test_timings(self):
+        DatabaseHelper.write_migration_history(
+            '0002_do_something', 'test_package', {'duration_ms': 10, 'statement_count': 2, 'rows_affected': 5}
+        )
+        DatabaseHelper.write_migration_history(
+            '0003_do_something', 'test_package', {'duration_ms': 20, 'statement_count': 1, 'rows_affected': 0}
+        )
+        database_api.commit()
+        data = self.api.timings(limit=1)
+        self.assertEqual(data, {'test_package': [
+            {'name': '0003_do_something', 'duration_ms': 20, 'statement_count': 1, 'rows_affected': 0},
+        ]})
+
+    def test_timings_of_rolled_back_migrations(self):
+        DatabaseHelper.write_migration_history(
+            '0002_do_something', 'test_package', {'duration_ms': 10, 'statement_count': 2, 'rows_affected': 5}
+        )
+        DatabaseHelper.write_migration_history(
+            '0003_do_something', 'test_package', {'duration_ms': 20, 'statement_count': 1, 'rows_affected': 0}
+        )
+        DatabaseHelper.delete_migration_history('0003_do_something', 'test_package', update_head=False)
+        DatabaseHelper.delete_migration_history('0002_do_something', 'test_package', update_head=False)
+        DatabaseHelper.write_migration_history(
+            '0002_do_something', 'test_package', {'duration_ms': 5, 'statement_count': 2, 'rows_affected': 5}
+        )
+        DatabaseHelper.write_migration_history(
+            '0004_do_something', 'test_package', {'duration_ms': 30, 'statement_count': 1, 'rows_affected': 0},
+            update_head=False
+        )
+        database_api.commit()
+        data = self.api.timings()
+        self.assertEqual(data, {'test_package': [
+            {'name': '0002_do_something', 'duration_ms': 5, 'statement_count': 2, 'rows_affected': 5},
+        ]})
+
+
+class CheckTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super(CheckTestCase, self).setUp()
+        self.api.create(self.python_path_to_test_package, 'first')
+
+    def test_not_migrated(self):
+        result = self.api.check(self.python_path_to_test_package)
+        self.assertEqual(result, {self.python_path_to_test_package: {
+            'up_to_date': False, 'applied': None, 'latest': '0001_first.py',
+        }})
+
+    def test_migrated(self):
+        self.api.migrate(self.python_path_to_test_package)
+        statements_executed = database_api.statements_executed
+        result = self.api.check()
+        self.assertEqual(database_api.statements_executed - statements_executed, 1)
+        self.assertTrue(result[self.python_path_to_test_package]['up_to_date'])
+        self.assertEqual(result[self.python_path_to_test_package]['applied'], '0001_first')
+
+    def test_new_migration(self):
+        self.api.migrate(self.python_path_to_test_package)
+        self.api.create(self.python_path_to_test_package, 'second')
+        result = self.api.check(self.python_path_to_test_package)
+        self.assertFalse(result[self.python_path_to_test_package]['up_to_date'])
+        self.assertEqual(result[self.python_path_to_test_package]['latest'], '0002_second.py')
+
+
+class HistoryTableUpgradeTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super(HistoryTableUpgradeTestCase, self).setUp()
+        database_api.execute('''
+            CREATE TABLE %s (
+                id %s,
+                package VARCHAR(200) NOT NULL,
+                name VARCHAR(200) NOT NULL,
+                processed_at  TIMESTAMP default current_timestamp
+            );
+        ''' % (self.config.history_table_name, database_api.auto_increment_primary_key, ))
+        database_api.execute(
+            'INSERT INTO %s (package, name) VALUES (%%s, %%s), (%%s, %%s)' % self.config.history_table_name,
+            params=(self.python_path_to_test_package, '0009_first', self.python_path_to_test_package, '0010_second', )
+        )
+        database_api.commit()
+        migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        for name in ('0009_first.py', '0010_second.py', ):
+            MigrationHelper.create_migration_file(migrations_path, name)
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+
+    def test_version_is_filled(self):
+        self.api._create_migration_history_table_if_not_exists()
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 10)
+        DatabaseHelper.delete_migration_history('0010_second', self.python_path_to_test_package)
+        database_api.commit()
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 9)
+        self.assertEqual(self.api.status()[self.python_path_to_test_package]['name'], '0009_first')
+        rows = database_api.execute(
+            'SELECT name, direction FROM %s ORDER BY id' % self.config.history_table_name,
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        self.assertEqual(
+            [tuple(row) for row in rows], [('0009_first', None), ('0010_second', None), ('0010_second', 'backward')]
+        )
+
+    def test_plan_before_upgrade(self):
+        plan = self.api.plan(self.python_path_to_test_package, 9)
+        self.assertEqual(
+            [(migration['name'], migration['direction']) for migration in plan],
+            [('0010_second', MigrationHelper.MigrationDirection.BACKWARD)]
+        )
+        self.assertFalse(database_api.table_exists(DatabaseHelper.get_head_table_name()))
+
+
+class MultipleDatabasesTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(MultipleDatabasesTestCase, self).setUp()
+        self.directory = mkdtemp()
+        databases = dict(
+            (name, {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, name + '.db')})
+            for name in ('shard_1', 'shard_3')
+        )
+        databases['shard_2'] = {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, 'no', 'db')}
+        self.api = Api(Config(packages=[self.python_path_to_test_package], databases=databases))
+        self.api.create(self.python_path_to_test_package, 'test_migration_name')
+
+    def tearDown(self):
+        database_api.close()
+        rmtree(self.directory)
+        super(MultipleDatabasesTestCase, self).tearDown()
+
+    def test_stop_on_failure(self):
+        try:
+            self.api.migrate_databases()
+        except MigrationFailedException as e:
+            results = e.results
+        self.assertEqual(
+            results['shard_1']['result'][self.python_path_to_test_package]['state'],
+            MigrationHelper.PackageState.APPLIED
+        )
+        self.assertTrue(results['shard_2']['error'])
+        self.assertEqual(results['shard_3'], {'result': None, 'error': None})
+
+    def test_connections_are_closed(self):
+        connections = []
+
+        def connect(database_api_instance):
+            connection = connect_sqlite(database_api_instance)
+            connections.append(connection)
+            return connection
+
+        with patch.object(SqliteDatabaseApi, '_connect', connect):
+            self.assertRaises(
+                MigrationFailedException, self.api.migrate_databases, concurrency=2, continue_on_failure=True
+            )
+        self.assertTrue(connections)
+        for connection in connections:
+            self.assertRaises(ProgrammingError, connection.execute, 'SELECT 1')
+
+    def test_params_are_validated_for_every_database(self):
+        databases = {
+            'file': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, 'file.db')},
+            'memory': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': ':memory:'},
+        }
+        api = Api(Config(packages=[self.python_path_to_test_package], databases=databases))
+        self.assertRaises(InconsistentParamsException, api.migrate_databases, jobs=2)
+        self.assertFalse(exists(join(self.directory, 'file.db')))
+
+    def test_continue_on_failure(self):
+        self.assertRaises(MigrationFailedException, self.api.migrate_databases, concurrency=2, continue_on_failure=True)
+        try:
+            self.api.status_databases(concurrency=2)
+        except MigrationFailedException as e:
+            results = e.results
+        for name in ('shard_1', 'shard_3'):
+            self.assertEqual(
+                results[name]['result'][self.python_path_to_test_package]['name'], '0001_test_migration_name'
+            )
+
+
+class NonAtomicMigrationTestCase(DatabaseTestCase):
+
+    migration_content = '''
+ATOMIC = False
+
+
+def forward(database_api):
+    database_api.execute('CREATE TABLE rsm_non_atomic_test (id INTEGER)')
+    database_api.execute(%r)
+
+
+def backward(database_api):
+    database_api.execute('DROP TABLE rsm_non_atomic_test')
+'''
+
+    def setUp(self):
+        super(NonAtomicMigrationTestCase, self).setUp()
+        self.api.create(self.python_path_to_test_package, 'first')
+
+    def tearDown(self):
+        database_api.execute('DROP TABLE IF EXISTS rsm_non_atomic_test')
+        database_api.commit()
+        super(NonAtomicMigrationTestCase, self).tearDown()
+
+    def create_migration(self, name, second_query):
+        # create imports migration module, so file is written directly. Migration modules are cached
+        # by import, so every test creates migration with own name
+        file_name = MigrationHelper.generate_migration_name(name, 2)
+        with open(join(self.file_system_test_migrations_path, file_name), 'w') as file_descriptor:
+            file_descriptor.write(self.migration_content % second_query)
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+
+    def test_non_atomic_migration_in_batch(self):
+        self.create_migration('non_atomic', 'INSERT INTO rsm_non_atomic_test VALUES (1)')
+        result = self.api.migrate(self.python_path_to_test_package, atomic=True)
+        self.assertEqual(
+            result[self.python_path_to_test_package]['applied'], ['0001_first', '0002_non_atomic']
+        )
+        rows = database_api.execute(
+            'SELECT count(*) FROM rsm_non_atomic_test', return_result=database_api.CursorResult.FETCHALL
+        )
+        self.assertEqual(rows[0][0], 1)
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 2)
+
+    def test_failed_non_atomic_migration(self):
+        self.create_migration('failed_non_atomic', 'INSERT INTO rsm_missing_table VALUES (1)')
+        self.assertRaises(
+            NonAtomicMigrationFailedException, self.api.migrate, self.python_path_to_test_package
+        )
+        self.assertTrue(database_api.table_exists('rsm_non_atomic_test'))
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 1)
+
+
+class DatabaseApiTestCase(DatabaseTestCase):
+
+    backfill_migration_content = '''# -*- coding: utf-8 -*-
+
+
+def forward(database_api):
+    database_api.backfill(
+        'rsm_database_api_test', 'id',
+        'UPDATE rsm_database_api_test SET value = 1 WHERE id BETWEEN %(start)s AND %(end)s'
+    )
+
+
+def backward(database_api):
+    pass
+'''
+
+    other_schema_statements = {
+        'raw_sql_migrate.engines.postgresql_psycopg2': (
+            'CREATE SCHEMA rsm_other_schema', 'DROP SCHEMA rsm_other_schema CASCADE',
+        ),
+        'raw_sql_migrate.engines.mysql': ('CREATE DATABASE rsm_other_schema', 'DROP DATABASE rsm_other_schema', ),
+        'raw_sql_migrate.engines.sqlite3': (
+            "ATTACH DATABASE ':memory:' AS rsm_other_schema", 'DETACH DATABASE rsm_other_schema',
+        ),
+    }
+
+    def setUp(self):
+        super(DatabaseApiTestCase, self).setUp()
+        database_api.execute('CREATE TABLE rsm_database_api_test (id INTEGER PRIMARY KEY, value INTEGER);')
+        database_api.commit()
+
+    def tearDown(self):
+        database_api.execute('DROP TABLE rsm_database_api_test;')
+        database_api.commit()
+        super(DatabaseApiTestCase, self).tearDown()
+
+    def test_table_of_other_schema_is_ignored(self):
+        create_schema_sql, drop_schema_sql = self.other_schema_statements[database_api.engine]
+        database_api.set_autocommit(True)
+        try:
+            database_api.execute(create_schema_sql)
+            try:
+                database_api.execute('CREATE TABLE rsm_other_schema.rsm_schema_test (other_id INTEGER)')
+                database_api.execute('CREATE TABLE rsm_other_schema.rsm_database_api_test (other_id INTEGER)')
+                self.assertFalse(database_api.table_exists('rsm_schema_test'))
+                self.assertEqual(database_api.get_table_columns('rsm_schema_test'), set())
+                self.assertTrue(database_api.table_exists('rsm_database_api_test'))
+                self.assertEqual(database_api.get_table_columns('rsm_database_api_test'), set(['id', 'value']))
+            finally:
+                database_api.execute(drop_schema_sql)
+        finally:
+            database_api.set_autocommit(False)
+
+    def test_rows_from_generator(self):
+        rows = ((number, number * 2) for number in range(25))
+        database_api.execute_many(
+            'INSERT INTO rsm_database_api_test (id, value) VALUES (%s, %s)', rows, page_size=10
+        )
+        database_api.commit()
+        result = database_api.execute(
+            'SELECT count(*) FROM rsm_database_api_test', return_result=database_api.CursorResult.FETCHALL
+        )
+        self.assertEqual(result[0][0], 25)
+
+    def test_iter_result(self):
+        database_api.execute_many(
+            'INSERT INTO rsm_database_api_test (id, value) VALUES (%s, %s)', ((number, number) for number in range(5))
+        )
+        rows = database_api.execute(
+            'SELECT id FROM rsm_database_api_test ORDER BY id',
+            return_result=database_api.CursorResult.ITER, batch_size=2
+        )
+        self.assertEqual([row[0] for row in rows], [0, 1, 2, 3, 4])
+        self.assertTrue(rows.cursor is None)
+
+    def test_backfill(self):
+        database_api.execute_many(
+            'INSERT INTO rsm_database_api_test (id, value) VALUES (%s, %s)', ((number, 0) for number in range(25))
+        )
+        database_api.commit()
+        result = database_api.backfill(
+            'rsm_database_api_test', 'id',
+            'UPDATE rsm_database_api_test SET value = 1 WHERE id BETWEEN %(start)s AND %(end)s',
+            chunk_size=10
+        )
+        self.assertEqual(result, 25)
+        rows = database_api.execute(
+            'SELECT count(*) FROM rsm_database_api_test WHERE value = 1',
+            return_result=database_api.CursorResult.FETCHALL
+        )
+        self.assertEqual(rows[0][0], 25)
+
+    def test_backfill_in_batch(self):
+        migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        with open(join(migrations_path, MigrationHelper.generate_migration_name('backfill', 1)), 'w') as migration:
+            migration.write(self.backfill_migration_content)
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+        self.assertRaises(RawSqlMigrateException, self.api.migrate, self.python_path_to_test_package, atomic=True)
+        self.assertFalse(database_api.batched)
+        self.assertEqual(DatabaseHelper.get_latest_migration_number(self.python_path_to_test_package), 0)
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from sys import version_info
+
+if version_info < (3, 5):
+    from nose.plugins.skip import SkipTest
+
+    raise SkipTest('asyncio engines require python 3.5+')
+
+# test cases use async syntax, so they are imported only on python versions which support it
+from tests.async_api_cases import *  # noqa
@@ -1,14 +1,27 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
+from os import mkdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
 from mock import Mock, patch, call
 
 from tests.base import DatabaseTestCase
 
+from raw_sql_migrate import Config
+from raw_sql_migrate.api import Api
+from raw_sql_migrate.engines import database_api
+
 from raw_sql_migrate.cli import (
-    create, status, migrate, STATUS_HEADER_STRING, AFTER_STATUS_HEADER_STRING, NO_MIGRATION_STRING,
+    create, status, migrate, check, STATUS_HEADER_STRING, AFTER_STATUS_HEADER_STRING, NO_MIGRATION_STRING,
+    CHECK_PASSED_STRING, DEFAULT_DATABASE_TEMPLATE_STRING, _write_default_database,
 )
 
-from raw_sql_migrate.helpers import FileSystemHelper
+from raw_sql_migrate.helpers import FileSystemHelper, MigrationHelper
 
 
 class CliTestCase(DatabaseTestCase):
@@ -23,12 +36,23 @@ class CliTestCase(DatabaseTestCase):
         self.status_args = Mock()
         self.status_args.config = config
         self.status_args.package = None
+        self.status_args.timings = False
+        self.status_args.limit = 5
+        self.status_args.all_databases = False
 
         self.migrate_args = Mock()
         self.migrate_args.config = config
         self.migrate_args.package = self.python_path_to_test_package
         self.migrate_args.migration_number = None
-        self.patcher = patch('raw_sql_migrate.cli._get_api', new=lambda config_path: self.api)
+        self.migrate_args.jobs = 1
+        self.migrate_args.batch_size = None
+        self.migrate_args.atomic = False
+        self.migrate_args.all_databases = False
+
+        self.check_args = Mock()
+        self.check_args.config = config
+        self.check_args.package = self.python_path_to_test_package
+        self.patcher = patch('raw_sql_migrate.cli._get_api', new=lambda config_path, all_databases=False: self.api)
         self.patcher.start()
 
     def tearDown(self):
@@ -57,3 +81,120 @@ class CliTestCase(DatabaseTestCase):
         first_call = call(STATUS_HEADER_STRING)
         second_call = call(AFTER_STATUS_HEADER_STRING)
         write.assert_has_calls((first_call, second_call, ), any_order=True)
+
+    def test_check(self):
+        create(self.create_args)
+        with patch('raw_sql_migrate.sys.stderr'):
+            self.assertRaises(SystemExit, check, self.check_args)
+        migrate(self.migrate_args)
+        with patch('raw_sql_migrate.sys.stdout.write') as write:
+            check(self.check_args)
+        write.assert_called_with(CHECK_PASSED_STRING)
+
+
+class ParallelMigrateCliTestCase(TestCase):
+
+    migration_content = '''# -*- coding: utf-8 -*-
+
+
+def forward(database_api):
+    database_api.execute('%s')
+
+
+def backward(database_api):
+    pass
+'''
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        sys.path.insert(0, self.directory)
+        self.migrate_args = Mock()
+        self.migrate_args.config = 'rsm.yaml'
+        self.migrate_args.package = None
+        self.migrate_args.migration_number = None
+        self.migrate_args.jobs = 2
+        self.migrate_args.batch_size = None
+        self.migrate_args.atomic = False
+        self.migrate_args.all_databases = False
+        self.patcher = patch('raw_sql_migrate.cli._get_api', new=lambda config_path, all_databases=False: self.api)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        database_api.close()
+        sys.path.remove(self.directory)
+        rmtree(self.directory)
+
+    def create_packages(self, packages, databases=None):
+        """
+        :param packages: list of (package, query of its migration) in order packages are migrated
+        """
+        # package names are unique for every test, because migration modules are cached by import
+        for package, query in packages:
+            migrations_path = join(self.directory, package, 'migrations')
+            mkdir(join(self.directory, package))
+            mkdir(migrations_path)
+            for path in (join(self.directory, package), migrations_path, ):
+                open(join(path, '__init__.py'), 'w').close()
+            with open(join(migrations_path, MigrationHelper.generate_migration_name('initial')), 'w') as migration:
+                migration.write(self.migration_content % query)
+        self.api = Api(Config(
+            database={'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, 'rsm.db')},
+            packages=[package for package, query in packages], databases=databases,
+        ))
+
+    def test_migrate_in_parallel(self):
+        self.create_packages([
+            ('rsm_cli_first', 'CREATE TABLE rsm_cli_first (id INTEGER)', ),
+            ('rsm_cli_second', 'CREATE TABLE rsm_cli_second (id INTEGER)', ),
+        ])
+        with patch('raw_sql_migrate.sys.stdout.write') as write:
+            migrate(self.migrate_args)
+        write.assert_called_with('Done.\n')
+        self.assertEqual(sorted(self.api.status()), ['rsm_cli_first', 'rsm_cli_second'])
+
+    def test_failed_migrate_in_parallel(self):
+        # packages are taken from queue in order, so succeeding package is started before failure
+        self.create_packages([
+            ('rsm_cli_succeeding', 'CREATE TABLE rsm_cli_succeeding (id INTEGER)', ),
+            ('rsm_cli_failing', 'INSERT INTO rsm_cli_missing VALUES (1)', ),
+        ])
+        with patch('raw_sql_migrate.sys.stdout.write'):
+            with patch('raw_sql_migrate.sys.stderr') as stderr:
+                self.assertRaises(SystemExit, migrate, self.migrate_args)
+        stderr.write.assert_called_with('Failed to migrate packages: rsm_cli_failing\n')
+        self.assertEqual(list(self.api.status()), ['rsm_cli_succeeding'])
+
+    def test_failed_migrate_all_databases(self):
+        self.create_packages([('rsm_cli_sharded', 'CREATE TABLE rsm_cli_sharded (id INTEGER)', )], databases={
+            'shard_1': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, 'shard_1.db')},
+            'shard_2': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': join(self.directory, 'no', 'db')},
+        })
+        self.migrate_args.all_databases = True
+        self.migrate_args.concurrency = 1
+        self.migrate_args.continue_on_failure = True
+        with patch('raw_sql_migrate.sys.stdout.write'):
+            with patch('raw_sql_migrate.sys.stderr'):
+                self.assertRaises(SystemExit, migrate, self.migrate_args)
+
+
+class DefaultDatabaseCliTestCase(TestCase):
+
+    databases = {
+        'shard_2': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': ':memory:'},
+        'shard_1': {'engine': 'raw_sql_migrate.engines.sqlite3', 'name': 'shard_1.db'},
+    }
+
+    def test_first_database_is_used(self):
+        config = Config(databases=self.databases)
+        self.assertEqual(config.name, 'shard_1.db')
+        with patch('raw_sql_migrate.cli.sys.stderr') as stderr:
+            _write_default_database(config)
+        stderr.write.assert_called_once_with(DEFAULT_DATABASE_TEMPLATE_STRING % 'shard_1')
+
+    def test_database_section_is_used(self):
+        config = Config(database={'engine': 'raw_sql_migrate.engines.sqlite3', 'name': ':memory:'},
+                        databases=self.databases)
+        with patch('raw_sql_migrate.cli.sys.stderr') as stderr:
+            _write_default_database(config)
+        self.assertFalse(stderr.write.called)
@@ -4,8 +4,9 @@ from os.path import exists, join
 
 from tests.base import BaseTestCase
 
-from raw_sql_migrate.exceptions import IncorrectPackage
-from raw_sql_migrate.helpers import FileSystemHelper, MigrationHelper
+from raw_sql_migrate.exceptions import IncorrectPackage, IncorrectMigrationFile
+from raw_sql_migrate.helpers import FileSystemHelper, MigrationHelper, HistoryIndex, MigrationCatalog
+from raw_sql_migrate.migration import Migration
 
 
 __all__ = (
@@ -14,6 +15,10 @@ __all__ = (
     'MigrationFileCreationTestCase',
     'MigrationListTestCase',
     'GetMigrationPythonPathAndNameTestCase',
+    'HistoryIndexTestCase',
+    'MigrationCatalogTestCase',
+    'SqlMigrationTestCase',
+    'ParseMigrationFileTestCase',
 )
 
 
@@ -79,6 +84,15 @@ class MigrationListTestCase(BaseTestCase):
         result = FileSystemHelper.get_migrations_list(self.python_path_to_test_package)
         self.assertTrue(len(result), len(self.migration_file_names))
 
+    def test_sql_migrations_found(self):
+        for file_name in ('0003_test.forward.sql', '0003_test.backward.sql', '0004_test.sql', ):
+            with open(join(self.migrations_path, file_name), 'w') as file_descriptor:
+                file_descriptor.write('SELECT 1;')
+        result = FileSystemHelper.get_migrations_list(self.python_path_to_test_package)
+        self.assertEqual(sorted(result.keys()), [1, 2, 3])
+        self.assertEqual(result[3]['file_name'], '0003_test.forward.sql')
+        self.assertEqual(result[3]['file_type'], MigrationHelper.MigrationFileType.SQL)
+
     def test_bad_files_are_ignored(self):
         bad_file_names = ('abc.py', '0001_test.txt', )
         for file_name in bad_file_names:
@@ -101,3 +115,140 @@ class GetMigrationPythonPathAndNameTestCase(BaseTestCase):
         )
         self.assertEqual(name, self.migration_name.replace('.py', ''))
         self.assertEqual(path, '.'.join((self.python_path_to_test_package, 'migrations', name)))
+
+    def test_name_ending_with_extension_letters(self):
+        path, name = FileSystemHelper.get_migration_python_path_and_name(
+            '0002_copy.py', self.python_path_to_test_package
+        )
+        self.assertEqual(name, '0002_copy')
+
+
+class HistoryIndexTestCase(BaseTestCase):
+
+    rows = (
+        ('package_a', 10),
+        ('package_b', 1),
+    )
+
+    def setUp(self):
+        self.history_index = HistoryIndex(self.rows)
+
+    def test_latest_migration_number(self):
+        self.assertEqual(self.history_index.get_latest_migration_number('package_a'), 10)
+        self.assertEqual(self.history_index.get_latest_migration_number('package_b'), 1)
+        self.assertEqual(self.history_index.get_latest_migration_number('package_c'), 0)
+
+    def test_add_and_remove(self):
+        migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        for name in ('0001_initial.py', '0003_next.py', ):
+            MigrationHelper.create_migration_file(migrations_path, name)
+        MigrationCatalog.get(self.python_path_to_test_package).invalidate()
+        self.history_index.add(self.python_path_to_test_package, '0003_next')
+        self.assertEqual(self.history_index.get_latest_migration_number(self.python_path_to_test_package), 3)
+        self.history_index.remove(self.python_path_to_test_package, '0003_next')
+        self.assertEqual(self.history_index.get_latest_migration_number(self.python_path_to_test_package), 1)
+        self.history_index.remove(self.python_path_to_test_package, '0001_initial')
+        self.assertEqual(self.history_index.get_latest_migration_number(self.python_path_to_test_package), 0)
+
+
+class MigrationCatalogTestCase(BaseTestCase):
+
+    migration_file_names = ('0001_test.py', '0002_test.py', '0005_test.py', )
+
+    def setUp(self):
+        self.migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        for name in self.migration_file_names:
+            MigrationHelper.create_migration_file(self.migrations_path, name)
+        self.catalog = MigrationCatalog.get(self.python_path_to_test_package)
+
+    def test_numbers(self):
+        self.assertEqual(self.catalog.numbers, [1, 2, 5])
+        self.assertEqual(self.catalog.latest_number, 5)
+        self.assertEqual(self.catalog.next_number(2), 5)
+        self.assertEqual(self.catalog.next_number(5), None)
+        self.assertEqual(self.catalog.previous_number(5), 2)
+        self.assertEqual(self.catalog.previous_number(1), None)
+
+    def test_same_catalog_is_returned(self):
+        self.assertTrue(MigrationCatalog.get(self.python_path_to_test_package) is self.catalog)
+
+    def test_new_migration_is_found(self):
+        MigrationHelper.create_migration_file(self.migrations_path, '0006_test.py')
+        self.catalog.invalidate()
+        self.assertEqual(MigrationCatalog.get(self.python_path_to_test_package).latest_number, 6)
+
+
+class SqlMigrationTestCase(BaseTestCase):
+
+    def setUp(self):
+        self.migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+        with open(join(self.migrations_path, '0001_test.forward.sql'), 'w') as file_descriptor:
+            file_descriptor.write("SELECT '100%';")
+
+    def test_migration_is_not_imported(self):
+        migration = Migration(self.python_path_to_test_package, '0001_test.forward.sql')
+        self.assertEqual(migration.py_module_name, '0001_test')
+        self.assertEqual(migration.fs_file_name, '0001_test.forward.sql')
+        self.assertTrue(hasattr(migration.module, 'forward'))
+        self.assertFalse(hasattr(migration.module, 'backward'))
+
+
+class ParseMigrationFileTestCase(BaseTestCase):
+
+    migration_content = '''# -*- coding: utf-8 -*-
+"""Migration docstring"""
+from datetime import (
+    datetime,
+)
+
+ATOMIC = True
+
+
+def forward(database_api):
+  # comment before statement
+  database_api.execute(\'\'\'
+    SELECT 1
+  \'\'\')
+
+  database_api.execute('SELECT %s', params=(datetime.now(), ))
+
+
+def backward(database_api):
+    pass
+'''
+
+    def setUp(self):
+        self.migrations_path = FileSystemHelper.get_package_migrations_directory(self.python_path_to_test_package)
+
+    def parse(self, content):
+        file_path = join(self.migrations_path, '0001_test.py')
+        with open(file_path, 'w') as file_descriptor:
+            file_descriptor.write(content)
+        return FileSystemHelper.parse_migration_file(file_path)
+
+    def test_parse(self):
+        result = self.parse(self.migration_content)
+        self.assertEqual(result['imports'], ['from datetime import (\n    datetime,\n)\n'])
+        self.assertEqual(result['forward'], (
+            "    # comment before statement\n"
+            "    database_api.execute('''\n"
+            "      SELECT 1\n"
+            "    ''')\n"
+            "\n"
+            "    database_api.execute('SELECT %s', params=(datetime.now(), ))\n"
+        ))
+        self.assertEqual(result['backward'], '')
+        self.assertTrue(result['atomic'])
+
+    def test_top_level_code(self):
+        self.assertRaises(IncorrectMigrationFile, self.parse, self.migration_content + 'TABLE = 1\n')
+
+    def test_return_in_function(self):
+        self.assertRaises(
+            IncorrectMigrationFile, self.parse, self.migration_content.replace('    pass', '    return')
+        )
+
+    def test_no_backward(self):
+        self.assertRaises(
+            IncorrectMigrationFile, self.parse, self.migration_content.replace('def backward', 'def other')
+        )
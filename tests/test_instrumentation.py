@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from io import StringIO
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from mock import patch
+
+from raw_sql_migrate.engines import database_api
+from raw_sql_migrate.instrumentation import (
+    instrumentation, Instrumentation, JsonLinesExporter, PrometheusTextfileExporter, SlowStatementLog,
+)
+
+from tests.base import DatabaseTestCase
+
+
+__all__ = (
+    'InstrumentationTestCase',
+    'FailingHookTestCase',
+    'ExportersTestCase',
+)
+
+
+def failing_hook(event):
+    raise ValueError('hook failed')
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+        self.events = []
+
+    def test_disabled_without_hooks(self):
+        self.assertFalse(self.instrumentation.enabled)
+        self.instrumentation.add_hook(after_execute=self.events.append)
+        self.assertTrue(self.instrumentation.enabled)
+        self.instrumentation.remove_hook(self.events.append)
+        self.assertFalse(self.instrumentation.enabled)
+
+    def test_hooks_receive_event(self):
+        self.instrumentation.add_hook(before_execute=self.events.append, after_execute=self.events.append)
+        self.instrumentation.set_context('package_a', '0001_initial')
+        event = self.instrumentation.before_execute('SELECT 1', ())
+        self.instrumentation.after_execute(event, 1)
+        self.assertEqual(self.events, [event, event])
+        self.assertEqual((event.package, event.migration, event.rowcount), ('package_a', '0001_initial', 1))
+        self.assertTrue(event.duration >= 0)
+
+
+class FailingHookTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super(FailingHookTestCase, self).setUp()
+        database_api.execute('CREATE TABLE rsm_hook_test (id INTEGER)')
+        database_api.commit()
+        self.events = []
+        instrumentation.add_hook(before_execute=failing_hook, after_execute=failing_hook)
+        instrumentation.add_hook(after_execute=self.events.append)
+
+    def tearDown(self):
+        instrumentation.remove_hook(failing_hook)
+        instrumentation.remove_hook(self.events.append)
+        database_api.execute('DROP TABLE rsm_hook_test')
+        database_api.commit()
+        super(FailingHookTestCase, self).tearDown()
+
+    def test_statement_succeeds(self):
+        with patch('raw_sql_migrate.instrumentation.sys.stderr') as stderr:
+            rows = database_api.execute('SELECT 1', return_result=database_api.CursorResult.FETCHALL)
+            database_api.execute_many('INSERT INTO rsm_hook_test (id) VALUES (%s)', [(1, ), (2, )])
+        self.assertEqual(rows[0][0], 1)
+        self.assertEqual(
+            [event.sql for event in self.events], ['SELECT 1', 'INSERT INTO rsm_hook_test (id) VALUES (%s)']
+        )
+        self.assertEqual(stderr.write.call_count, 4)
+
+
+class ExportersTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.instrumentation = Instrumentation()
+        self.instrumentation.set_context('package_a', '0001_initial')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def _execute(self, sql='SELECT 1', duration=0.02):
+        event = self.instrumentation.before_execute(sql, ())
+        self.instrumentation.after_execute(event, 0)
+        event.duration = duration
+        return event
+
+    def test_slow_statement_log(self):
+        output = StringIO()
+        log = SlowStatementLog(0.01, output=output)
+        log(self._execute(u'SELECT\n  1', duration=0.001))
+        log(self._execute(u'SELECT\n  2', duration=0.5))
+        self.assertEqual(output.getvalue(), u'Slow statement (0.500s) in package_a 0001_initial: SELECT 2\n')
+
+    def test_json_lines(self):
+        file_path = path.join(self.directory, 'statements.jsonl')
+        exporter = JsonLinesExporter(file_path)
+        exporter(self._execute())
+        exporter.close()
+        with open(file_path) as file_descriptor:
+            line = json.loads(file_descriptor.readline())
+        self.assertEqual((line['package'], line['sql'], line['duration']), ('package_a', 'SELECT 1', 0.02))
+
+    def test_prometheus_textfile(self):
+        file_path = path.join(self.directory, 'rsm.prom')
+        exporter = PrometheusTextfileExporter(file_path, buckets=(0.01, 0.1))
+        exporter(self._execute(duration=0.02))
+        exporter(self._execute(duration=0.2))
+        exporter.flush()
+        with open(file_path) as file_descriptor:
+            lines = file_descriptor.read().splitlines()
+        labels = 'package="package_a",migration="0001_initial"'
+        self.assertTrue('rsm_statement_duration_seconds_bucket{%s,le="0.01"} 0' % labels in lines)
+        self.assertTrue('rsm_statement_duration_seconds_bucket{%s,le="0.1"} 1' % labels in lines)
+        self.assertTrue('rsm_statement_duration_seconds_bucket{%s,le="+Inf"} 2' % labels in lines)
+        self.assertTrue('rsm_statement_duration_seconds_count{%s} 2' % labels in lines)
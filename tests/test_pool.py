@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+from raw_sql_migrate.engines.pool import ConnectionPool
+from raw_sql_migrate.exceptions import PoolTimeoutException
+
+
+__all__ = (
+    'ConnectionPoolTestCase',
+)
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, lambda connection: connection.usable, min_size=1, max_size=2)
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_connection_is_reused(self):
+        connection = self.pool.checkout()
+        self.pool.release(connection)
+        self.assertTrue(self.pool.checkout() is connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_broken_connection_is_replaced(self):
+        connection = self.pool.checkout()
+        self.pool.release(connection)
+        connection.usable = False
+        new_connection = self.pool.checkout()
+        self.assertFalse(new_connection is connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.size, 1)
+
+    def test_max_size_timeout(self):
+        self.pool.timeout = 0.01
+        self.pool.checkout()
+        self.pool.checkout()
+        self.assertRaises(PoolTimeoutException, self.pool.checkout)
+
+    def test_close(self):
+        connection = self.pool.checkout()
+        self.pool.release(connection)
+        self.pool.close()
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.size, 0)
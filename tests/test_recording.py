@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from raw_sql_migrate.engines.base import BaseApi
+from raw_sql_migrate.engines.recording import RecordingDatabaseApi
+
+
+__all__ = (
+    'RecordingDatabaseApiTestCase',
+)
+
+
+class RecordingDatabaseApiTestCase(TestCase):
+
+    def setUp(self):
+        self.recording_database_api = RecordingDatabaseApi(BaseApi(None, None, None, None, None, {}))
+
+    def test_queries_are_recorded(self):
+        result = self.recording_database_api.execute(
+            'SELECT * FROM test WHERE id = %s;', (1, ), return_result=BaseApi.CursorResult.FETCHALL
+        )
+        self.assertEqual(result, [])
+        self.recording_database_api.execute_many('INSERT INTO test VALUES (%s)', ((i, ) for i in range(2)))
+        self.recording_database_api.commit()
+        statements = self.recording_database_api.reset()
+        self.assertEqual(statements[0], {'sql': 'SELECT * FROM test WHERE id = %s', 'params': (1, )})
+        self.assertEqual(statements[1]['params'], [(0, ), (1, )])
+        self.assertEqual(self.recording_database_api.statements, [])
+
+    def test_file_statements_are_recorded(self):
+        directory = mkdtemp()
+        try:
+            file_path = path.join(directory, 'test.sql')
+            with open(file_path, 'w') as file_descriptor:
+                file_descriptor.write("CREATE TABLE test (id INT);\nINSERT INTO test VALUES (1);\n")
+            self.assertEqual(self.recording_database_api.execute_file(file_path), 2)
+        finally:
+            rmtree(directory)
+        self.assertEqual(
+            [statement['sql'] for statement in self.recording_database_api.statements],
+            ['CREATE TABLE test (id INT)', 'INSERT INTO test VALUES (1)'],
+        )
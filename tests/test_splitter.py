@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from io import BytesIO
+from unittest import TestCase
+
+from raw_sql_migrate.splitter import SqlStatementSplitter
+
+
+__all__ = (
+    'SqlStatementSplitterTestCase',
+)
+
+
+class SqlStatementSplitterTestCase(TestCase):
+
+    script = u"""
+-- leading comment; with semicolon
+CREATE TABLE test (id INT, value VARCHAR(10));
+INSERT INTO test VALUES (1, 'a;b'), (2, 'it''s; fine');
+/* block; comment */ INSERT INTO "semi;colon" VALUES ('ü;');
+CREATE FUNCTION f() RETURNS INT AS $body$ BEGIN RETURN 1; END; $body$ LANGUAGE plpgsql;
+SELECT $$a;b$$, price$1 - 1 / 2;
+-- only comment;
+;
+SELECT 1
+"""
+
+    expected = [
+        u'-- leading comment; with semicolon\nCREATE TABLE test (id INT, value VARCHAR(10))',
+        u"INSERT INTO test VALUES (1, 'a;b'), (2, 'it''s; fine')",
+        u'/* block; comment */ INSERT INTO "semi;colon" VALUES (\'ü;\')',
+        u'CREATE FUNCTION f() RETURNS INT AS $body$ BEGIN RETURN 1; END; $body$ LANGUAGE plpgsql',
+        u'SELECT $$a;b$$, price$1 - 1 / 2',
+        u'SELECT 1',
+    ]
+
+    def _split(self, script, **kwargs):
+        return list(SqlStatementSplitter(BytesIO(script.encode('utf-8')), **kwargs))
+
+    def test_split(self):
+        self.assertEqual(self._split(self.script), self.expected)
+
+    def test_split_by_small_chunks(self):
+        for chunk_size in range(1, 20):
+            self.assertEqual(self._split(self.script, chunk_size=chunk_size), self.expected)
+
+    def test_bytes_read(self):
+        splitter = SqlStatementSplitter(BytesIO(self.script.encode('utf-8')), chunk_size=7)
+        list(splitter)
+        self.assertEqual(splitter.bytes_read, len(self.script.encode('utf-8')))
+
+    def test_backslash_escapes(self):
+        script = u"INSERT INTO test VALUES ('a\\';b');SELECT 1;"
+        for chunk_size in range(1, 10):
+            self.assertEqual(
+                self._split(script, chunk_size=chunk_size, backslash_escapes=True),
+                [u"INSERT INTO test VALUES ('a\\';b')", u'SELECT 1'],
+            )
+        self.assertEqual(self._split(u"SELECT 'C:\\';SELECT 1"), [u"SELECT 'C:\\'", u'SELECT 1'])
+
+    def test_escape_string(self):
+        script = u"INSERT INTO test VALUES (E'it\\'s; x', e'\\\\;', 'C:\\');SELECT date'C:\\';SELECT 1;"
+        for chunk_size in range(1, 20):
+            self.assertEqual(self._split(script, chunk_size=chunk_size), [
+                u"INSERT INTO test VALUES (E'it\\'s; x', e'\\\\;', 'C:\\')", u"SELECT date'C:\\'", u'SELECT 1',
+            ])
+
+    def test_empty(self):
+        self.assertEqual(self._split(u''), [])
+        self.assertEqual(self._split(u'-- comment\n/* comment */'), [])
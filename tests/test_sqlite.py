@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from raw_sql_migrate.engines.sqlite3 import DatabaseApi
+from raw_sql_migrate.exceptions import RawSqlMigrateException
+
+
+__all__ = (
+    'SqliteTransactionTestCase',
+)
+
+
+class SqliteTransactionTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        name = join(self.directory, 'rsm.db')
+        self.database_api = DatabaseApi(None, None, name, None, None, {'timeout': 0})
+        self.other_database_api = DatabaseApi(None, None, name, None, None, {'timeout': 0})
+        self.database_api.execute('CREATE TABLE rsm_sqlite_test (id INTEGER)')
+        self.database_api.commit()
+
+    def tearDown(self):
+        self.database_api.close()
+        self.other_database_api.close()
+        rmtree(self.directory)
+
+    def count(self):
+        rows = self.other_database_api.execute(
+            'SELECT count(*) FROM rsm_sqlite_test', return_result=self.database_api.CursorResult.FETCHALL
+        )
+        return rows[0][0]
+
+    def test_rollback(self):
+        self.database_api.execute('INSERT INTO rsm_sqlite_test VALUES (1)')
+        self.database_api.rollback()
+        self.database_api.execute('INSERT INTO rsm_sqlite_test VALUES (2)')
+        self.database_api.commit()
+        self.assertEqual(self.count(), 1)
+
+    def test_read_only_statement_does_not_begin_transaction(self):
+        self.database_api.execute(
+            'SELECT count(*) FROM rsm_sqlite_test', return_result=self.database_api.CursorResult.FETCHALL
+        )
+        self.other_database_api.execute('INSERT INTO rsm_sqlite_test VALUES (1)')
+        self.other_database_api.commit()
+        self.database_api.execute('INSERT INTO rsm_sqlite_test VALUES (2)')
+        self.assertRaises(
+            RawSqlMigrateException, self.other_database_api.execute, 'INSERT INTO rsm_sqlite_test VALUES (3)'
+        )
+        self.other_database_api.rollback()
+        self.database_api.commit()
+        self.assertEqual(self.count(), 2)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+from os.path import dirname, abspath
+from unittest import TestCase
+
+
+__all__ = (
+    'LazyImportsTestCase',
+)
+
+
+class LazyImportsTestCase(TestCase):
+
+    lazy_modules = (
+        'raw_sql_migrate.api', 'raw_sql_migrate.helpers', 'raw_sql_migrate.async_api', 'yaml', 'psycopg2', 'MySQLdb',
+        'sqlite3', 'asyncpg', 'aiomysql',
+    )
+
+    def get_imported_modules(self, statement):
+        # subprocess.check_output is missing on python 2.6
+        process = subprocess.Popen(
+            [sys.executable, '-c', '%s; import sys; print("\\n".join(sys.modules))' % statement],
+            cwd=dirname(dirname(abspath(__file__))), stdout=subprocess.PIPE
+        )
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        return set(output.decode('utf-8').split())
+
+    def test_cli_import(self):
+        modules = self.get_imported_modules('import raw_sql_migrate.cli')
+        for module in self.lazy_modules:
+            self.assertFalse(module in modules, '%s is imported on cli import' % module)
+
+    def test_engine_import_does_not_import_driver(self):
+        engines = ['postgresql_psycopg2', 'mysql', 'sqlite3']
+        # asyncio engines use async syntax
+        if sys.version_info >= (3, 5):
+            engines.extend(['asyncpg', 'aiomysql'])
+        modules = self.get_imported_modules(
+            'import %s' % ', '.join('raw_sql_migrate.engines.%s' % engine for engine in engines)
+        )
+        self.assertFalse('psycopg2' in modules)
+        self.assertFalse('MySQLdb' in modules)
+        self.assertFalse('sqlite3' in modules)
+        self.assertFalse('asyncpg' in modules)
+        self.assertFalse('aiomysql' in modules)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+from mock import Mock
+
+from raw_sql_migrate.engines.pool import ConnectionPool
+from raw_sql_migrate.engines.postgresql_psycopg2 import DatabaseApi
+from raw_sql_migrate.engines.statements import StatementCache, convert_placeholders
+
+
+__all__ = (
+    'ConvertPlaceholdersTestCase',
+    'StatementCacheTestCase',
+    'PreparedStatementsTestCase',
+)
+
+
+class ConvertPlaceholdersTestCase(TestCase):
+
+    def test_positional(self):
+        sql, keys = convert_placeholders('SELECT * FROM t WHERE a = %s AND b = %s', '$%d')
+        self.assertEqual(sql, 'SELECT * FROM t WHERE a = $1 AND b = $2')
+        self.assertEqual(keys, [0, 1])
+
+    def test_named(self):
+        sql, keys = convert_placeholders(
+            "SELECT * FROM t WHERE a = %(a)s AND b LIKE 'x%%' AND c = %(a)s AND d = %(d)s", '$%d'
+        )
+        self.assertEqual(sql, "SELECT * FROM t WHERE a = $1 AND b LIKE 'x%' AND c = $1 AND d = $2")
+        self.assertEqual(keys, ['a', 'd'])
+
+
+class StatementCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.evicted = []
+        self.cache = StatementCache(2, on_evict=lambda key, value: self.evicted.append(key))
+
+    def test_hits_and_misses(self):
+        self.assertRaises(KeyError, self.cache.get, 'a')
+        self.cache.put('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertEqual(self.evicted, ['b'])
+        self.assertEqual(len(self.cache), 2)
+
+
+class PreparedStatementsTestCase(TestCase):
+
+    def setUp(self):
+        self.cursor = Mock()
+        self.cursor.rowcount = 0
+        connection = Mock()
+        connection.cursor.return_value = self.cursor
+        self.database_api = DatabaseApi(
+            None, None, None, None, None, {}, pool=ConnectionPool(lambda: connection, lambda connection: True),
+            prepare_statements=True
+        )
+
+    def get_executed(self):
+        return [execute_call[0][0] for execute_call in self.cursor.execute.call_args_list]
+
+    def test_repeated_query_is_prepared(self):
+        for _ in range(3):
+            self.database_api.execute('SELECT * FROM t WHERE id = %s', params=(1, ))
+        executed = self.get_executed()
+        self.assertEqual(executed[:2], ['SELECT * FROM t WHERE id = %s', 'SAVEPOINT rsm_prepare'])
+        self.assertTrue(executed[2].startswith('PREPARE rsm_statement_'))
+        self.assertTrue(executed[2].endswith(' AS SELECT * FROM t WHERE id = $1'))
+        self.assertEqual(executed[3], 'RELEASE SAVEPOINT rsm_prepare')
+        self.assertEqual(len(executed), 6)
+        self.assertTrue(all(sql.startswith('EXECUTE rsm_statement_') for sql in executed[4:]))
+
+    def test_not_prepared_by_default(self):
+        self.database_api.prepare_statements = False
+        for _ in range(3):
+            self.database_api.execute('SELECT * FROM t WHERE id = %s', params=(1, ))
+        self.assertEqual(self.get_executed(), ['SELECT * FROM t WHERE id = %s'] * 3)
+
+    def test_tuple_param_is_not_prepared(self):
+        for _ in range(3):
+            self.database_api.execute('SELECT * FROM t WHERE id IN %s', params=((1, 2, ), ))
+        self.assertEqual(self.get_executed(), ['SELECT * FROM t WHERE id IN %s'] * 3)
+
+    def test_failed_prepare_falls_back(self):
+        def execute(sql, params=None):
+            if sql.startswith('PREPARE'):
+                raise Exception('could not determine data type of parameter $1')
+        self.cursor.execute.side_effect = execute
+        for _ in range(3):
+            self.database_api.execute('SELECT %s', params=(None, ))
+        executed = self.get_executed()
+        self.assertEqual(executed[:2], ['SELECT %s', 'SAVEPOINT rsm_prepare'])
+        self.assertEqual(executed[3:], ['ROLLBACK TO SAVEPOINT rsm_prepare', 'SELECT %s', 'SELECT %s'])
+
+    def test_ddl_deallocates_statements(self):
+        for _ in range(2):
+            self.database_api.execute('SELECT * FROM t WHERE id = %s', params=(1, ))
+        self.database_api.execute('ALTER TABLE t ADD COLUMN a INTEGER')
+        self.assertEqual(self.get_executed()[-2:], ['DEALLOCATE ALL', 'ALTER TABLE t ADD COLUMN a INTEGER'])
+        self.assertEqual(self.database_api.get_statement_cache_stats()['size'], 0)